@@ -0,0 +1,94 @@
+# src/batch_predict.py
+"""
+Batch scorer for large patient files.
+
+Reads a CSV or columnar dataset in bounded-size chunks, scores every chunk
+with the saved pipeline and streams the results to the output file, so
+memory stays flat regardless of input size.
+
+    python src/batch_predict.py data/patients.parquet predictions.parquet --jobs 4
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from dataset_io import ROW_GROUP_SIZE, iter_dataset, write_dataset
+from inference import score_frame
+from model_registry import current_artifact_path, load_artifact
+from utils import bounded_parallel_map
+
+
+def _score_task(task):
+    pipeline_path, chunk, proba_classes, apply_override, explain_top = task
+    # cached per worker process, so each worker loads the artifact once
+    pipeline = load_artifact(pipeline_path)
+    scored = score_frame(pipeline, chunk, proba_classes, apply_override)
+    if explain_top:
+        from explain import explainer_for
+
+        scored = pd.concat([scored, explainer_for(pipeline).explain_frame(chunk, explain_top)], axis=1)
+    return scored
+
+
+def score_file(input_path, output_path, pipeline_path=None, chunk_size=ROW_GROUP_SIZE,
+               n_jobs=1, proba_classes=None, apply_override=True, explain_top=0):
+    """
+    Score `input_path` chunk by chunk into `output_path`. Returns (rows, seconds).
+
+    explain_top > 0 adds the top SHAP reasons for each row's model prediction
+    (tree models only, see explain.explainable: raises ValueError for other models).
+    """
+    start = time.perf_counter()
+    pipeline_path = pipeline_path or current_artifact_path()
+    if explain_top:
+        from explain import MAX_TABLE_FEATURES, explainable
+
+        pipeline = load_artifact(pipeline_path)
+        if not explainable(pipeline):
+            raise ValueError(f"--explain can't explain {pipeline['model_name']}: it needs a tree model "
+                             f"(gradient boosting up to depth {MAX_TABLE_FEATURES})")
+    tasks = (
+        (pipeline_path, chunk, proba_classes, apply_override, explain_top)
+        for chunk in iter_dataset(input_path, batch_size=chunk_size)
+    )
+    rows = write_dataset(bounded_parallel_map(_score_task, tasks, n_jobs), output_path,
+                         row_group_size=chunk_size)
+    return rows, time.perf_counter() - start
+
+
+def parse_proba(value):
+    """'all' -> every class, 'none' -> no probability columns, else a comma list."""
+    if value == "all":
+        return None
+    if value == "none":
+        return []
+    return [cls.strip() for cls in value.split(",") if cls.strip()]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Score a patient file with the saved model.")
+    parser.add_argument("input", help="CSV or columnar (.parquet) patient file")
+    parser.add_argument("output", help="output path (.csv or .parquet)")
+    parser.add_argument("--model", default=None,
+                        help="pipeline artifact (default: current model from models/manifest.json)")
+    parser.add_argument("--chunk-size", type=int, default=ROW_GROUP_SIZE, help="rows per chunk")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes")
+    parser.add_argument("--proba", type=parse_proba, default=None,
+                        help="probability columns: 'all' (default), 'none' or e.g. 'Flu,Anemia'")
+    parser.add_argument("--no-override", action="store_true",
+                        help="don't apply the Healthy rule override")
+    parser.add_argument("--explain", type=int, default=0, metavar="K",
+                        help="add the top K SHAP reasons (Reason_1..K) for each prediction")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        rows, seconds = score_file(args.input, args.output, args.model, args.chunk_size, args.jobs,
+                                   args.proba, not args.no_override, args.explain)
+    except ValueError as exc:
+        raise SystemExit(f"❌ {exc}")
+    print(f"✅ Scored {rows} rows in {seconds:.2f}s ({rows / max(seconds, 1e-9):,.0f} rows/sec)")
+    print(f"   Predictions saved to '{args.output}'")
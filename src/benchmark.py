@@ -0,0 +1,395 @@
+# src/benchmark.py
+"""
+Offline benchmark suite: generation, preprocessing, training, inference, ensemble
+serving and plotting.
+
+Every (stage, size, model) case runs in a fresh interpreter on synthetic
+data, so timings include no warm caches from other cases and the reported
+peak RSS belongs to that case alone. Results are written as JSON; `compare`
+diffs two result files and exits 1 when a timing, latency or memory figure
+regressed by more than --threshold. The ensemble stage soft-votes every
+benchmarked model (parallel, serial, and with the fast path) and is read
+against the per-model inference results.
+
+    python src/benchmark.py run --sizes 1k,100k,1M --output benchmarks/current.json
+    python src/benchmark.py run --sizes 10M --stages generate,preprocess
+    python src/benchmark.py run --sizes 100k --stages inference,ensemble --models "Naive Bayes,Random Forest"
+    python src/benchmark.py compare benchmarks/baseline.json benchmarks/current.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STAGES = ["generate", "preprocess", "train", "inference", "ensemble", "plot"]
+DEFAULT_SIZES = "1k,10k,100k"
+# Training rows per model are capped; kernel SVM fitting is quadratic in rows
+TRAIN_ROW_CAP = 200_000
+MODEL_TRAIN_ROW_CAP = {"Support Vector Machine": 10_000}
+BATCH_ROWS = 1_000_000
+LATENCY_CALLS = 200
+PLOT_MODEL = "Random Forest"
+# Preferred fast-path member of the ensemble stage, and its confidence threshold
+FAST_MODEL = "Naive Bayes"
+FAST_THRESHOLD = 0.9
+PLOT_DPI = 100
+
+DEFAULT_THRESHOLD = 0.15
+# Differences below these floors are noise, whatever the ratio
+NOISE_FLOOR = {"_s": 0.01, "_ms": 0.05, "_mb": 10.0, "_per_s": 0.0}
+
+
+def parse_size(text):
+    """'1k' -> 1000, '10M' -> 10000000."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([kKmM]?)", text.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"bad size {text!r}; use e.g. 1000, 10k or 1M")
+    number, unit = match.groups()
+    return int(float(number) * {"": 1, "k": 1_000, "m": 1_000_000}[unit.lower()])
+
+
+def _slug(name):
+    return name.lower().replace(" ", "_")
+
+
+def _best_of(fn, repeat):
+    """(result of the last call, best wall time over `repeat` calls)."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+# ===============================
+# Stages (each runs in its own process)
+# ===============================
+def bench_generate(workdir, rows, repeat, model=None):
+    from data_generation import generate_patient_data
+    from dataset_io import write_dataset
+
+    df, seconds = _best_of(lambda: generate_patient_data(rows), repeat)
+    start = time.perf_counter()
+    write_dataset(df, os.path.join(workdir, "data.parquet"))
+    return {"generate_s": seconds, "write_s": time.perf_counter() - start,
+            "rows_per_s": rows / seconds}
+
+
+def bench_preprocess(workdir, rows, repeat, model=None):
+    from dataset_io import read_dataset
+    from preprocessing import FEATURE_COLUMNS, Preprocessor
+    from utils import apply_encoders, encode_categoricals
+
+    path = os.path.join(workdir, "data.parquet")
+    df, read_s = _best_of(lambda: read_dataset(path), repeat)
+    preprocessor, fit_s = _best_of(lambda: Preprocessor().fit(df), repeat)
+    _, transform_s = _best_of(lambda: preprocessor.transform(df), repeat)
+    # legacy per-column LabelEncoder path kept in utils
+    features = df[FEATURE_COLUMNS]
+    _, encoders = encode_categoricals(features.copy(), exclude_cols=[])
+    _, apply_s = _best_of(lambda: apply_encoders(features.copy(), encoders), repeat)
+    return {"read_s": read_s, "fit_s": fit_s, "transform_s": transform_s,
+            "apply_encoders_s": apply_s, "transform_rows_per_s": rows / transform_s}
+
+
+def bench_train(workdir, rows, repeat, model):
+    from dataset_io import read_dataset
+    from model_training import NATIVE_MISSING, models
+    from preprocessing import TARGET_COLUMN, Preprocessor, save_pipeline
+
+    df = read_dataset(os.path.join(workdir, "data.parquet"))
+    train_rows = min(rows, MODEL_TRAIN_ROW_CAP.get(model, TRAIN_ROW_CAP))
+    preprocessor = Preprocessor().fit(df)
+    # generated rows are i.i.d., so the head is a uniform sample
+    head = df.iloc[:train_rows]
+    X = preprocessor.transform(head, impute=model not in NATIVE_MISSING)
+    y = preprocessor.encode_target(head[TARGET_COLUMN])
+    fitted, fit_s = _best_of(lambda: models[model]().fit(X, y), repeat)
+    os.makedirs(os.path.join(workdir, "models"), exist_ok=True)
+    save_pipeline(fitted, preprocessor, model, os.path.join(workdir, "models", _slug(model) + ".pkl"),
+                  impute=model not in NATIVE_MISSING)
+    return {"train_rows": train_rows, "fit_s": fit_s, "fit_rows_per_s": train_rows / fit_s}
+
+
+def _serving_metrics(pipeline, df, repeat):
+    """Batch throughput and single-row latency of predict_proba."""
+    import pandas as pd
+
+    from inference import predict_proba
+
+    batch = df.iloc[:BATCH_ROWS]
+    # warm-up call: first-call imports and allocations are not throughput
+    predict_proba(pipeline, batch.iloc[:100])
+    _, batch_s = _best_of(lambda: predict_proba(pipeline, batch), repeat)
+
+    # single-row requests the way the app builds them: a dict per patient
+    records = df.iloc[:LATENCY_CALLS].astype(object).where(df.iloc[:LATENCY_CALLS].notna(), None)
+    records = records.to_dict("records")
+    latencies = []
+    for record in records * repeat:
+        start = time.perf_counter()
+        predict_proba(pipeline, pd.DataFrame([record]))
+        latencies.append(time.perf_counter() - start)
+    ms = np.array(latencies) * 1000
+    return {"batch_rows": len(batch), "batch_s": batch_s, "batch_rows_per_s": len(batch) / batch_s,
+            "single_p50_ms": float(np.percentile(ms, 50)), "single_p99_ms": float(np.percentile(ms, 99))}
+
+
+def bench_inference(workdir, rows, repeat, model):
+    from dataset_io import read_dataset
+    from preprocessing import FEATURE_COLUMNS, load_pipeline
+
+    pipeline = load_pipeline(os.path.join(workdir, "models", _slug(model) + ".pkl"))
+    df = read_dataset(os.path.join(workdir, "data.parquet"), columns=FEATURE_COLUMNS)
+    return _serving_metrics(pipeline, df, repeat)
+
+
+def bench_ensemble(workdir, rows, repeat, model):
+    """`model` lists the members, comma-separated; metrics are prefixed by variant."""
+    from dataset_io import read_dataset
+    from ensemble import ensemble_pipeline
+    from preprocessing import FEATURE_COLUMNS, load_pipeline
+
+    names = model.split(",")
+    members = [load_pipeline(os.path.join(workdir, "models", _slug(name) + ".pkl")) for name in names]
+    df = read_dataset(os.path.join(workdir, "data.parquet"), columns=FEATURE_COLUMNS)
+    fast_model = FAST_MODEL if FAST_MODEL in names else names[0]
+    variants = {
+        "parallel": {},
+        "serial": {"n_threads": 1},
+        "fast": {"fast_model": fast_model, "fast_threshold": FAST_THRESHOLD},
+    }
+    result = {"members": len(names)}
+    for variant, options in variants.items():
+        pipeline = ensemble_pipeline(members, **options)
+        for metric, value in _serving_metrics(pipeline, df, repeat).items():
+            result[f"{variant}_{metric}"] = value
+        if variant == "fast":
+            stats = pipeline["model"].stats()
+            result["fast_path_rate"] = stats["fast_path_rate"]
+    return result
+
+
+def bench_plot(workdir, rows, repeat, model):
+    from preprocessing import load_pipeline
+    import visualization as viz
+
+    pipeline = load_pipeline(os.path.join(workdir, "models", _slug(model) + ".pkl"))
+    path = os.path.join(workdir, "data.parquet")
+    (cm, histograms, sample), evaluate_s = _best_of(lambda: viz.evaluate(pipeline, path), repeat)
+    classes = list(pipeline["preprocessor"].classes_)
+    distributions = {
+        col: (hist.edges, hist.counts, viz.kde_curve(sample[col].to_numpy(dtype=np.float64, na_value=np.nan), hist))
+        for col, hist in histograms.items()
+    }
+
+    def render():
+        viz.render_confusion_matrix(cm, classes, os.path.join(workdir, "confusion_matrix.png"), PLOT_DPI)
+        viz.render_distributions(distributions, os.path.join(workdir, "feature_distributions.png"), PLOT_DPI)
+
+    _, render_s = _best_of(render, repeat)
+    return {"evaluate_s": evaluate_s, "render_s": render_s}
+
+
+STAGE_FUNCTIONS = {
+    "generate": bench_generate,
+    "preprocess": bench_preprocess,
+    "train": bench_train,
+    "inference": bench_inference,
+    "ensemble": bench_ensemble,
+    "plot": bench_plot,
+}
+
+
+# ===============================
+# Runner
+# ===============================
+def _run_case(stage, workdir, rows, repeat, model=None):
+    """Run one case in a fresh interpreter; returns its result dict (with peak RSS)."""
+    cmd = [sys.executable, os.path.abspath(__file__), "stage", stage, "--workdir", workdir,
+           "--rows", str(rows), "--repeat", str(repeat)]
+    if model:
+        cmd += ["--model", model]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    result = {"stage": stage, "rows": rows, "model": model, "wall_s": time.perf_counter() - start}
+    if proc.returncode:
+        result["error"] = (proc.stderr.strip().splitlines() or ["unknown error"])[-1]
+        return result
+    result.update(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return result
+
+
+def _environment():
+    import sklearn
+
+    try:
+        commit = subprocess.run(["git", "-C", SRC_DIR, "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_suite(sizes, stages=STAGES, names=None, repeat=1, workdir=None):
+    """Benchmark every stage at every size; returns {"environment", "results"}."""
+    from model_training import models
+
+    names = names or list(models)
+    plot_model = PLOT_MODEL if PLOT_MODEL in names else names[0]
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for rows in sizes:
+            case_dir = os.path.join(tmp, f"rows_{rows}")
+            os.makedirs(case_dir)
+            # later stages need the dataset and fitted models of the earlier ones
+            needed = set(stages)
+            if needed & {"preprocess", "train", "inference", "ensemble", "plot"}:
+                needed.add("generate")
+            if needed & {"inference", "ensemble", "plot"}:
+                needed.add("train")
+            for stage in STAGES:
+                if stage not in needed:
+                    continue
+                if stage in ("train", "inference"):
+                    cases = names
+                elif stage == "plot":
+                    cases = [plot_model]
+                elif stage == "ensemble":
+                    cases = [",".join(names)] if len(names) > 1 else []
+                else:
+                    cases = [None]
+                for model in cases:
+                    result = _run_case(stage, case_dir, rows, repeat, model)
+                    status = result.get("error") or f"{result['wall_s']:.1f}s, {result.get('peak_rss_mb', 0):.0f} MB"
+                    print(f"  {stage:<10} {rows:>10,} {model or '':<24} {status}", flush=True)
+                    if stage in stages:
+                        results.append(result)
+    return {"environment": _environment(), "results": results}
+
+
+# ===============================
+# Comparison
+# ===============================
+def _direction(metric):
+    """+1 if higher is better, -1 if lower is better, 0 if informational."""
+    if metric.endswith("_per_s"):
+        return 1
+    if metric == "wall_s" or not metric.endswith(("_s", "_ms", "_mb")):
+        return 0
+    return -1
+
+
+def _floor(metric):
+    return next(value for suffix, value in NOISE_FLOOR.items() if metric.endswith(suffix))
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Rows of (stage, rows, model, metric, baseline, current, relative change, regressed)
+    for every timing/throughput/memory metric present in both result sets.
+    """
+    def index(report):
+        return {(r["stage"], r["rows"], r["model"]): r for r in report["results"] if "error" not in r}
+
+    old, new = index(baseline), index(current)
+    rows = []
+    for key in sorted(old.keys() & new.keys(), key=lambda k: (STAGES.index(k[0]), k[1], k[2] or "")):
+        for metric, before in old[key].items():
+            direction = _direction(metric)
+            after = new[key].get(metric)
+            if not direction or after is None or not before:
+                continue
+            change = (after - before) / before
+            worse = -direction * change > threshold and abs(after - before) > _floor(metric)
+            rows.append((*key, metric, before, after, change, worse))
+    return rows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite on synthetic data.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run the suite and write JSON results")
+    run.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated row counts, e.g. 1k,100k,10M")
+    run.add_argument("--stages", default=",".join(STAGES), help=f"subset of {','.join(STAGES)}")
+    run.add_argument("--models", default=None, help="comma-separated candidates (default: all)")
+    run.add_argument("--repeat", type=int, default=1, help="timed repetitions per case (best is kept)")
+    run.add_argument("--output", default="benchmarks/results.json")
+    run.add_argument("--workdir", default=None, help="scratch directory for datasets and models")
+
+    cmp = sub.add_parser("compare", help="flag regressions of CURRENT against BASELINE")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                     help="relative change counted as a regression")
+
+    stage = sub.add_parser("stage", help=argparse.SUPPRESS)
+    stage.add_argument("name", choices=STAGES)
+    stage.add_argument("--workdir", required=True)
+    stage.add_argument("--rows", type=int, required=True)
+    stage.add_argument("--repeat", type=int, default=1)
+    stage.add_argument("--model", default=None)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.command == "stage":
+        import warnings
+
+        warnings.filterwarnings("ignore")
+        result = STAGE_FUNCTIONS[args.name](args.workdir, args.rows, args.repeat, args.model)
+        result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(json.dumps({k: round(v, 6) if isinstance(v, float) else v for k, v in result.items()}))
+
+    elif args.command == "run":
+        sizes = [parse_size(size) for size in args.sizes.split(",")]
+        stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            raise SystemExit(f"Unknown stages: {sorted(unknown)}; choose from {STAGES}")
+        names = [name.strip() for name in args.models.split(",")] if args.models else None
+        report = run_suite(sizes, stages, names, args.repeat, args.workdir)
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        failed = [r for r in report["results"] if "error" in r]
+        print(f"✅ {len(report['results']) - len(failed)} cases saved to {args.output}"
+              + (f" (❌ {len(failed)} failed)" if failed else ""))
+
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        rows = compare(baseline, current, args.threshold)
+        regressions = [row for row in rows if row[-1]]
+        for stage, n, model, metric, before, after, change, worse in rows:
+            flag = "❌" if worse else "  "
+            print(f"{flag} {stage:<10} {n:>10,} {model or '':<24} {metric:<22} "
+                  f"{before:>12.4f} -> {after:>12.4f} ({change:+.1%})")
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressions beyond {args.threshold:.0%}")
+            sys.exit(1)
+        print(f"\n✅ No regressions beyond {args.threshold:.0%} ({len(rows)} metrics compared)")
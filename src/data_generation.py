@@ -1,73 +1,139 @@
+import argparse
+
 import pandas as pd
 import numpy as np
-import random
 
-# Set seed for reproducibility
-np.random.seed(42)
+from dataset_io import DATA_PATH, ROW_GROUP_SIZE, write_dataset
+from rules import LABELS
+from utils import bounded_parallel_map
+
+# Seed for reproducibility
+SEED = 42
 
 # Number of samples
 n = 2000
 
+# Rows per generated block; each block draws from its own seeded RNG stream
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+MISSING_FRACTION = 0.02
+MISSING_COLS = ["Body_Temperature", "Heart_Rate", "WBC_Count", "Sugar_Level"]
+
+
+GENDERS = ["Male", "Female", "Other"]
+SYMPTOM_LEVELS = ["None", "Mild", "Severe"]
+FATIGUE_LEVELS = ["None", "Moderate", "High"]
+BLOOD_PRESSURE_LEVELS = ["Normal", "High", "Low"]
+DISEASES = LABELS.labels
+
+
+# Marginal distribution of every generated feature, in draw order:
+#   ("int", low, high)               uniform integers in [low, high)
+#   ("normal", mean, sd, decimals)   normal rounded to `decimals` (None: truncated to int)
+#   ("choice", levels, p)            categorical
+FEATURE_DISTRIBUTIONS = {
+    "Age": ("int", 18, 85),
+    "Gender": ("choice", GENDERS, [0.47, 0.47, 0.06]),
+    "Body_Temperature": ("normal", 37.0, 0.8, 1),
+    "Cough": ("choice", SYMPTOM_LEVELS, [0.5, 0.3, 0.2]),
+    "Headache": ("choice", SYMPTOM_LEVELS, [0.4, 0.4, 0.2]),
+    "Fatigue": ("choice", FATIGUE_LEVELS, [0.3, 0.4, 0.3]),
+    "Blood_Pressure": ("choice", BLOOD_PRESSURE_LEVELS, [0.6, 0.25, 0.15]),
+    "Heart_Rate": ("int", 55, 140),
+    "WBC_Count": ("normal", 7000, 1500, None),
+    "Sugar_Level": ("normal", 110, 30, 1),
+}
+
+
+def _chunk_rng(seed, chunk_index):
+    """Independent RNG stream for one block, derived from (seed, block index)."""
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk_index,)))
+
+
+def _choice(rng, levels, size, p):
+    """Draw categorical levels as a pandas Categorical (no per-row Python strings)."""
+    return pd.Categorical.from_codes(rng.choice(len(levels), size, p=p), categories=levels)
+
+
+def draw_feature(rng, distribution, size):
+    """`size` draws from one FEATURE_DISTRIBUTIONS entry."""
+    kind = distribution[0]
+    if kind == "int":
+        return rng.integers(distribution[1], distribution[2], size)
+    if kind == "choice":
+        return _choice(rng, distribution[1], size, p=distribution[2])
+    values = rng.normal(distribution[1], distribution[2], size)
+    return values.astype(int) if distribution[3] is None else np.round(values, distribution[3])
+
+
+def patient_frame(features, disease_codes, rng, start_id=1):
+    """Assemble drawn features and labels into a cohort frame, blanking MISSING_FRACTION of the vitals."""
+    size = len(disease_codes)
+    # Add some missing values randomly (the same sampled rows for every vital)
+    missing = rng.choice(size, int(round(MISSING_FRACTION * size)), replace=False)
+    columns = {"Patient_ID": np.arange(start_id, start_id + size), **features}
+    for col in MISSING_COLS:
+        columns[col] = columns[col].astype(float)
+        columns[col][missing] = np.nan
+    columns["Disease"] = pd.Categorical.from_codes(disease_codes, categories=DISEASES)
+    return pd.DataFrame(columns)
+
+
+def generate_chunk(size, seed=SEED, chunk_index=0, start_id=1, distributions=FEATURE_DISTRIBUTIONS):
+    """Generate one block of `size` synthetic patients."""
+    rng = _chunk_rng(seed, chunk_index)
+    features = {col: draw_feature(rng, distribution, size) for col, distribution in distributions.items()}
+    return patient_frame(features, LABELS.first_match(features), rng, start_id)
+
+
+def _chunk_specs(n, chunk_size, seed):
+    for chunk_index, start in enumerate(range(0, n, chunk_size)):
+        yield min(chunk_size, n - start), seed, chunk_index, start + 1
+
+
+def _generate_spec(spec):
+    return generate_chunk(*spec)
+
+
+def iter_patient_chunks(n=2000, chunk_size=DEFAULT_CHUNK_SIZE, seed=SEED, n_jobs=1):
+    """Yield the cohort as consecutive DataFrame blocks of `chunk_size` rows.
+
+    Output depends only on (n, chunk_size, seed); `n_jobs` > 1 spreads the
+    blocks over a process pool but yields them in the same order.
+    """
+    yield from bounded_parallel_map(_generate_spec, _chunk_specs(n, chunk_size, seed), n_jobs)
+
+
 # Generate synthetic patient data
-def generate_patient_data(n=2000):
-    ages = np.random.randint(18, 85, n)
-    genders = np.random.choice(["Male", "Female", "Other"], n, p=[0.47, 0.47, 0.06])
-    body_temp = np.round(np.random.normal(37.0, 0.8, n), 1)
-    cough = np.random.choice(["None", "Mild", "Severe"], n, p=[0.5, 0.3, 0.2])
-    headache = np.random.choice(["None", "Mild", "Severe"], n, p=[0.4, 0.4, 0.2])
-    fatigue = np.random.choice(["None", "Moderate", "High"], n, p=[0.3, 0.4, 0.3])
-    blood_pressure = np.random.choice(["Normal", "High", "Low"], n, p=[0.6, 0.25, 0.15])
-    heart_rate = np.random.randint(55, 140, n)
-    wbc_count = np.random.normal(7000, 1500, n).astype(int)
-    sugar_level = np.round(np.random.normal(110, 30, n), 1)
-
-    # Map symptoms to diseases (simplified synthetic logic)
-    diseases = []
-    for i in range(n):
-        if body_temp[i] > 38 and cough[i] == "Severe":
-            diseases.append("Pneumonia")
-        elif sugar_level[i] > 150:
-            diseases.append("Diabetes")
-        elif blood_pressure[i] == "High" and heart_rate[i] > 100:
-            diseases.append("Hypertension")
-        elif fatigue[i] == "High" and wbc_count[i] < 5000:
-            diseases.append("Anemia")
-        elif headache[i] == "Severe" and fatigue[i] == "None":
-            diseases.append("Migraine")
-        elif all([
-            36 <= body_temp[i] <= 37.5,
-            cough[i] == "None",
-            fatigue[i] == "None"
-        ]):
-            diseases.append("Healthy")
-        else:
-            diseases.append("Flu")
-
-    # Combine into DataFrame
-    df = pd.DataFrame({
-        "Patient_ID": np.arange(1, n+1),
-        "Age": ages,
-        "Gender": genders,
-        "Body_Temperature": body_temp,
-        "Cough": cough,
-        "Headache": headache,
-        "Fatigue": fatigue,
-        "Blood_Pressure": blood_pressure,
-        "Heart_Rate": heart_rate,
-        "WBC_Count": wbc_count,
-        "Sugar_Level": sugar_level,
-        "Disease": diseases
-    })
-
-    # Add some missing values randomly
-    for col in ["Body_Temperature", "Heart_Rate", "WBC_Count", "Sugar_Level"]:
-        df.loc[df.sample(frac=0.02, random_state=42).index, col] = np.nan
-
-    return df
+def generate_patient_data(n=2000, seed=SEED, chunk_size=DEFAULT_CHUNK_SIZE, n_jobs=1):
+    return pd.concat(list(iter_patient_chunks(n, chunk_size, seed, n_jobs)), ignore_index=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate the synthetic patient dataset.")
+    parser.add_argument("--rows", type=int, default=n, help="number of patients")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="rows per generated block")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes")
+    parser.add_argument("--output", default=DATA_PATH,
+                        help="columnar dataset path, or a .csv path to export CSV")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    df = generate_patient_data(n)
-    df.to_csv("data/patient_symptoms_dataset.csv", index=False)
-    print("✅ Synthetic patient dataset generated and saved to 'data/patient_symptoms_dataset.csv'")
-    print(df.head())
+    args = parse_args()
+
+    head = []
+
+    def keep_head(chunks):
+        for chunk in chunks:
+            if not head:
+                head.append(chunk.head())
+            yield chunk
+
+    chunks = iter_patient_chunks(args.rows, args.chunk_size, args.seed, args.jobs)
+    write_dataset(keep_head(chunks), args.output, row_group_size=min(args.chunk_size, ROW_GROUP_SIZE))
+
+    print(f"✅ Synthetic patient dataset generated and saved to '{args.output}'")
+    print(head[0])
@@ -0,0 +1,215 @@
+# src/dataset_io.py
+"""
+Dataset I/O: a columnar, compressed on-disk format for the patient dataset.
+
+Datasets are stored as Parquet files split into row groups. Categorical
+columns are dictionary-encoded with a fixed category order and numerics use
+compact dtypes, so loading skips string parsing and dtype inference. CSV is
+kept as an import/export path.
+
+A dataset may also be a directory of Parquet part files (e.g. the shards
+written by scenarios.py); readers treat the parts, in name order, as one
+dataset.
+"""
+import argparse
+import glob
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from schema import enforce
+
+DATA_PATH = "data/patient_symptoms_dataset.parquet"
+CSV_PATH = "data/patient_symptoms_dataset.csv"
+
+ROW_GROUP_SIZE = 250_000
+COMPRESSION = "zstd"
+
+# Arrow -> pandas mapping so nullable integers don't come back as float64
+_PANDAS_TYPES = {
+    pa.int16(): pd.Int16Dtype(),
+}
+
+
+def _is_csv(path):
+    return str(path).lower().endswith(".csv")
+
+
+def _parts(path):
+    """Parquet files making up a dataset: the file itself, or a directory's parts in name order."""
+    if not os.path.isdir(path):
+        return [path]
+    parts = sorted(glob.glob(os.path.join(path, "*.parquet")))
+    if not parts:
+        raise FileNotFoundError(f"no .parquet files in {path}")
+    return parts
+
+
+def to_storage_dtypes(df):
+    """Cast a DataFrame's known columns to their compact storage dtypes (see schema.py)."""
+    # shallow copy: casting replaces columns without touching the caller's frame
+    return enforce(df.copy(deep=False))
+
+
+def _to_table(df, schema=None):
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def write_dataset(data, path=DATA_PATH, row_group_size=ROW_GROUP_SIZE, compression=COMPRESSION):
+    """
+    Write a DataFrame, or an iterable of DataFrame chunks, to `path`.
+
+    Chunks are streamed straight into the file so a cohort never has to be
+    held in memory at once. A `.csv` path writes plain CSV instead.
+    Returns the number of rows written.
+    """
+    chunks = [data] if isinstance(data, pd.DataFrame) else data
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    rows = 0
+    writer = None
+    try:
+        for i, chunk in enumerate(chunks):
+            if _is_csv(path):
+                chunk.to_csv(path, index=False, mode="w" if i == 0 else "a", header=i == 0)
+            else:
+                chunk = to_storage_dtypes(chunk)
+                if writer is None:
+                    table = _to_table(chunk)
+                    writer = pq.ParquetWriter(path, table.schema, compression=compression)
+                else:
+                    table = _to_table(chunk, writer.schema)
+                writer.write_table(table, row_group_size=row_group_size)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def read_csv(path=CSV_PATH, columns=None, chunksize=None):
+    """
+    Read the CSV form of the dataset into storage dtypes.
+
+    Only empty fields count as missing: pandas would otherwise turn the
+    symptom level "None" into NaN.
+    """
+    reader = pd.read_csv(path, usecols=columns, keep_default_na=False, na_values=[""],
+                         chunksize=chunksize)
+    if chunksize is None:
+        return to_storage_dtypes(reader)
+    return (to_storage_dtypes(chunk) for chunk in reader)
+
+
+def read_dataset(path=DATA_PATH, columns=None, row_groups=None):
+    """Load a dataset, optionally restricted to some columns and/or row groups."""
+    if _is_csv(path):
+        if row_groups is not None:
+            raise ValueError("row_groups is only supported for columnar datasets")
+        return read_csv(path, columns)
+
+    tables = []
+    wanted = None if row_groups is None else sorted(row_groups)
+    offset = 0
+    for part in _parts(path):
+        parquet_file = pq.ParquetFile(part)
+        n_groups = parquet_file.metadata.num_row_groups
+        if wanted is None:
+            tables.append(parquet_file.read(columns=columns))
+        else:
+            # row-group indices run across the parts of a directory dataset
+            local = [i - offset for i in wanted if offset <= i < offset + n_groups]
+            if local:
+                tables.append(parquet_file.read_row_groups(local, columns=columns))
+        offset += n_groups
+    if not tables:
+        raise IndexError(f"row groups {wanted} out of range ({offset} row groups)")
+    table = tables[0] if len(tables) == 1 else pa.concat_tables(tables)
+    # free Arrow buffers column by column as they are converted
+    return table.to_pandas(types_mapper=_PANDAS_TYPES.get, split_blocks=True, self_destruct=True)
+
+
+def iter_dataset(path=DATA_PATH, columns=None, batch_size=ROW_GROUP_SIZE):
+    """Yield a dataset as DataFrame chunks of at most `batch_size` rows."""
+    if _is_csv(path):
+        yield from read_csv(path, columns, chunksize=batch_size)
+        return
+
+    for part in _parts(path):
+        parquet_file = pq.ParquetFile(part)
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            yield batch.to_pandas(types_mapper=_PANDAS_TYPES.get)
+
+
+def dataset_info(path=DATA_PATH):
+    """Row count, row-group count and column names of a columnar dataset."""
+    metadata = [pq.ParquetFile(part).metadata for part in _parts(path)]
+    return {
+        "rows": sum(m.num_rows for m in metadata),
+        "row_groups": sum(m.num_row_groups for m in metadata),
+        "columns": metadata[0].schema.names,
+    }
+
+
+def column_ranges(path, columns):
+    """
+    {column: (min, max)} from the row-group statistics of a columnar dataset,
+    without reading any data. None for CSV files or missing statistics.
+    """
+    if _is_csv(path):
+        return None
+    metadata = [pq.ParquetFile(part).metadata for part in _parts(path)]
+    ranges = {}
+    for col in columns:
+        lows, highs = [], []
+        for part in metadata:
+            index = part.schema.names.index(col)
+            for i in range(part.num_row_groups):
+                stats = part.row_group(i).column(index).statistics
+                if stats is None or not stats.has_min_max:
+                    return None
+                lows.append(stats.min)
+                highs.append(stats.max)
+        ranges[col] = (min(lows), max(highs)) if lows else None
+    return ranges
+
+
+def import_csv(csv_path=CSV_PATH, path=DATA_PATH, chunksize=ROW_GROUP_SIZE):
+    """Convert a CSV dataset to the columnar format, chunk by chunk."""
+    return write_dataset(read_csv(csv_path, chunksize=chunksize), path)
+
+
+def export_csv(path=DATA_PATH, csv_path=CSV_PATH, chunksize=ROW_GROUP_SIZE):
+    """Export a columnar dataset to CSV, chunk by chunk."""
+    return write_dataset(iter_dataset(path, batch_size=chunksize), csv_path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert the patient dataset between CSV and columnar form.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    imp = sub.add_parser("import", help="CSV -> columnar")
+    imp.add_argument("csv_path", nargs="?", default=CSV_PATH)
+    imp.add_argument("path", nargs="?", default=DATA_PATH)
+
+    exp = sub.add_parser("export", help="columnar -> CSV")
+    exp.add_argument("path", nargs="?", default=DATA_PATH)
+    exp.add_argument("csv_path", nargs="?", default=CSV_PATH)
+
+    info = sub.add_parser("info", help="show row/row-group counts")
+    info.add_argument("path", nargs="?", default=DATA_PATH)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "import":
+        rows = import_csv(args.csv_path, args.path)
+        print(f"✅ Imported {rows} rows from '{args.csv_path}' into '{args.path}'")
+    elif args.command == "export":
+        rows = export_csv(args.path, args.csv_path)
+        print(f"✅ Exported {rows} rows from '{args.path}' to '{args.csv_path}'")
+    else:
+        print(dataset_info(args.path))
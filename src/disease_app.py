@@ -1,27 +1,64 @@
 from ui_components import DiseaseUI
 import streamlit as st
-import joblib
-import numpy as np
-import pandas as pd
+import os
+
 DiseaseUI.apply_modern_theme()
 
-# Load trained model and encoders
-import os
+st.title("🩺 Patient Disease Prediction App")
+st.markdown("This AI tool predicts possible diseases based on patient symptoms and vitals.")
+
+# Heavy imports and the model load happen after the header has rendered
+import pandas as pd
+
+from drift import default_monitor
+from inference import predict_proba
+from instrumentation import METRICS, REQUEST_STAGE, configure_from_env
+from model_registry import load_current, load_flat_current
+from prediction_cache import default_cache
+from rules import HEALTHY
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 MODEL_DIR = os.path.join(BASE_DIR, "models")
 
-model = joblib.load(os.path.join(MODEL_DIR, "Random Forest_model.pkl"))
-encoders = joblib.load(os.path.join(MODEL_DIR, "feature_encoders.pkl"))
-target_encoder = joblib.load(os.path.join(MODEL_DIR, "target_encoder.pkl"))
+# Prefer the flat numpy export (no sklearn import); fall back to the pickled pipeline.
+# Both are cached per process and reloaded only when the artifact changes; repeated
+# inputs are answered from the process-wide prediction cache (keyed per model version).
+# DISEASE_METRICS=1 times each prediction stage (see src/instrumentation.py).
+# DISEASE_ENSEMBLE=1 serves the soft-voting ensemble saved by --save-ensemble (see
+# src/ensemble.py); DISEASE_ENSEMBLE_FAST_MODEL / _FAST_THRESHOLD enable its fast path.
+configure_from_env()
+cache = default_cache()
+# Inputs are checked against the training distribution when training saved a reference profile
+monitor = default_monitor(MODEL_DIR)
+use_ensemble = os.environ.get("DISEASE_ENSEMBLE", "").lower() in ("1", "true", "yes")
+predictor = None if use_ensemble else load_flat_current(MODEL_DIR)
+if predictor is not None:
+    preprocessor = predictor.preprocessor
+    model_name = predictor.meta["model_name"]
 
+    def predict_disease(df):
+        return predictor.predict_frame(df, cache)[0]
+else:
+    if use_ensemble:
+        from ensemble import FAST_THRESHOLD, load_ensemble
 
-st.title("🩺 Patient Disease Prediction App")
-st.markdown("This AI tool predicts possible diseases based on patient symptoms and vitals.")
+        pipeline = load_ensemble(os.path.join(MODEL_DIR, "ensemble"),
+                                 os.environ.get("DISEASE_ENSEMBLE_WEIGHTS", "equal"),
+                                 os.environ.get("DISEASE_ENSEMBLE_FAST_MODEL") or None,
+                                 float(os.environ.get("DISEASE_ENSEMBLE_FAST_THRESHOLD", FAST_THRESHOLD)))
+    else:
+        pipeline = load_current(MODEL_DIR)
+    preprocessor = pipeline["preprocessor"]
+    model_name = pipeline["model_name"]
+
+    def predict_disease(df):
+        proba = predict_proba(pipeline, df, cache)
+        with METRICS.timer("decode", model_name):
+            return preprocessor.decode_target(pipeline["model"].classes_)[proba.argmax(axis=1)][0]
 
 # Input fields with sensible defaults
 age = st.number_input("Age", 1, 100, 30)
-gender = st.selectbox("Gender", encoders["Gender"].classes_)
+gender = st.selectbox("Gender", preprocessor.categories_["Gender"])
 body_temperature = st.number_input("Body Temperature (°C)", 34.0, 42.0, 36.8)
 cough = st.selectbox("Cough", ["None", "Mild", "Severe"])
 headache = st.selectbox("Headache", ["None", "Mild", "Severe"])
@@ -31,23 +68,55 @@ heart_rate = st.number_input("Heart Rate (bpm)", 40, 180, 80)
 wbc_count = st.number_input("WBC Count (x10⁹/L)", 2.0, 20.0, 7.0)
 sugar_level = st.number_input("Sugar Level (mg/dL)", 50, 300, 100)
 
-# --- Smart Healthy Rule ---
-def is_healthy():
-    return (
-        cough == "None" and
-        headache == "None" and
-        fatigue == "None" and
-        blood_pressure == "Normal" and
-        36 <= body_temperature <= 37.2 and
-        60 <= heart_rate <= 90 and
-        4 <= wbc_count <= 11 and
-        80 <= sugar_level <= 140
-    )
+# Model inputs use dataset units: WBC_Count in cells/µL
+input_data = {
+    "Age": age,
+    "Gender": gender,
+    "Body_Temperature": body_temperature,
+    "Cough": cough,
+    "Headache": headache,
+    "Fatigue": fatigue,
+    "Blood_Pressure": blood_pressure,
+    "Heart_Rate": heart_rate,
+    "WBC_Count": round(wbc_count * 1000),
+    "Sugar_Level": sugar_level
+}
+with METRICS.timer("frame", model_name):
+    patient = pd.DataFrame([input_data])
+
+# Explanations are exact tree SHAP: offered only when explain.py supports the served model.
+# The flat export only exists for tree ensembles; its header says how deep they are.
+if predictor is not None:
+    from explain import MAX_TABLE_FEATURES
+
+    can_explain = predictor.kind != "gradient_boosting" or predictor.max_depth <= MAX_TABLE_FEATURES
+else:
+    from explain import explainable
+
+    can_explain = explainable(pipeline)
+show_reasons = can_explain and st.checkbox("Explain the prediction")
+if not can_explain:
+    st.caption(f"Explanations aren't available for this {model_name} model.")
 
 # Predict button
 if st.button("🔍 Predict Disease"):
-    if is_healthy():
+    if monitor is not None:
+        for warning in monitor.observe([input_data])[0]:
+            if warning["issue"] == "unit_mismatch":
+                st.warning(f"⚠️ {warning['feature']} = {warning['value']:g} looks like it is in {warning['unit']} "
+                           f"(≈ {warning['converted']:g} in the units the model was trained on).")
+            elif warning["issue"] == "out_of_range":
+                low, high = warning["expected"]
+                st.warning(f"⚠️ {warning['feature']} = {warning['value']:g} is outside the range seen in "
+                           f"training ({low:g} to {high:g}); the prediction may be unreliable.")
+            else:
+                st.warning(f"⚠️ {warning['feature']} = {warning['value']} was never seen in training.")
+    # --- Smart Healthy Rule (shared with batch inference) ---
+    with METRICS.timer("healthy_rule", model_name):
+        healthy = HEALTHY.mask(patient)[0]
+    if healthy:
         predicted_disease = "Healthy"
+        METRICS.record_predictions(model_name, [predicted_disease], [True])
         st.markdown(
                     f"""
                     <div style="
@@ -66,23 +135,9 @@ if st.button("🔍 Predict Disease"):
                     )
 
     else:
-        # Encode categorical inputs
-        input_data = {
-            "Age": age,
-            "Gender": encoders["Gender"].transform([gender])[0],
-            "Body_Temperature": body_temperature,
-            "Cough": encoders["Cough"].transform([cough])[0] if cough in encoders["Cough"].classes_ else 0,
-            "Headache": encoders["Headache"].transform([headache])[0] if headache in encoders["Headache"].classes_ else 0,
-            "Fatigue": encoders["Fatigue"].transform([fatigue])[0] if fatigue in encoders["Fatigue"].classes_ else 0,
-            "Blood_Pressure": encoders["Blood_Pressure"].transform([blood_pressure])[0] if blood_pressure in encoders["Blood_Pressure"].classes_ else 0,
-            "Heart_Rate": heart_rate,
-            "WBC_Count": wbc_count,
-            "Sugar_Level": sugar_level
-        }
-
-        df = pd.DataFrame([input_data])
-        pred_encoded = model.predict(df)[0]
-        predicted_disease = target_encoder.inverse_transform([pred_encoded])[0]
+        with METRICS.timer(REQUEST_STAGE, model_name):
+            predicted_disease = predict_disease(patient)
+        METRICS.record_predictions(model_name, [predicted_disease], [False])
 
         st.markdown(
                     f"""
@@ -101,6 +156,18 @@ if st.button("🔍 Predict Disease"):
                     unsafe_allow_html=True  
                 )
 
+        # Per-patient reasons: exact tree SHAP on the model that made the prediction
+        # (for the flat export, its source pipeline, loaded on first use)
+        if show_reasons:
+            from explain import explainer_for
+
+            explained = load_current(MODEL_DIR) if predictor is not None else pipeline
+            contributions = explainer_for(explained).contributions(patient).head(5)
+            st.markdown("**Top factors behind this prediction** (SHAP contribution, + favours it):")
+            st.markdown("\n".join(
+                f"- {feature} = {input_data[feature]}: {value:+.2f}" for feature, value in contributions.items()
+            ))
+
 
     st.markdown(
     """
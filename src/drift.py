@@ -0,0 +1,430 @@
+# src/drift.py
+"""
+Streaming data-drift and input-quality monitor.
+
+A DriftProfile summarizes a stream of patients in constant memory: a KLL
+quantile sketch, moments, min/max and missing count per numeric feature,
+and a frequency table per categorical one. Training saves the profile of
+its dataset as models/reference_profile.json. At serving time a
+DriftMonitor profiles live traffic the same way and compares it to the
+reference:
+
+    PSI   over the reference deciles (numeric) or levels (categorical)
+    KS    largest gap between the reference and live CDFs
+
+Every incoming row is also checked against the reference: values outside
+the plausible training range, values that only make sense in another unit (WBC in
+x10^9/L, temperature in °F) and unseen category levels are flagged.
+Numeric values are buffered and folded into the sketches in blocks, so
+the cost per request is O(1) amortized and no raw rows are kept.
+
+    python src/drift.py profile data/patient_symptoms_dataset.parquet
+    python src/drift.py compare models/reference_profile.json data/new_cohort.parquet
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from preprocessing import CATEGORICAL_COLUMNS, NUMERIC_COLUMNS
+from sketches import KLLSketch
+
+REFERENCE_NAME = "reference_profile.json"
+PROFILE_VERSION = 1
+
+PSI_BINS = 10
+KS_POINTS = 200
+# Conventional PSI reading: < 0.1 stable, 0.1-0.25 moderate shift, > 0.25 drift
+PSI_WARN, PSI_DRIFT = 0.1, 0.25
+KS_DRIFT = 0.1
+# Numeric values folded into the sketches at a time
+BUFFER_ROWS = 4096
+# Batches up to this size are counted with a plain loop (pandas overhead dominates below it)
+SMALL_BATCH = 64
+# Plausible range: these reference quantiles widened by RANGE_MARGIN of their spread
+# (the synthetic cohort's raw min/max include negative WBC and sugar values).
+# The sketch's ~0.4% rank error is too coarse this far out, so the profile also
+# keeps the TAIL_SIZE lowest and highest values exactly.
+RANGE_QUANTILES = (0.0001, 0.9999)
+TAIL_SIZE = 1000
+RANGE_MARGIN = 0.1
+
+# Units a value may have been entered in, with the conversion to dataset units
+UNIT_CONVERSIONS = {
+    "WBC_Count": [("x10^9/L", lambda v: v * 1000.0)],
+    "Body_Temperature": [("°F", lambda v: (v - 32.0) / 1.8)],
+}
+
+
+# ===============================
+# Profiles
+# ===============================
+class DriftProfile:
+    """Constant-memory summary of every model feature over a stream of rows."""
+
+    def __init__(self, k=None):
+        self.sketches = {col: KLLSketch(**({"k": k} if k else {})) for col in NUMERIC_COLUMNS}
+        # per numeric column: non-missing count, sum, sum of squares, min, max
+        self.moments = {col: np.array([0.0, 0.0, 0.0, np.inf, -np.inf]) for col in NUMERIC_COLUMNS}
+        self.tails = {col: (np.empty(0), np.empty(0)) for col in NUMERIC_COLUMNS}
+        self.counts = {col: {} for col in CATEGORICAL_COLUMNS}
+        self.missing = dict.fromkeys(NUMERIC_COLUMNS + CATEGORICAL_COLUMNS, 0)
+        self.rows = 0
+
+    def update_numeric(self, col, values):
+        """Fold float64 values of one column (NaN = missing) into its sketch and moments."""
+        present = values[~np.isnan(values)]
+        self.missing[col] += len(values) - len(present)
+        if len(present):
+            self.sketches[col].update(present)
+            m = self.moments[col]
+            m[:3] += (len(present), present.sum(), np.square(present).sum())
+            m[3], m[4] = min(m[3], present.min()), max(m[4], present.max())
+            low, high = (np.concatenate([tail, present]) for tail in self.tails[col])
+            if len(low) > TAIL_SIZE:
+                low = np.partition(low, TAIL_SIZE - 1)[:TAIL_SIZE]
+                high = np.partition(high, len(high) - TAIL_SIZE)[-TAIL_SIZE:]
+            self.tails[col] = (low, high)
+
+    def extreme_quantile(self, col, q):
+        """Exact q-quantile from the kept tails, or the tail's edge (wider) past them."""
+        n = int(self.moments[col][0])
+        low, high = (np.sort(tail) for tail in self.tails[col])
+        if not n:
+            return np.nan
+        if q < 0.5:
+            return float(low[min(int(q * (n - 1)), len(low) - 1)])
+        return float(high[max(len(high) - 1 - int((1 - q) * (n - 1)), 0)])
+
+    def update_categorical(self, col, values):
+        counts = self.counts[col]
+        if len(values) <= SMALL_BATCH:
+            for value in values:
+                if _missing(value):
+                    self.missing[col] += 1
+                else:
+                    counts[str(value)] = counts.get(str(value), 0) + 1
+            return
+        values = pd.Series(values, copy=False)
+        self.missing[col] += int(values.isna().sum())
+        for level, count in values.value_counts().items():
+            counts[str(level)] = counts.get(str(level), 0) + int(count)
+
+    def update(self, df):
+        """Add a batch of raw (unencoded) patient rows."""
+        self.rows += len(df)
+        numeric, categorical = _arrays(df)
+        for col, values in numeric.items():
+            self.update_numeric(col, values)
+        for col, values in categorical.items():
+            self.update_categorical(col, values)
+        return self
+
+    def mean_std(self, col):
+        n, total, squares = self.moments[col][:3]
+        if not n:
+            return np.nan, np.nan
+        mean = total / n
+        return mean, float(np.sqrt(max(squares / n - mean ** 2, 0.0)))
+
+    def get_state(self):
+        return {
+            "version": PROFILE_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "rows": self.rows,
+            "sketches": {col: sketch.get_state() for col, sketch in self.sketches.items()},
+            "moments": {col: m.tolist() for col, m in self.moments.items()},
+            "tails": {col: [low.tolist(), high.tolist()] for col, (low, high) in self.tails.items()},
+            "counts": self.counts,
+            "missing": self.missing,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        if state.get("version") != PROFILE_VERSION:
+            raise ValueError(f"not a version {PROFILE_VERSION} drift profile")
+        profile = cls()
+        profile.rows = state["rows"]
+        profile.sketches = {col: KLLSketch.from_state(s) for col, s in state["sketches"].items()}
+        profile.moments = {col: np.array(m, dtype=np.float64) for col, m in state["moments"].items()}
+        profile.tails = {col: (np.asarray(low, dtype=np.float64), np.asarray(high, dtype=np.float64))
+                         for col, (low, high) in state["tails"].items()}
+        profile.counts = {col: dict(c) for col, c in state["counts"].items()}
+        profile.missing = dict(state["missing"])
+        return profile
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.get_state(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_state(json.load(f))
+
+
+def _missing(value):
+    return value is None or value != value
+
+
+def _arrays(df):
+    """
+    ({numeric column: float64 with NaN}, {categorical column: values}) of raw
+    patients: a DataFrame or a list of dicts (request records, no pandas overhead).
+    """
+    if isinstance(df, list):
+        numeric = {col: np.array([record.get(col) for record in df], dtype=np.float64) for col in NUMERIC_COLUMNS}
+        return numeric, {col: [record.get(col) for record in df] for col in CATEGORICAL_COLUMNS}
+    numeric = {}
+    for col in NUMERIC_COLUMNS:
+        values = df[col]
+        if values.dtype == object:
+            values = pd.to_numeric(values)
+        numeric[col] = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    categorical = {col: df[col].array if len(df) > SMALL_BATCH else df[col].to_numpy(dtype=object)
+                   for col in CATEGORICAL_COLUMNS}
+    return numeric, categorical
+
+
+def profile_dataset(path, chunk_size=None):
+    """Reference profile of a dataset, streamed chunk by chunk."""
+    from dataset_io import ROW_GROUP_SIZE, iter_dataset
+
+    profile = DriftProfile()
+    for chunk in iter_dataset(path, batch_size=chunk_size or ROW_GROUP_SIZE):
+        profile.update(chunk)
+    return profile
+
+
+# ===============================
+# Scores
+# ===============================
+def _psi(expected, actual, eps=1e-4):
+    expected = np.clip(np.asarray(expected, dtype=float), eps, None)
+    actual = np.clip(np.asarray(actual, dtype=float), eps, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def numeric_scores(reference, live):
+    """(PSI over the reference deciles, KS statistic) between two KLL sketches."""
+    if not reference.n or not live.n:
+        return np.nan, np.nan
+    edges = np.unique(reference.quantile(np.linspace(0, 1, PSI_BINS + 1)[1:-1]))
+    cdf = lambda sketch: np.concatenate([[0.0], sketch.rank(edges), [1.0]])
+    psi = _psi(np.diff(cdf(reference)), np.diff(cdf(live)))
+    grid = np.union1d(reference.quantile(np.linspace(0, 1, KS_POINTS)), live.quantile(np.linspace(0, 1, KS_POINTS)))
+    ks = float(np.max(np.abs(reference.rank(grid) - live.rank(grid))))
+    return psi, ks
+
+
+def categorical_psi(reference, live):
+    levels = sorted(set(reference) | set(live))
+    expected = np.array([reference.get(level, 0) for level in levels], dtype=float)
+    actual = np.array([live.get(level, 0) for level in levels], dtype=float)
+    if not expected.sum() or not actual.sum():
+        return np.nan
+    return _psi(expected / expected.sum(), actual / actual.sum())
+
+
+def _round(value, digits=4):
+    """JSON-safe rounding: NaN (no data yet) becomes None."""
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def _status(psi, ks=None):
+    if np.isnan(psi):
+        return "no data"
+    if psi > PSI_DRIFT or (ks is not None and ks > KS_DRIFT):
+        return "drift"
+    return "warn" if psi > PSI_WARN else "ok"
+
+
+# ===============================
+# Live monitor
+# ===============================
+class DriftMonitor:
+    """
+    Profile live traffic against a reference and flag suspicious inputs.
+
+    observe() checks and records a batch and returns per-row input warnings;
+    report() compares everything observed since the last reset() with the
+    reference. Thread-safe: scoring threads observe while another reports.
+    """
+
+    def __init__(self, reference, buffer_rows=BUFFER_ROWS):
+        self.reference = reference
+        self.live = DriftProfile()
+        self.buffer_rows = buffer_rows
+        self._buffers = {col: np.empty(buffer_rows) for col in NUMERIC_COLUMNS}
+        self._filled = 0
+        self._flags = {}
+        self._lock = threading.Lock()
+        # plausible range per feature; a converted value landing in it suggests a unit mix-up
+        self.limits = {}
+        for col in NUMERIC_COLUMNS:
+            low, high = (reference.extreme_quantile(col, q) for q in RANGE_QUANTILES)
+            margin = RANGE_MARGIN * (high - low)
+            self.limits[col] = (low - margin, high + margin)
+        self.levels = {col: set(counts) for col, counts in reference.counts.items()}
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        return cls(DriftProfile.load(path), **kwargs)
+
+    def check(self, df):
+        """Input warnings per row of a frame or list of dicts: [[{"feature", "issue", "value", ...}], ...] (empty lists when clean)."""
+        return self._check(len(df), *_arrays(df))
+
+    def _check(self, n_rows, numeric, categorical):
+        warnings = [[] for _ in range(n_rows)]
+        for col, values in numeric.items():
+            low, high = self.limits[col]
+            with np.errstate(invalid="ignore"):
+                outside = (values < low) | (values > high)
+            for i in np.flatnonzero(outside):
+                warning = {"feature": col, "issue": "out_of_range", "value": float(values[i]),
+                           "expected": [float(low), float(high)]}
+                for unit, convert in UNIT_CONVERSIONS.get(col, []):
+                    converted = convert(values[i])
+                    if low <= converted <= high:
+                        warning.update(issue="unit_mismatch", unit=unit, converted=round(float(converted), 3))
+                        break
+                warnings[i].append(warning)
+        for col, values in categorical.items():
+            levels = self.levels[col]
+            if n_rows <= SMALL_BATCH:
+                unknown = [i for i, value in enumerate(values) if not _missing(value) and str(value) not in levels]
+            else:
+                values = pd.Series(values, copy=False)
+                unknown = np.flatnonzero(values.notna().to_numpy() & ~values.astype(str).isin(levels).to_numpy())
+            for i in unknown:
+                warnings[i].append({"feature": col, "issue": "unknown_category", "value": str(values[i])})
+        return warnings
+
+    def observe(self, df):
+        """Check and record a batch of raw patients (frame or list of dicts); returns check()'s warnings."""
+        from instrumentation import METRICS
+
+        numeric, categorical = _arrays(df)
+        warnings = self._check(len(df), numeric, categorical)
+        with self._lock:
+            self.live.rows += len(df)
+            for col, values in categorical.items():
+                self.live.update_categorical(col, values)
+            start = 0
+            while start < len(df):
+                take = min(self.buffer_rows - self._filled, len(df) - start)
+                for col, values in numeric.items():
+                    self._buffers[col][self._filled:self._filled + take] = values[start:start + take]
+                self._filled += take
+                start += take
+                if self._filled == self.buffer_rows:
+                    self._flush()
+            for row in warnings:
+                for warning in row:
+                    key = (warning["feature"], warning["issue"])
+                    self._flags[key] = self._flags.get(key, 0) + 1
+                    if METRICS.enabled:
+                        METRICS.inc("input_flags_total", feature=key[0], issue=key[1])
+        return warnings
+
+    def _flush(self):
+        for col, buffer in self._buffers.items():
+            self.live.update_numeric(col, buffer[:self._filled])
+        self._filled = 0
+
+    def report(self):
+        """Per-feature PSI/KS against the reference, moments and input-flag counts."""
+        with self._lock:
+            self._flush()
+            live_rows = self.live.rows
+            features = {}
+            for col in NUMERIC_COLUMNS:
+                psi, ks = numeric_scores(self.reference.sketches[col], self.live.sketches[col])
+                (ref_mean, ref_std), (mean, std) = self.reference.mean_std(col), self.live.mean_std(col)
+                features[col] = {"psi": _round(psi), "ks": _round(ks), "status": _status(psi, ks),
+                                 "reference_mean": _round(ref_mean, 3), "mean": _round(mean, 3),
+                                 "reference_std": _round(ref_std, 3), "std": _round(std, 3)}
+            for col in CATEGORICAL_COLUMNS:
+                psi = categorical_psi(self.reference.counts[col], self.live.counts[col])
+                features[col] = {"psi": _round(psi), "status": _status(psi),
+                                 "reference": self.reference.counts[col], "live": dict(self.live.counts[col])}
+            for col, f in features.items():
+                f["missing_rate"] = round(self.live.missing[col] / live_rows, 4) if live_rows else 0.0
+            flags = {f"{feature}:{issue}": count for (feature, issue), count in sorted(self._flags.items())}
+        statuses = [f["status"] for f in features.values()]
+        overall = "drift" if "drift" in statuses else "warn" if "warn" in statuses else \
+            "ok" if live_rows else "no data"
+        return {"rows": live_rows, "reference_rows": self.reference.rows, "status": overall,
+                "input_flags": flags, "features": features}
+
+    def reset(self):
+        """Start a new observation window."""
+        with self._lock:
+            self.live = DriftProfile()
+            self._filled = 0
+            self._flags = {}
+
+
+_default = {}
+_default_lock = threading.Lock()
+
+
+def default_monitor(model_dir="models"):
+    """Process-wide monitor for `model_dir`'s reference profile (None if training saved none)."""
+    path = os.path.join(model_dir, REFERENCE_NAME)
+    with _default_lock:
+        if path not in _default:
+            _default[path] = DriftMonitor.load(path) if os.path.exists(path) else None
+        return _default[path]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Reference profiles and drift reports.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    prof = sub.add_parser("profile", help="build a reference profile from a dataset")
+    prof.add_argument("data")
+    prof.add_argument("--output", default=os.path.join("models", REFERENCE_NAME))
+    cmp = sub.add_parser("compare", help="stream a dataset through a monitor and report drift")
+    cmp.add_argument("reference")
+    cmp.add_argument("data")
+    cmp.add_argument("--batch-size", type=int, default=1, help="rows per observe() call, like requests")
+    cmp.add_argument("--rows", type=int, default=None, help="stop after this many rows")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "profile":
+        start = time.perf_counter()
+        profile = profile_dataset(args.data)
+        profile.save(args.output)
+        print(f"✅ Profiled {profile.rows:,} rows in {time.perf_counter() - start:.1f}s -> {args.output} "
+              f"({os.path.getsize(args.output) / 1e3:.0f} kB)")
+    else:
+        from dataset_io import iter_dataset
+
+        monitor = DriftMonitor.load(args.reference)
+        seen, elapsed = 0, 0.0
+        for chunk in iter_dataset(args.data):
+            if args.rows is not None:
+                chunk = chunk.iloc[:args.rows - seen]
+            # request-shaped input: lists of dicts, like the server receives
+            records = chunk.astype(object).where(chunk.notna(), None).to_dict("records")
+            for start in range(0, len(records), args.batch_size):
+                batch = records[start:start + args.batch_size]
+                t = time.perf_counter()
+                monitor.observe(batch)
+                elapsed += time.perf_counter() - t
+            seen += len(chunk)
+            if args.rows is not None and seen >= args.rows:
+                break
+        print(json.dumps(monitor.report(), indent=2))
+        print(f"✅ Observed {seen:,} rows in batches of {args.batch_size}: "
+              f"{elapsed / max(seen, 1) * 1e6:.1f} µs per row ({seen / max(elapsed, 1e-9) * 3600:,.0f} rows/hour)")
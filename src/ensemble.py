@@ -0,0 +1,250 @@
+# src/ensemble.py
+"""
+Soft-voting ensemble over every model saved by training.
+
+model_training.py --save-ensemble writes each fully trained candidate to
+models/ensemble/ (one pipeline artifact per member) plus ensemble.json.
+An ensemble pipeline looks like any other pipeline to score_frame, the
+server and the app: its "model" is an EnsembleModel with predict_proba.
+
+- Each batch is encoded once, without imputation; members trained on
+  imputed features share one imputed view (training medians / modes, the
+  same values Preprocessor.transform would fill in).
+- Members score concurrently on a thread pool: sklearn's tree and linear
+  predictors spend much of predict_proba in code that releases the GIL.
+- Probabilities are averaged with weights: equal, the members' test F1
+  from training, or explicit "Name=w,..." (unlisted members are dropped).
+- Fast path: with a fast model set, that member scores first and rows
+  where its top probability reaches the threshold take its answer; only
+  the remaining rows go through the rest of the ensemble.
+
+    python src/model_training.py --save-ensemble
+    python src/prediction_server.py --ensemble --fast-model "Naive Bayes" --fast-threshold 0.95
+    DISEASE_ENSEMBLE=1 streamlit run src/disease_app.py
+    python src/benchmark.py run --sizes 100k --stages inference,ensemble --models "Naive Bayes,Random Forest"
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import METRICS
+from preprocessing import CATEGORICAL_COLUMNS, FEATURE_COLUMNS, PIPELINE_VERSION, save_pipeline
+
+ENSEMBLE_DIR = "models/ensemble"
+SPEC_NAME = "ensemble.json"
+FAST_THRESHOLD = 0.9
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def _slug(name):
+    return name.lower().replace(" ", "_")
+
+
+class EnsembleModel:
+    """Weighted soft vote of fitted classifiers sharing one preprocessor and class order."""
+
+    kind = "ensemble"
+
+    def __init__(self, members, preprocessor, weights=None, fast_model=None, fast_threshold=FAST_THRESHOLD,
+                 n_threads=None):
+        """members: [(name, fitted model, trained on imputed features?)]."""
+        if not members:
+            raise ValueError("an ensemble needs at least one member")
+        self.names = [name for name, _, _ in members]
+        self.models = [model for _, model, _ in members]
+        self.impute = [impute for _, _, impute in members]
+        self.classes_ = np.asarray(self.models[0].classes_)
+        for name, model in zip(self.names, self.models):
+            if not np.array_equal(model.classes_, self.classes_):
+                raise ValueError(f"{name} was trained on different classes")
+
+        weights = np.ones(len(members)) if weights is None else np.asarray(weights, dtype=float)
+        if weights.shape != (len(members),) or (weights < 0).any() or weights.sum() <= 0:
+            raise ValueError(f"need one non-negative weight per member, got {weights.tolist()}")
+        self.weights = weights / weights.sum()
+        if fast_model is not None and fast_model not in self.names:
+            raise ValueError(f"fast model {fast_model!r} is not a member ({self.names})")
+        self.fast = self.names.index(fast_model) if fast_model is not None else None
+        self.fast_threshold = fast_threshold
+        self.preprocessor = preprocessor
+
+        n_threads = n_threads or len(members)
+        self.executor = ThreadPoolExecutor(n_threads, thread_name_prefix="ensemble") if n_threads > 1 else None
+        self.rows = 0
+        self.fast_rows = 0
+        self._stats_lock = threading.Lock()
+
+    def imputed(self, X):
+        """The imputed encoding of an un-imputed feature frame."""
+        out = {}
+        for col in X.columns:
+            values = X[col].to_numpy()
+            if col in CATEGORICAL_COLUMNS:
+                missing = values < 0
+                fill = self.preprocessor.categories_[col].index(self.preprocessor.modes_[col])
+            else:
+                missing = np.isnan(values)
+                fill = self.preprocessor.medians_[col]
+            out[col] = np.where(missing, values.dtype.type(fill), values) if missing.any() else values
+        return pd.DataFrame(out, index=X.index, copy=False)
+
+    def _member_proba(self, i, X):
+        with METRICS.timer("member_predict", self.names[i]):
+            return self.models[i].predict_proba(X)
+
+    def predict_proba(self, X):
+        """Weighted mean of the members' probabilities for an un-imputed feature frame."""
+        views = {False: X}
+        if any(self.impute):
+            views[True] = self.imputed(X)
+        members = list(range(len(self.models)))
+
+        fast = None
+        if self.fast is not None:
+            fast = self._member_proba(self.fast, views[self.impute[self.fast]])
+            confident = fast.max(axis=1) >= self.fast_threshold
+            with self._stats_lock:
+                self.rows += len(X)
+                self.fast_rows += int(confident.sum())
+            if confident.all():
+                return fast
+            rest = np.flatnonzero(~confident)
+            if len(rest) < len(X):
+                views = {impute: view.iloc[rest] for impute, view in views.items()}
+            members.remove(self.fast)
+        else:
+            with self._stats_lock:
+                self.rows += len(X)
+
+        if self.executor is not None and len(members) > 1:
+            futures = [self.executor.submit(self._member_proba, i, views[self.impute[i]]) for i in members]
+            probas = [future.result() for future in futures]
+        else:
+            probas = [self._member_proba(i, views[self.impute[i]]) for i in members]
+        combined = sum(self.weights[i] * proba for i, proba in zip(members, probas))
+        if fast is None:
+            return combined
+        combined += self.weights[self.fast] * fast[rest]
+        fast[rest] = combined
+        return fast
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def stats(self):
+        with self._stats_lock:
+            rows, fast_rows = self.rows, self.fast_rows
+        stats = {"members": dict(zip(self.names, np.round(self.weights, 4).tolist())), "rows": rows}
+        if self.fast is not None:
+            stats.update(fast_model=self.names[self.fast], fast_threshold=self.fast_threshold,
+                         fast_path_rows=fast_rows, fast_path_rate=fast_rows / rows if rows else 0.0)
+        return stats
+
+
+def ensemble_pipeline(pipelines, weights=None, fast_model=None, fast_threshold=FAST_THRESHOLD, n_threads=None):
+    """A pipeline dict whose model soft-votes the given member pipelines."""
+    preprocessor = pipelines[0]["preprocessor"]
+    state = preprocessor.get_state()
+    for pipeline in pipelines[1:]:
+        if pipeline["preprocessor"].get_state() != state:
+            raise ValueError(f"{pipeline['model_name']} was trained with different preprocessing; "
+                             "ensemble members must come from one training run")
+    model = EnsembleModel([(p["model_name"], p["model"], p.get("impute", True)) for p in pipelines],
+                          preprocessor, weights, fast_model, fast_threshold, n_threads)
+    # identifies this exact combination, e.g. for prediction cache keys
+    key = json.dumps([[p["model_name"], p.get("sha256") or p.get("created")] for p in pipelines]
+                     + [model.weights.tolist(), fast_model, fast_threshold])
+    return {
+        "version": PIPELINE_VERSION,
+        "model_name": "Ensemble",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "feature_columns": FEATURE_COLUMNS,
+        "impute": False,
+        "preprocessor": preprocessor,
+        "model": model,
+        "sha256": hashlib.sha256(key.encode()).hexdigest(),
+    }
+
+
+# ===============================
+# Saved ensembles
+# ===============================
+def save_members(fitted, preprocessor, results, path=ENSEMBLE_DIR, native_missing=()):
+    """
+    Save every fitted model as an ensemble member plus the ensemble.json spec.
+
+    results: comparison rows ({"Model", "F1_Score", "Predict_Time_s", ...})
+    of the fitted models, kept in the spec for F1 weights and "auto" fast model.
+    """
+    os.makedirs(path, exist_ok=True)
+    scores = {r["Model"]: r for r in results}
+    members = []
+    for name, model in fitted.items():
+        artifact = _slug(name) + ".pkl"
+        save_pipeline(model, preprocessor, name, os.path.join(path, artifact), impute=name not in native_missing)
+        members.append({"name": name, "artifact": artifact, "f1": float(scores[name]["F1_Score"]),
+                        "predict_time_s": float(scores[name]["Predict_Time_s"])})
+    spec = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "members": members}
+    tmp_path = os.path.join(path, SPEC_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(spec, f, indent=2)
+    os.replace(tmp_path, os.path.join(path, SPEC_NAME))
+    return spec
+
+
+def member_weights(spec, weights="equal"):
+    """{member name: weight} from "equal", "f1" or "Name=w,..." (unlisted members get 0)."""
+    names = [m["name"] for m in spec["members"]]
+    if weights in (None, "", "equal"):
+        return dict.fromkeys(names, 1.0)
+    if weights == "f1":
+        return {m["name"]: m["f1"] for m in spec["members"]}
+    given = {}
+    for item in weights.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() not in names:
+            raise ValueError(f"unknown ensemble member {name.strip()!r}; saved members: {names}")
+        given[name.strip()] = float(value)
+    return {name: given.get(name, 0.0) for name in names}
+
+
+def load_ensemble(path=ENSEMBLE_DIR, weights="equal", fast_model=None, fast_threshold=FAST_THRESHOLD,
+                  n_threads=None):
+    """
+    Ensemble pipeline of the members saved in `path`, cached per process
+    until ensemble.json changes. fast_model="auto" picks the member with
+    the lowest prediction time measured during training.
+    """
+    from model_registry import load_artifact
+
+    spec_path = os.path.abspath(os.path.join(path, SPEC_NAME))
+    stat = os.stat(spec_path)
+    key = (spec_path, weights, fast_model, fast_threshold, n_threads)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        entry = _cache.get(key)
+        if entry and entry["signature"] == signature:
+            return entry["pipeline"]
+
+        with open(spec_path) as f:
+            spec = json.load(f)
+        chosen = {name: w for name, w in member_weights(spec, weights).items() if w > 0}
+        members = [m for m in spec["members"] if m["name"] in chosen]
+        if fast_model == "auto":
+            fast_model = min(members, key=lambda m: m["predict_time_s"])["name"]
+        pipelines = [load_artifact(os.path.join(path, m["artifact"])) for m in members]
+        pipeline = ensemble_pipeline(pipelines, [chosen[m["name"]] for m in members], fast_model,
+                                     fast_threshold, n_threads)
+        if entry and entry["pipeline"]["model"].executor is not None:
+            # the replaced ensemble's threads exit once its in-flight batches finish
+            entry["pipeline"]["model"].executor.shutdown(wait=False)
+        _cache[key] = {"signature": signature, "pipeline": pipeline}
+        return pipeline
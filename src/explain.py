@@ -0,0 +1,375 @@
+# src/explain.py
+"""
+Per-patient explanations: exact (path-dependent) tree SHAP attributions.
+
+Gradient boosting ensembles are explained by a vectorized implementation
+built from the saved trees. Every leaf has only a few distinct split
+features, so its SHAP contribution depends only on which of those features'
+path conditions a row satisfies; those contributions are tabulated once per
+leaf and a batch is explained with compares, a table gather and one matrix
+product. Other tree models (Random Forest, Hist Gradient Boosting) go
+through shap.TreeExplainer. shap has no multiclass gradient boosting, so
+gradient boosting with trees deeper than MAX_TABLE_FEATURES (e.g. tuned to
+max_depth >= 7) can't be explained.
+
+Attributions are cached per encoded feature vector (LRU), and duplicate
+vectors within a batch are explained once. Only tree models can be
+explained (see explainable()); linear, Naive Bayes, SVM and ensemble
+pipelines are not.
+
+    python src/explain.py summary --sample 5000
+    python src/explain.py bench --sizes 1,10,100,1000,10000
+"""
+import argparse
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from math import factorial
+
+import numpy as np
+import pandas as pd
+
+from preprocessing import FEATURE_COLUMNS, model_inputs
+from utils import optional_import
+
+CACHE_SIZE = 100_000
+BLOCK_SIZE = 512
+# Deepest gradient boosting trees the path tables support (2^depth patterns per leaf)
+MAX_TABLE_FEATURES = 6
+# Model classes with exact tree SHAP (PathTables or shap.TreeExplainer)
+EXPLAINABLE_MODELS = {"GradientBoostingClassifier", "HistGradientBoostingClassifier", "RandomForestClassifier"}
+
+
+# ===============================
+# Vectorized tree SHAP for gradient boosting
+# ===============================
+class PathTables:
+    """
+    Leaf path tables of a GradientBoostingClassifier.
+
+    For leaf l with distinct path features U (d = |U|), feature i gets
+        v_l * sum_{S in U\\{i}} |S|! (d-|S|-1)! / d! * (o_i - z_i) * prod_S o_j * prod_rest z_j
+    where o_j says whether the row satisfies the leaf's conditions on j and
+    z_j is the fraction of training cover that does. `table[l, pattern]`
+    holds this for every 0/1 pattern of o.
+    """
+
+    def __init__(self, model):
+        n_outputs = model.estimators_.shape[1]
+        leaves = []  # (output, value, {feature: [low, high, z]})
+        self.expected_value = np.asarray(model._raw_predict_init(np.zeros((1, model.n_features_in_)))[0],
+                                         dtype=np.float64)
+        for t, est in enumerate(model.estimators_.ravel()):
+            tree = est.tree_
+            output = t % n_outputs
+            value = tree.value[:, 0, 0] * model.learning_rate
+            cover = tree.weighted_n_node_samples
+            # internal node values aren't updated by the leaf line search: average the leaves
+            is_leaf = tree.children_left < 0
+            self.expected_value[output] += (value[is_leaf] * cover[is_leaf]).sum() / cover[0]
+            stack = [(0, {})]
+            while stack:
+                node, conditions = stack.pop()
+                left, right = tree.children_left[node], tree.children_right[node]
+                if left < 0:
+                    leaves.append((output, value[node], conditions))
+                    continue
+                f, thr = tree.feature[node], tree.threshold[node]
+                for child, is_left in ((left, True), (right, False)):
+                    low, high, z = conditions.get(f, (-np.inf, np.inf, 1.0))
+                    if is_left:
+                        high = min(high, thr)
+                    else:
+                        low = max(low, thr)
+                    child_conditions = dict(conditions)
+                    child_conditions[f] = (low, high, z * cover[child] / cover[node])
+                    stack.append((child, child_conditions))
+
+        self.depth = max(len(c) for _, _, c in leaves)
+        if self.depth > MAX_TABLE_FEATURES:
+            raise ValueError(f"leaves split on up to {self.depth} features; tables support {MAX_TABLE_FEATURES}")
+        n_leaves, depth = len(leaves), self.depth
+        self.n_outputs = n_outputs
+        self.feature = np.zeros((n_leaves, depth), dtype=np.int64)
+        self.low = np.full((n_leaves, depth), -np.inf)
+        self.high = np.full((n_leaves, depth), np.inf)
+        z = np.ones((n_leaves, depth))
+        active = np.zeros((n_leaves, depth), dtype=bool)
+        values = np.empty(n_leaves)
+        outputs = np.empty(n_leaves, dtype=np.int64)
+        for l, (output, value, conditions) in enumerate(leaves):
+            values[l], outputs[l] = value, output
+            for slot, (f, (low, high, frac)) in enumerate(sorted(conditions.items())):
+                self.feature[l, slot], self.low[l, slot], self.high[l, slot] = f, low, high
+                z[l, slot], active[l, slot] = frac, True
+
+        self.table = self._tabulate(values, z, active)
+        # (leaf, slot) -> (feature, output) accumulation matrix
+        self.scatter = np.zeros((n_leaves * depth, model.n_features_in_ * n_outputs))
+        rows = np.arange(n_leaves * depth)
+        self.scatter[rows, (self.feature * n_outputs + outputs[:, np.newaxis]).ravel()] = active.ravel()
+        self.bits = 1 << np.arange(depth)
+
+    @staticmethod
+    def _tabulate(values, z, active):
+        n_leaves, depth = z.shape
+        d = active.sum(axis=1)
+        fact = np.array([factorial(k) for k in range(depth + 1)], dtype=np.float64)
+        table = np.zeros((n_leaves, 1 << depth, depth))
+        for pattern in range(1 << depth):
+            o = np.array([(pattern >> j) & 1 for j in range(depth)], dtype=np.float64)
+            for i in range(depth):
+                others = [j for j in range(depth) if j != i]
+                total = np.zeros(n_leaves)
+                for size in range(len(others) + 1):
+                    for subset in itertools.combinations(others, size):
+                        term = np.ones(n_leaves)
+                        valid = np.ones(n_leaves, dtype=bool)
+                        for j in others:
+                            if j in subset:
+                                term *= o[j]
+                                valid &= active[:, j]  # inactive slots are not players
+                            else:
+                                term *= z[:, j]
+                        k = len(subset)
+                        weight = fact[k] * fact[np.maximum(d - k - 1, 0)] / fact[np.maximum(d, 1)]
+                        total += np.where(valid, weight * term, 0.0)
+                table[:, pattern, i] = np.where(active[:, i], values * (o[i] - z[:, i]) * total, 0.0)
+        return table
+
+    def shap_values(self, X):
+        """(rows, features, outputs) attributions for a float feature matrix."""
+        # same float32 cast as sklearn's tree input validation, compared in float64
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        n_rows, n_features = X.shape
+        leaf_index = np.arange(self.table.shape[0])[np.newaxis, :, np.newaxis]
+        slot_index = np.arange(self.depth)[np.newaxis, np.newaxis, :]
+        out = np.empty((n_rows, n_features, self.n_outputs))
+        for start in range(0, n_rows, BLOCK_SIZE):
+            x = X[start:start + BLOCK_SIZE][:, self.feature]  # (rows, leaves, slots)
+            o = (x > self.low) & (x <= self.high)
+            pattern = (o * self.bits).sum(axis=2)[:, :, np.newaxis]
+            phi = self.table[leaf_index, pattern, slot_index]
+            block = phi.reshape(len(x), -1) @ self.scatter
+            out[start:start + BLOCK_SIZE] = block.reshape(len(x), n_features, self.n_outputs)
+        return out
+
+
+class ShapTreeBackend:
+    """shap.TreeExplainer for the tree models it supports exactly."""
+
+    def __init__(self, model):
+        shap = optional_import("shap")
+        self.explainer = shap.TreeExplainer(model, feature_perturbation="tree_path_dependent")
+        self.expected_value = np.atleast_1d(np.asarray(self.explainer.expected_value, dtype=np.float64))
+
+    def shap_values(self, X):
+        values = self.explainer.shap_values(pd.DataFrame(X, columns=FEATURE_COLUMNS), check_additivity=False)
+        if isinstance(values, list):
+            values = np.stack(values, axis=-1)
+        values = np.asarray(values, dtype=np.float64)
+        return values if values.ndim == 3 else values[:, :, np.newaxis]
+
+
+# ===============================
+# Cached explainer
+# ===============================
+def _tree_depth(model):
+    return max(est.tree_.max_depth for est in model.estimators_.ravel())
+
+
+def explainable(pipeline):
+    """Whether the pipeline's model is a tree model Explainer supports."""
+    model = pipeline["model"]
+    if type(model).__name__ == "GradientBoostingClassifier":
+        return _tree_depth(model) <= MAX_TABLE_FEATURES
+    return type(model).__name__ in EXPLAINABLE_MODELS
+
+
+class Explainer:
+    """
+    SHAP attributions for a saved pipeline, cached per encoded feature vector.
+
+    Values are in the model's raw output space: log-odds for gradient
+    boosting, class probability for forests.
+    """
+
+    def __init__(self, pipeline, cache_size=CACHE_SIZE):
+        model = pipeline["model"]
+        if not explainable(pipeline):
+            if type(model).__name__ == "GradientBoostingClassifier":
+                raise ValueError(f"{pipeline['model_name']} has trees {_tree_depth(model)} levels deep; "
+                                 f"explanations support gradient boosting up to depth {MAX_TABLE_FEATURES}")
+            raise ValueError(f"{pipeline['model_name']} can't be explained; SHAP explanations "
+                             f"need one of {sorted(EXPLAINABLE_MODELS)}")
+        self.pipeline = pipeline
+        self.preprocessor = pipeline["preprocessor"]
+        self.classes = self.preprocessor.decode_target(model.classes_)
+        if type(model).__name__ == "GradientBoostingClassifier":
+            self.backend = PathTables(model)
+        else:
+            self.backend = ShapTreeBackend(model)
+        self.expected_value = self.backend.expected_value
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def shap_values(self, X):
+        """(rows, features, outputs) SHAP values for encoded features X."""
+        X = np.ascontiguousarray(np.asarray(X, dtype=np.float64))
+        keys = X.view(np.dtype((np.void, X.dtype.itemsize * X.shape[1]))).ravel()
+        unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+        results = [None] * len(unique)
+        missing = []
+        with self._lock:
+            for u, key in enumerate(unique):
+                cached = self._cache.get(key.tobytes())
+                if cached is None:
+                    missing.append(u)
+                else:
+                    self._cache.move_to_end(key.tobytes())
+                    results[u] = cached
+            self.hits += len(X) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            computed = self.backend.shap_values(X[first[missing]])
+            with self._lock:
+                for u, values in zip(missing, computed):
+                    results[u] = values
+                    self._cache[unique[u].tobytes()] = values
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return np.stack(results)[inverse.ravel()] if len(X) else np.empty((0, X.shape[1], len(self.expected_value)))
+
+    def explain_frame(self, df, top_k=3):
+        """
+        Top-k reasons for each row's predicted class, e.g. "Cough=Severe (+1.52)".
+
+        Returns a frame with Explained_Class and Reason_1..Reason_k, indexed like df.
+        """
+        values = self.shap_values(model_inputs(self.pipeline, df)[FEATURE_COLUMNS])
+        raw = values.sum(axis=1) + self.expected_value
+        output = raw.argmax(axis=1) if raw.shape[1] > 1 else np.zeros(len(df), dtype=int)
+        contributions = values[np.arange(len(df)), :, output]
+        if raw.shape[1] > 1:
+            explained = self.classes[output]
+        else:
+            explained = self.classes[(raw[:, 0] > 0).astype(int)]
+
+        out = pd.DataFrame({"Explained_Class": explained}, index=df.index)
+        order = np.argsort(-np.abs(contributions), axis=1)[:, :top_k]
+        shown = {col: df[col].astype(str).to_numpy() for col in FEATURE_COLUMNS}
+        for rank in range(min(top_k, len(FEATURE_COLUMNS))):
+            idx = order[:, rank]
+            out[f"Reason_{rank + 1}"] = [
+                f"{FEATURE_COLUMNS[f]}={shown[FEATURE_COLUMNS[f]][r]} ({contributions[r, f]:+.2f})"
+                for r, f in enumerate(idx)
+            ]
+        return out
+
+    def contributions(self, df):
+        """Per-feature SHAP values of one patient (first row of df) for its predicted class."""
+        values = self.shap_values(model_inputs(self.pipeline, df.iloc[:1])[FEATURE_COLUMNS])[0]
+        raw = values.sum(axis=0) + self.expected_value
+        output = int(raw.argmax()) if len(raw) > 1 else 0
+        return pd.Series(values[:, output], index=FEATURE_COLUMNS).sort_values(key=np.abs, ascending=False)
+
+    def global_summary(self, df, sample_size=5000, seed=42):
+        """Mean |SHAP| per feature and class on a random sample of df."""
+        if len(df) > sample_size:
+            df = df.sample(sample_size, random_state=seed)
+        values = np.abs(self.shap_values(model_inputs(self.pipeline, df)[FEATURE_COLUMNS])).mean(axis=0)
+        columns = list(self.classes) if values.shape[1] == len(self.classes) else ["Output"]
+        summary = pd.DataFrame(values, index=FEATURE_COLUMNS, columns=columns)
+        summary["Overall"] = summary.sum(axis=1)
+        return summary.sort_values("Overall", ascending=False)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = 0
+
+    @property
+    def stats(self):
+        return {"cached_vectors": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+_explainers = {}
+_explainers_lock = threading.Lock()
+
+
+def explainer_for(pipeline):
+    """One shared Explainer per loaded pipeline object (per process)."""
+    with _explainers_lock:
+        entry = _explainers.get(id(pipeline))
+        if entry is None or entry[0] is not pipeline:
+            entry = (pipeline, Explainer(pipeline))
+            _explainers[id(pipeline)] = entry
+        return entry[1]
+
+
+# ===============================
+# Benchmark / summary CLI
+# ===============================
+def benchmark(pipeline, df, sizes, repeats=3):
+    """Explanations/sec per batch size, cold (empty cache) and warm (repeated batch)."""
+    rows = []
+    rng = np.random.default_rng(42)
+    for size in sizes:
+        batch = df.iloc[rng.choice(len(df), size, replace=size > len(df))]
+        explainer = Explainer(pipeline)
+        explainer.shap_values(model_inputs(pipeline, batch.iloc[:1]))  # warm up tables / imports
+        cold = []
+        for _ in range(repeats):
+            explainer.clear_cache()
+            start = time.perf_counter()
+            explainer.explain_frame(batch)
+            cold.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        explainer.explain_frame(batch)
+        warm = time.perf_counter() - start
+        rows.append({
+            "Batch_Size": size,
+            "Unique_Vectors": explainer.stats["cached_vectors"],
+            "Cold_Explanations_per_s": size / min(cold),
+            "Warm_Explanations_per_s": size / warm,
+        })
+    return pd.DataFrame(rows).round(1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="SHAP explanations for the current model.")
+    parser.add_argument("command", choices=["summary", "bench"])
+    parser.add_argument("--data", default=None, help="dataset (default: data/patient_symptoms_dataset.parquet)")
+    parser.add_argument("--model", default=None,
+                        help="pipeline artifact (default: current model from models/manifest.json)")
+    parser.add_argument("--sample", type=int, default=5000, help="rows sampled for the global summary")
+    parser.add_argument("--output", default="visuals/shap_summary.csv")
+    parser.add_argument("--sizes", default="1,10,100,1000,10000")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from dataset_io import DATA_PATH, read_dataset
+    from model_registry import current_artifact_path, load_artifact
+
+    args = parse_args()
+    pipeline = load_artifact(args.model or current_artifact_path())
+    df = read_dataset(args.data or DATA_PATH)
+
+    if args.command == "summary":
+        start = time.perf_counter()
+        summary = explainer_for(pipeline).global_summary(df, args.sample)
+        summary.to_csv(args.output)
+        print(summary.round(4))
+        print(f"✅ SHAP summary of {min(args.sample, len(df))} rows in {time.perf_counter() - start:.2f}s "
+              f"saved to '{args.output}'")
+    else:
+        sizes = [int(s) for s in args.sizes.split(",")]
+        print(f"=== Explanation throughput: {pipeline['model_name']} ===")
+        print(benchmark(pipeline, df, sizes).to_string(index=False))
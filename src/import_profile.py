@@ -0,0 +1,138 @@
+# src/import_profile.py
+"""
+Import-time profiler for the entry points.
+
+Imports each module in a fresh interpreter under `python -X importtime`
+and reports the total cold import time plus the most expensive packages
+and modules. --check fails (exit code 1) if the serving path pulls in a
+plotting library.
+
+    python src/import_profile.py                         # every entry point
+    python src/import_profile.py prediction_server --top 15
+    python src/import_profile.py --check
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ENTRY_POINTS = [
+    "prediction_server",
+    "batch_predict",
+    "flat_predictor",
+    "model_registry",
+    "inference",
+    "model_training",
+    "data_generation",
+    "dataset_io",
+]
+
+# Modules on the prediction path (server, batch scoring and the app's scoring
+# imports) and the packages they must never import
+SERVING_MODULES = [
+    "preprocessing",
+    "rules",
+    "inference",
+    "instrumentation",
+    "prediction_cache",
+    "model_registry",
+    "flat_predictor",
+    "tabulated_model",
+    "ensemble",
+    "drift",
+    "explain",
+    "batch_predict",
+    "prediction_server",
+]
+SERVING_FORBIDDEN = ["matplotlib", "seaborn"]
+
+
+def _run(code):
+    env = dict(os.environ, PYTHONPATH=SRC_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True, env=env, check=True)
+
+
+def profile_import(module):
+    """[(module name, self seconds, cumulative seconds)] for a cold `import module`."""
+    rows = []
+    for line in _run(f"import {module}").stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return rows
+
+
+def summarize(module, rows, top=10):
+    """Total import time, and the top packages/modules by their own (self) time."""
+    packages = defaultdict(float)
+    for name, self_s, _ in rows:
+        packages[name.split(".")[0]] += self_s
+    total = next((cumulative for name, _, cumulative in rows if name == module), 0.0)
+    return {
+        "module": module,
+        "total_s": round(total, 4),
+        "packages": {k: round(v, 4) for k, v in sorted(packages.items(), key=lambda kv: -kv[1])[:top]},
+        "modules": {name: round(self_s, 4) for name, self_s, _ in sorted(rows, key=lambda r: -r[1])[:top]},
+    }
+
+
+def forbidden_imports(module, forbidden=SERVING_FORBIDDEN):
+    """Forbidden top-level packages present in sys.modules after `import module`."""
+    code = (f"import json, sys; import {module}; "
+            f"print(json.dumps(sorted({{n.split('.')[0] for n in sys.modules}} & set({forbidden!r}))))")
+    return json.loads(_run(code).stdout.strip().splitlines()[-1])
+
+
+def check_serving(modules=SERVING_MODULES):
+    """Return {module: [forbidden packages]} for every offending serving module."""
+    violations = {}
+    for module in modules:
+        try:
+            found = forbidden_imports(module)
+        except subprocess.CalledProcessError as exc:
+            found = [f"<import failed: {exc.stderr.strip().splitlines()[-1]}>"]
+        if found:
+            violations[module] = found
+    return violations
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Profile cold import time of the entry points.")
+    parser.add_argument("modules", nargs="*", default=None, help=f"default: {', '.join(ENTRY_POINTS)}")
+    parser.add_argument("--top", type=int, default=8, help="packages/modules to list per entry point")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--check", action="store_true",
+                        help=f"exit 1 if a serving module imports {' or '.join(SERVING_FORBIDDEN)}")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.check:
+        violations = check_serving(args.modules or SERVING_MODULES)
+        for module, found in violations.items():
+            print(f"❌ {module} imports {', '.join(found)}")
+        if violations:
+            sys.exit(1)
+        print(f"✅ Serving path is free of {', '.join(SERVING_FORBIDDEN)}")
+        sys.exit(0)
+
+    reports = [summarize(module, profile_import(module), args.top) for module in args.modules or ENTRY_POINTS]
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        sys.exit(0)
+
+    for report in reports:
+        print(f"\n=== {report['module']}: {report['total_s'] * 1000:.0f} ms ===")
+        for name, seconds in report["packages"].items():
+            print(f"  {name:<28} {seconds * 1000:8.1f} ms")
+        print("  heaviest modules:")
+        for name, seconds in report["modules"].items():
+            print(f"    {name:<40} {seconds * 1000:8.1f} ms")
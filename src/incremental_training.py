@@ -0,0 +1,259 @@
+# src/incremental_training.py
+"""
+Out-of-core training for cohorts larger than memory.
+
+The dataset is streamed in chunks and never held in memory at once:
+
+    pass 1  imputation medians (KLL quantile sketches), category vocabularies,
+            modes and feature moments for scaling
+    pass 2  partial_fit of the incremental candidates on the training rows
+    pass 3  streaming confusion matrix on the held-out rows
+
+The held-out split is a deterministic hash of Patient_ID, so every pass
+agrees on it without shuffling. Peak memory is bounded by --chunk-size.
+With --resample, each training chunk is rebalanced in pass 2 using class
+rates computed from the pass-1 counts, so the streamed training set is
+balanced overall without ever being materialized.
+
+    python src/incremental_training.py --data data/cohort.parquet --chunk-size 250000
+    python src/incremental_training.py --data data/stress_balanced --resample smote
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataset_io import DATA_PATH, ROW_GROUP_SIZE, iter_dataset
+from drift import REFERENCE_NAME, DriftProfile
+from model_registry import MODEL_DIR, write_manifest
+from model_training import RANDOM_STATE, RESULTS_PATH, _estimator
+from preprocessing import (CATEGORICAL_COLUMNS, FEATURE_COLUMNS, ID_COLUMN, NUMERIC_COLUMNS, PIPELINE_PATH,
+                           TARGET_COLUMN, Preprocessor, save_pipeline)
+from resampling import METHODS as RESAMPLE_METHODS, class_rates, plan_resampling
+from sketches import KLLSketch
+
+TEST_FRACTION = 0.2
+
+# Candidates with partial_fit; "scaled" ones learn on standardized features
+# and have the scaling folded into their coefficients afterwards
+incremental_models = {
+    "SGD Logistic Regression": (lambda: _estimator("sklearn.linear_model.SGDClassifier", loss="log_loss",
+                                                   alpha=1e-5, random_state=RANDOM_STATE), True),
+    "Naive Bayes": (lambda: _estimator("sklearn.naive_bayes.GaussianNB"), False),
+}
+
+
+# ===============================
+# Deterministic holdout
+# ===============================
+def _splitmix64(x):
+    x = (x + np.uint64(0x9E3779B97F4A7C15)) & np.uint64(0xFFFFFFFFFFFFFFFF)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def holdout_mask(ids, fraction=TEST_FRACTION, seed=RANDOM_STATE):
+    """True for rows whose hashed Patient_ID falls in the held-out `fraction`."""
+    with np.errstate(over="ignore"):
+        hashed = _splitmix64(np.asarray(ids).astype(np.uint64) ^ np.uint64(seed))
+    return (hashed >> np.uint64(11)) * (1.0 / 2 ** 53) < fraction
+
+
+# ===============================
+# Pass 1: streaming statistics
+# ===============================
+class StreamingStats:
+    """Everything Preprocessor.fit computes, accumulated chunk by chunk."""
+
+    def __init__(self, k=None):
+        self.sketches = {col: KLLSketch(**({"k": k} if k else {})) for col in NUMERIC_COLUMNS}
+        self.counts = {col: pd.Series(dtype=np.int64) for col in CATEGORICAL_COLUMNS + [TARGET_COLUMN]}
+        # per numeric column: non-missing count, sum, sum of squares
+        self.moments = {col: np.zeros(3) for col in NUMERIC_COLUMNS}
+        self.rows = 0
+        self.train_rows = 0
+
+    def update(self, chunk, train):
+        self.rows += len(chunk)
+        self.train_rows += int(train.sum())
+        chunk = chunk[train]
+        for col in NUMERIC_COLUMNS:
+            values = chunk[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            self.sketches[col].update(values)
+            present = values[~np.isnan(values)]
+            self.moments[col] += (len(present), present.sum(), np.square(present).sum())
+        for col in self.counts:
+            counts = chunk[col].value_counts()
+            counts.index = counts.index.map(str)
+            self.counts[col] = self.counts[col].add(counts, fill_value=0).astype(np.int64)
+
+    def preprocessor(self, unknown_value="mode"):
+        preprocessor = Preprocessor(unknown_value)
+        preprocessor.medians_ = {col: float(self.sketches[col].quantile(0.5)) for col in NUMERIC_COLUMNS}
+        # like Series.mode(): most frequent, ties broken by sort order
+        preprocessor.modes_ = {col: str(self.counts[col].sort_index().idxmax()) for col in CATEGORICAL_COLUMNS}
+        preprocessor.categories_ = {col: sorted(self.counts[col][self.counts[col] > 0].index)
+                                    for col in CATEGORICAL_COLUMNS}
+        preprocessor.classes_ = np.array(sorted(self.counts[TARGET_COLUMN][self.counts[TARGET_COLUMN] > 0].index))
+        return preprocessor
+
+    def scaling(self, preprocessor):
+        """(mean, std) per encoded feature, for standardizing SGD inputs."""
+        mean, std = [], []
+        for col in FEATURE_COLUMNS:
+            if col in NUMERIC_COLUMNS:
+                n, total, squares = self.moments[col]
+                mu = total / n
+                var = squares / n - mu ** 2
+            else:
+                counts = self.counts[col].reindex(preprocessor.categories_[col]).to_numpy(dtype=float)
+                codes = np.arange(len(counts))
+                mu = (codes * counts).sum() / counts.sum()
+                var = (np.square(codes - mu) * counts).sum() / counts.sum()
+            mean.append(mu)
+            std.append(np.sqrt(var) if var > 0 else 1.0)
+        return np.array(mean), np.array(std)
+
+
+def fold_scaling(model, mean, std):
+    """Rewrite a linear model trained on (x - mean) / std to take raw x."""
+    model.coef_ = model.coef_ / std
+    model.intercept_ = model.intercept_ - model.coef_ @ mean
+    return model
+
+
+# ===============================
+# Training loop
+# ===============================
+def _chunks(path, chunk_size, fraction):
+    for chunk in iter_dataset(path, batch_size=chunk_size):
+        yield chunk, ~holdout_mask(chunk[ID_COLUMN].to_numpy(), fraction)
+
+
+def train_incremental(path, names, chunk_size=ROW_GROUP_SIZE, fraction=TEST_FRACTION, epochs=1, resample=None):
+    """
+    Three streaming passes; returns (preprocessor, fitted models, result rows, drift reference).
+    resample: over|under|smote to rebalance each training chunk (see resampling.py).
+    """
+    start = time.perf_counter()
+    stats = StreamingStats()
+    reference = DriftProfile()
+    for chunk, train in _chunks(path, chunk_size, fraction):
+        stats.update(chunk, train)
+        reference.update(chunk[train])
+    preprocessor = stats.preprocessor()
+    mean, std = stats.scaling(preprocessor)
+    print(f"  pass 1: {stats.rows:,} rows ({stats.train_rows:,} train) in {time.perf_counter() - start:.1f}s")
+
+    fitted = {name: incremental_models[name][0]() for name in names}
+    classes = np.arange(len(preprocessor.classes_))
+    fit_time = dict.fromkeys(names, 0.0)
+    if resample:
+        rates = class_rates(stats.counts[TARGET_COLUMN].reindex(preprocessor.classes_).to_numpy(), resample)
+    resample_time, fitted_rows = 0.0, 0
+    start = time.perf_counter()
+    for epoch in range(epochs):
+        for i, (chunk, train) in enumerate(_chunks(path, chunk_size, fraction)):
+            chunk = chunk[train]
+            # a frame, so the models keep feature names like the batch-trained ones
+            X = preprocessor.transform(chunk).astype(np.float64)
+            y = preprocessor.encode_target(chunk[TARGET_COLUMN])
+            if resample:
+                t = time.perf_counter()
+                plan = plan_resampling(X, y, resample, rates=rates, random_state=(RANDOM_STATE, epoch, i))
+                X, y = plan.apply(X, y)
+                resample_time += time.perf_counter() - t
+            fitted_rows += len(y)
+            for name, model in fitted.items():
+                t = time.perf_counter()
+                model.partial_fit((X - mean) / std if incremental_models[name][1] else X, y, classes=classes)
+                fit_time[name] += time.perf_counter() - t
+    for name, model in fitted.items():
+        if incremental_models[name][1]:
+            fold_scaling(model, mean, std)
+    print(f"  pass 2: partial_fit x{epochs} in {time.perf_counter() - start:.1f}s"
+          + (f" ({resample}: {fitted_rows:,} rows, resampling {resample_time:.1f}s)" if resample else ""))
+
+    n_classes = len(classes)
+    cms = {name: np.zeros((n_classes, n_classes), dtype=np.int64) for name in names}
+    predict_time = dict.fromkeys(names, 0.0)
+    for chunk, train in _chunks(path, chunk_size, fraction):
+        chunk = chunk[~train]
+        X = preprocessor.transform(chunk)
+        y = preprocessor.encode_target(chunk[TARGET_COLUMN])
+        for name, model in fitted.items():
+            t = time.perf_counter()
+            pred = model.predict(X)
+            predict_time[name] += time.perf_counter() - t
+            cms[name] += np.bincount(y * n_classes + pred, minlength=n_classes ** 2).reshape(n_classes, n_classes)
+
+    from visualization import class_metrics
+
+    results = []
+    for name, cm in cms.items():
+        metrics = class_metrics(cm, preprocessor.classes_)
+        result = {
+            "Model": name,
+            "Stage": "incremental",
+            "Train_Rows": fitted_rows // epochs,
+            "Accuracy": np.trace(cm) / cm.sum(),
+            "F1_Score": np.average(metrics["F1_Score"], weights=metrics["Support"]),
+            **{f"F1_{cls}": f1 for cls, f1 in zip(preprocessor.classes_, metrics["F1_Score"])},
+            "Fit_Time_s": fit_time[name],
+            "Predict_Time_s": predict_time[name],
+        }
+        if resample:
+            result["Resample_Time_s"] = resample_time
+        results.append(result)
+    return preprocessor, fitted, results, reference
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the incremental candidates on a streamed dataset.")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--chunk-size", type=int, default=ROW_GROUP_SIZE, help="rows in memory at a time")
+    parser.add_argument("--test-fraction", type=float, default=TEST_FRACTION,
+                        help="share of patients (by hashed Patient_ID) held out for evaluation")
+    parser.add_argument("--epochs", type=int, default=1, help="partial_fit passes over the training rows")
+    parser.add_argument("--models", default=",".join(incremental_models),
+                        help="comma-separated candidate names")
+    parser.add_argument("--resample", default=None, choices=RESAMPLE_METHODS,
+                        help="rebalance each training chunk to the whole-cohort class balance")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    candidates = [name.strip() for name in args.models.split(",") if name.strip()]
+    unknown = set(candidates) - set(incremental_models)
+    if unknown:
+        raise SystemExit(f"Unknown models: {sorted(unknown)}; choose from {list(incremental_models)}")
+
+    start = time.perf_counter()
+    preprocessor, fitted, results, reference = train_incremental(args.data, candidates, args.chunk_size,
+                                                      args.test_fraction, args.epochs, args.resample)
+    results_df = pd.DataFrame(results).sort_values("F1_Score", ascending=False).round(4).reset_index(drop=True)
+    print("\n=== Incremental Comparison Table ===")
+    print(results_df)
+    print(f"\nTotal training wall time: {time.perf_counter() - start:.1f}s")
+    results_df.to_csv(RESULTS_PATH, index=False)
+
+    best_row = results_df.iloc[0]
+    best_model_name = best_row["Model"]
+    save_pipeline(fitted[best_model_name], preprocessor, best_model_name, PIPELINE_PATH)
+    reference.save(os.path.join(MODEL_DIR, REFERENCE_NAME))
+    write_manifest(
+        MODEL_DIR,
+        best_model_name,
+        artifact=os.path.basename(PIPELINE_PATH),
+        metrics={k: float(v) for k, v in best_row.drop(["Model", "Stage"]).dropna().items()},
+        training="incremental",
+        holdout={"column": ID_COLUMN, "fraction": args.test_fraction, "seed": RANDOM_STATE},
+        reference_profile=REFERENCE_NAME,
+        **({"resampling": {"method": args.resample}} if args.resample else {}),
+    )
+    print(f"\n Best Model Selected: {best_model_name}")
+    print(f" Model and preprocessing pipeline saved to {PIPELINE_PATH}!")
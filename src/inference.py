@@ -0,0 +1,80 @@
+# src/inference.py
+"""
+Vectorized scoring of patient DataFrames with a saved pipeline.
+
+Shared by the batch scorer and the serving paths: encode a whole batch once,
+call the model once, then apply the "Healthy" rule override from the app.
+"""
+import numpy as np
+import pandas as pd
+
+from instrumentation import METRICS
+from preprocessing import ID_COLUMN, model_inputs
+from rules import HEALTHY
+
+PREDICTION_COLUMN = "Predicted_Disease"
+MODEL_PREDICTION_COLUMN = "Model_Prediction"
+OVERRIDE_COLUMN = "Healthy_Override"
+PROBA_PREFIX = "Prob_"
+
+
+def healthy_mask(df):
+    """
+    Rows the "Healthy" override applies to (rules.HEALTHY).
+
+    WBC_Count is in dataset units (cells/µL). Missing values never count as healthy.
+    """
+    return HEALTHY.mask(df)
+
+
+def predict_proba(pipeline, df, cache=None):
+    """
+    Class probabilities for every row of a raw (unencoded) patient frame.
+
+    With a prediction_cache.PredictionCache, only vectors it hasn't seen go
+    through the model.
+    """
+    model = pipeline["model_name"]
+    with METRICS.timer("encode", model):
+        X = model_inputs(pipeline, df)
+    with METRICS.timer("predict", model):
+        if cache is None:
+            return pipeline["model"].predict_proba(X)
+        from prediction_cache import model_key
+
+        return cache.lookup(model_key(pipeline), X, pipeline["model"].predict_proba)
+
+
+def score_frame(pipeline, df, proba_classes=None, apply_override=True, cache=None):
+    """
+    Score a raw patient frame.
+
+    Returns one row per input with the final prediction, the model's own
+    prediction (the most probable class), whether the healthy rule overrode
+    it, and a probability column for each class in `proba_classes` (all
+    classes when None, none when an empty list).
+    """
+    # probability columns follow the model's class codes
+    classes = pipeline["preprocessor"].decode_target(pipeline["model"].classes_)
+    proba = predict_proba(pipeline, df, cache)
+    with METRICS.timer("decode", pipeline["model_name"]):
+        model_pred = classes[proba.argmax(axis=1)]
+
+    with METRICS.timer("healthy_rule", pipeline["model_name"]):
+        override = healthy_mask(df) if apply_override else np.zeros(len(df), dtype=bool)
+
+    out = pd.DataFrame(index=df.index)
+    if ID_COLUMN in df.columns:
+        out[ID_COLUMN] = df[ID_COLUMN].to_numpy()
+    out[PREDICTION_COLUMN] = np.where(override, "Healthy", model_pred)
+    out[MODEL_PREDICTION_COLUMN] = model_pred
+    out[OVERRIDE_COLUMN] = override
+    METRICS.record_predictions(pipeline["model_name"], out[PREDICTION_COLUMN].to_numpy(), override)
+
+    selected = list(classes) if proba_classes is None else list(proba_classes)
+    unknown = set(selected) - set(classes)
+    if unknown:
+        raise ValueError(f"Unknown classes for probability columns: {sorted(unknown)}")
+    for cls in selected:
+        out[PROBA_PREFIX + cls] = proba[:, list(classes).index(cls)].astype(np.float32)
+    return out
@@ -0,0 +1,304 @@
+# src/instrumentation.py
+"""
+Low-overhead instrumentation of the prediction path.
+
+Stages of a prediction (building the patient frame, encoding, the model
+call, decoding labels, the Healthy rule) are wrapped in `METRICS.timer`.
+Latencies aggregate into fixed-bucket histograms per (stage, model), and
+every scored patient is counted by outcome: model prediction or Healthy
+override, plus the predicted class. The counts are exported as
+Prometheus text (prediction_server.py serves them at GET /metrics) and as
+a JSON snapshot, optionally dumped every few seconds.
+
+Instrumentation is off unless enabled: a disabled timer is one attribute
+check returning a shared no-op context manager.
+
+An opt-in sampling profiler captures stacks of requests slower than a
+threshold and appends them in collapsed ("folded") format, ready for
+flamegraph.pl or speedscope.
+
+    DISEASE_METRICS=1 DISEASE_METRICS_DUMP=models/metrics.json streamlit run src/disease_app.py
+    python src/prediction_server.py --metrics --profile-slow-ms 50
+    curl -s localhost:8000/metrics
+"""
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+
+import numpy as np
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+PREFIX = "disease_"
+REQUEST_STAGE = "request"
+PROFILE_PATH = "models/slow_requests.folded"
+
+HELP = {
+    "stage_seconds": ("histogram", "Latency of each prediction stage"),
+    "predictions_total": ("counter", "Scored patients by outcome (model prediction or Healthy override)"),
+    "predicted_class_total": ("counter", "Final predicted class of scored patients"),
+    "slow_requests_total": ("counter", "Requests slower than the profiling threshold"),
+    "input_flags_total": ("counter", "Inputs flagged by the drift monitor (out of range, unit mismatch, unknown level)"),
+}
+
+_NOOP = nullcontext()
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (inf past the last bucket)."""
+        if not self.count:
+            return 0.0
+        index = int(np.searchsorted(np.cumsum(self.counts), q * self.count))
+        return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else float("inf")
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "model", "start")
+
+    def __init__(self, metrics, stage, model):
+        self.metrics, self.stage, self.model = metrics, stage, model
+
+    def __enter__(self):
+        if self.stage == REQUEST_STAGE and self.metrics.profiler is not None:
+            self.metrics.profiler.begin()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.metrics.observe("stage_seconds", elapsed, stage=self.stage, model=self.model)
+        if self.stage == REQUEST_STAGE and self.metrics.profiler is not None:
+            if self.metrics.profiler.end(elapsed):
+                self.metrics.inc("slow_requests_total", model=self.model)
+        return False
+
+
+class Metrics:
+    """Thread-safe counters and latency histograms, keyed by (name, sorted labels)."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.profiler = None
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+
+    def timer(self, stage, model=""):
+        """Context manager timing one stage; a shared no-op when disabled."""
+        return _Timer(self, stage, model) if self.enabled else _NOOP
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.observe(value)
+
+    def record_predictions(self, model, predictions, override):
+        """Count final predictions by class and by outcome (override vs model)."""
+        if not self.enabled:
+            return
+        overridden = int(np.count_nonzero(override))
+        classes, counts = np.unique(np.asarray(predictions, dtype=str), return_counts=True)
+        with self._lock:
+            self._counters[("predictions_total", (("model", model), ("source", "healthy_override")))] += overridden
+            self._counters[("predictions_total", (("model", model), ("source", "model")))] += \
+                len(predictions) - overridden
+            for cls, count in zip(classes.tolist(), counts.tolist()):
+                self._counters[("predicted_class_total", (("class", cls), ("model", model)))] += count
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    # ----------------------------
+    # Export
+    # ----------------------------
+    def snapshot(self):
+        """Counters and histogram summaries as a JSON-ready dict."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(h.counts), h.sum, h.count, h.quantile(0.5), h.quantile(0.9), h.quantile(0.99))
+                          for key, h in self._histograms.items()}
+        return {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in sorted(counters.items())],
+            "histograms": [
+                {"name": name, "labels": dict(labels), "count": count, "sum_s": total,
+                 "p50_s": p50, "p90_s": p90, "p99_s": p99, "buckets": dict(zip(map(str, LATENCY_BUCKETS), counts))}
+                for (name, labels), (counts, total, count, p50, p90, p99) in sorted(histograms.items())
+            ],
+        }
+
+    def dump(self, path):
+        """Write the snapshot atomically (readers never see a partial file)."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp, path)
+
+    def prometheus(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h.counts), h.sum, h.count)) for key, h in self._histograms.items())
+        lines, described = [], set()
+
+        def describe(name):
+            if name not in described:
+                described.add(name)
+                kind, text = HELP.get(name, ("untyped", name))
+                lines.extend([f"# HELP {PREFIX}{name} {text}", f"# TYPE {PREFIX}{name} {kind}"])
+
+        for (name, labels), value in counters:
+            describe(name)
+            lines.append(f"{PREFIX}{name}{_labels(labels)} {value:g}")
+        for (name, labels), (counts, total, count) in histograms:
+            describe(name)
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+                cumulative += n
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {total:.6g}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
+
+
+# ===============================
+# Sampling profiler for slow requests
+# ===============================
+class SlowRequestProfiler:
+    """
+    Samples the stacks of threads inside a request every `interval_ms`.
+
+    When a request finishes slower than `threshold_ms`, its samples are
+    appended to `path` as collapsed stacks ("outer;inner;leaf count").
+    Faster requests are discarded. The sampling thread runs only while the
+    profiler exists, and walks only the threads currently inside a request.
+    """
+
+    def __init__(self, threshold_ms=100.0, interval_ms=5.0, path=PROFILE_PATH):
+        self.threshold = threshold_ms / 1000.0
+        self.interval = interval_ms / 1000.0
+        self.path = path
+        self.slow_requests = 0
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._sample, name="slow-request-profiler", daemon=True)
+        self._thread.start()
+
+    def begin(self):
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+
+    def end(self, elapsed):
+        """Finish the calling thread's request; True if it was slow (and written)."""
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), None)
+        if elapsed < self.threshold or not stacks:
+            return elapsed >= self.threshold
+        with self._lock:
+            self.slow_requests += 1
+            with open(self.path, "a") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in stacks.items())
+        return True
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for ident, stacks in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[_collapse(frame)] += 1
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _dump_every(path, interval):
+    while True:
+        time.sleep(interval)
+        METRICS.dump(path)
+
+
+def start_json_dump(path, interval=60.0):
+    """Dump METRICS to `path` every `interval` seconds on a daemon thread."""
+    thread = threading.Thread(target=_dump_every, args=(path, interval), name="metrics-dump", daemon=True)
+    thread.start()
+    return thread
+
+
+# Process-wide registry; DISEASE_METRICS=1 enables it without code changes
+METRICS = Metrics(enabled=os.environ.get("DISEASE_METRICS", "").lower() in ("1", "true", "yes"))
+_configured = False
+
+
+def enable(dump_path=None, dump_interval=60.0, profile_slow_ms=None, profile_path=PROFILE_PATH):
+    """Turn METRICS on, optionally with a periodic JSON dump and the slow-request profiler."""
+    global _configured
+    METRICS.enabled = True
+    if _configured:
+        return METRICS
+    _configured = True
+    if dump_path:
+        start_json_dump(dump_path, dump_interval)
+    if profile_slow_ms is not None:
+        METRICS.profiler = SlowRequestProfiler(profile_slow_ms, path=profile_path)
+    return METRICS
+
+
+def configure_from_env():
+    """enable() from DISEASE_METRICS* environment variables (idempotent); no-op when unset."""
+    if not METRICS.enabled:
+        return METRICS
+    slow_ms = os.environ.get("DISEASE_METRICS_PROFILE_SLOW_MS")
+    return enable(
+        dump_path=os.environ.get("DISEASE_METRICS_DUMP"),
+        dump_interval=float(os.environ.get("DISEASE_METRICS_DUMP_INTERVAL", 60)),
+        profile_slow_ms=float(slow_ms) if slow_ms else None,
+        profile_path=os.environ.get("DISEASE_METRICS_PROFILE_PATH", PROFILE_PATH),
+    )
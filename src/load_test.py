@@ -0,0 +1,112 @@
+# src/load_test.py
+"""
+Local load generator for the prediction service.
+
+Opens `--concurrency` keep-alive connections that each send requests back to
+back, then reports throughput and p50/p90/p99 latency.
+
+    python src/load_test.py --url http://127.0.0.1:8000 --concurrency 32 --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+from data_generation import generate_chunk
+from preprocessing import FEATURE_COLUMNS
+
+
+def sample_patients(count, seed=7):
+    """Synthetic request payloads drawn from the training distribution."""
+    df = generate_chunk(count, seed=seed)[FEATURE_COLUMNS]
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict("records")
+
+
+async def _client(host, port, path, bodies, counter, total, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            i = counter[0]
+            if i >= total:
+                break
+            counter[0] += 1
+            body = bodies[i % len(bodies)]
+            start = time.perf_counter()
+            writer.write(
+                f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors[0] += 1
+    finally:
+        writer.close()
+
+
+async def run_load(url, concurrency=32, total=5000, batch_size=1):
+    """Drive the service and return a summary dict."""
+    parsed = urlparse(url)
+    host, port = parsed.hostname, parsed.port or 80
+    patients = sample_patients(max(1000, batch_size))
+    if batch_size == 1:
+        path = "/predict"
+        bodies = [json.dumps(p).encode() for p in patients]
+    else:
+        path = "/predict/batch"
+        bodies = [json.dumps({"patients": patients[i:i + batch_size]}).encode()
+                  for i in range(0, len(patients) - batch_size + 1, batch_size)]
+
+    counter, latencies, errors = [0], [], [0]
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _client(host, port, path, bodies, counter, total, latencies, errors)
+        for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "concurrency": concurrency,
+        "batch_size": batch_size,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "patients_per_sec": round(len(latencies) * batch_size / elapsed, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p90_ms": round(float(np.percentile(ms, 90)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load-test the prediction service.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=32, help="parallel connections")
+    parser.add_argument("--requests", type=int, default=5000, help="total requests")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="patients per request (>1 uses /predict/batch)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    summary = asyncio.run(run_load(args.url, args.concurrency, args.requests, args.batch_size))
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,144 @@
+# src/model_registry.py
+"""
+Model registry: find the current best pipeline through models/manifest.json.
+
+model_training.py writes the manifest next to the pipeline artifact. Loaded
+pipelines are cached per process and only reloaded when the artifact's
+mtime/size changes *and* its content hash differs, so repeated calls (e.g.
+on every Streamlit rerun) cost a couple of stat() calls.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from preprocessing import load_pipeline
+
+MODEL_DIR = "models"
+MANIFEST_NAME = "manifest.json"
+DEFAULT_ARTIFACT = "model_pipeline.pkl"
+# libsvm's predict only accepts writable arrays, so these models are loaded without mmap
+NO_MMAP_MODELS = {"SVC"}
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_path(model_dir=MODEL_DIR):
+    return os.path.join(model_dir, MANIFEST_NAME)
+
+
+def write_manifest(model_dir, model_name, artifact=DEFAULT_ARTIFACT, metrics=None, **extra):
+    """Record `artifact` (relative to model_dir) as the current best model."""
+    artifact_path = os.path.join(model_dir, artifact)
+    manifest = {
+        "best_model": model_name,
+        "artifact": artifact,
+        "sha256": file_sha256(artifact_path),
+        "size_bytes": os.path.getsize(artifact_path),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "metrics": metrics or {},
+        **extra,
+    }
+    tmp_path = manifest_path(model_dir) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path(model_dir))
+    return manifest
+
+
+def read_manifest(model_dir=MODEL_DIR):
+    """Return the manifest dict, or None if training hasn't written one."""
+    try:
+        with open(manifest_path(model_dir)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def current_artifact_path(model_dir=MODEL_DIR):
+    manifest = read_manifest(model_dir)
+    artifact = manifest["artifact"] if manifest else DEFAULT_ARTIFACT
+    return os.path.join(model_dir, artifact)
+
+
+def load_current(model_dir=MODEL_DIR, mmap_mode="r"):
+    """
+    Return the current pipeline, loading it at most once per artifact version.
+
+    Large numpy arrays inside the pickle are memory-mapped (mmap_mode="r")
+    instead of copied into each process.
+    """
+    return load_artifact(current_artifact_path(model_dir), mmap_mode)
+
+
+def load_artifact(path, mmap_mode="r"):
+    """Cached load of one pipeline artifact (see load_current)."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _lock:
+        entry = _cache.get(path)
+        if entry and entry["signature"] == signature:
+            return entry["pipeline"]
+
+        sha = file_sha256(path)
+        if entry and entry["sha256"] == sha:
+            # touched but unchanged: keep the loaded pipeline
+            entry["signature"] = signature
+            return entry["pipeline"]
+
+        pipeline = load_pipeline(path, mmap_mode=mmap_mode)
+        if mmap_mode and type(pipeline["model"]).__name__ in NO_MMAP_MODELS:
+            pipeline = load_pipeline(path)
+        pipeline["sha256"] = sha  # identifies this model version (e.g. prediction cache keys)
+        _cache[path] = {"signature": signature, "sha256": sha, "pipeline": pipeline}
+        return pipeline
+
+
+def flat_model_path(model_dir=MODEL_DIR):
+    """Directory of the current model's flat export, or None if it has none."""
+    manifest = read_manifest(model_dir)
+    if not manifest or not manifest.get("flat_model"):
+        return None
+    return os.path.join(model_dir, manifest["flat_model"])
+
+
+def load_flat_current(model_dir=MODEL_DIR):
+    """
+    Return the current model's FlatTreePredictor, or None without a flat export.
+
+    Needs neither sklearn nor joblib, so it is the fast cold-start path for
+    serving. Cached like load_artifact, keyed on the export's meta.json.
+    """
+    path = flat_model_path(model_dir)
+    if path is None:
+        return None
+    from flat_predictor import META_NAME, FlatTreePredictor
+
+    path = os.path.abspath(path)
+    stat = os.stat(os.path.join(path, META_NAME))
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        entry = _cache.get(path)
+        if entry is None or entry["signature"] != signature:
+            predictor = FlatTreePredictor.load(path)
+            predictor.sha256 = read_manifest(model_dir)["sha256"]
+            entry = {"signature": signature, "predictor": predictor}
+            _cache[path] = entry
+        return entry["predictor"]
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
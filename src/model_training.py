@@ -1,120 +1,400 @@
-import pandas as pd
+import argparse
+import hashlib
+import importlib
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-import joblib
+import pandas as pd
 
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
+from sklearn.model_selection import StratifiedKFold, train_test_split
 from sklearn.metrics import accuracy_score, f1_score
 
-from sklearn.linear_model import LogisticRegression
-from sklearn.naive_bayes import GaussianNB
-from sklearn.svm import SVC
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+from dataset_io import DATA_PATH, read_dataset
+from drift import REFERENCE_NAME, DriftProfile
+from ensemble import ENSEMBLE_DIR, save_members
+from model_registry import MODEL_DIR, file_sha256, write_manifest
+from preprocessing import CATEGORICAL_COLUMNS, PIPELINE_PATH, TARGET_COLUMN, Preprocessor, save_pipeline
+from resampling import K_NEIGHBORS, METHODS as RESAMPLE_METHODS, plan_resampling
+from tree_export import FLAT_MODEL_DIR, export_pipeline, supports
+
+RESULTS_PATH = "models/model_comparison_results.csv"
+RANDOM_STATE = 42
 
 
 # ===============================
-# Load Dataset
+# Define Models
 # ===============================
-DATA_PATH = "data/patient_symptoms_dataset.csv"
+def _estimator(path, **params):
+    """Build `module.Class(**params)`, importing the estimator's module on first use."""
+    module, name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module), name)(**params)
+
+
+# Factories rather than instances so every job builds a fresh, unfitted model
+# (and only the selected candidates' estimator modules get imported)
+models = {
+    "Logistic Regression": lambda: _estimator("sklearn.linear_model.LogisticRegression", max_iter=1000),
+    "Naive Bayes": lambda: _estimator("sklearn.naive_bayes.GaussianNB"),
+    "Support Vector Machine": lambda: _estimator("sklearn.svm.SVC", kernel="rbf", probability=True),
+    "Random Forest": lambda: _estimator("sklearn.ensemble.RandomForestClassifier",
+                                        random_state=RANDOM_STATE),
+    "Gradient Boosting": lambda: _estimator("sklearn.ensemble.GradientBoostingClassifier",
+                                            random_state=RANDOM_STATE),
+    "Hist Gradient Boosting": lambda: _estimator(
+        "sklearn.ensemble.HistGradientBoostingClassifier",
+        categorical_features=CATEGORICAL_COLUMNS, random_state=RANDOM_STATE,
+    ),
+}
 
-df = pd.read_csv(DATA_PATH)
+# Candidates with built-in missing-value support: trained on un-imputed features
+NATIVE_MISSING = {"Hist Gradient Boosting"}
+
+# Reference model for the Speedup column of the comparison table
+SPEEDUP_BASELINE = "Gradient Boosting"
+# Successive halving ranks candidates on this stratified slice of the training
+# split (never the test split, which stays held out for the final comparison)
+HALVING_VALIDATION_FRACTION = 0.2
+HALVING_VALIDATION_MAX_ROWS = 50_000
 
-# Drop non-predictive ID column if present
-if "Patient_ID" in df.columns:
-    df.drop(columns=["Patient_ID"], inplace=True)
 
 # ===============================
-# Handle Missing Values
+# Worker Jobs
 # ===============================
-for col in df.columns:
-    if df[col].dtype == "object":
-        df[col] = df[col].fillna(df[col].mode()[0])
+# Training data is handed to each worker process once (pool initializer)
+_data = {}
+
+
+def _init_worker(data, params=None, resample=None):
+    X_train, y_train, X_test, y_test, X_train_raw, X_test_raw = (tuple(data) + (None, None))[:6]
+    _data.update(X_train=X_train, y_train=y_train, X_test=X_test, y_test=y_test,
+                 X_train_raw=X_train_raw, X_test_raw=X_test_raw, params=params or {},
+                 resample=resample or {}, n_classes=int(max(y_train.max(), y_test.max())) + 1)
+
+
+def _fit_and_score(job):
+    """
+    Fit one candidate on the given training rows and score it.
+
+    job = (model name, stage label, train row indices or None for all rows,
+    evaluation set: "test" or held-out training row indices, return model?)
+
+    With resampling enabled only the fitting rows are rebalanced; SMOTE
+    neighbours are searched on the imputed features even for models that
+    are fitted on the raw ones.
+    """
+    name, stage, train_idx, eval_on, keep_model = job
+    suffix = "_raw" if name in NATIVE_MISSING else ""
+    X, y = _data["X_train" + suffix], _data["y_train"]
+    if train_idx is not None:
+        X_fit, y_fit = X.iloc[train_idx], y[train_idx]
     else:
-        df[col] = df[col].fillna(df[col].median())
+        X_fit, y_fit = X, y
+    if isinstance(eval_on, str):
+        X_eval, y_eval = _data["X_test" + suffix], _data["y_test"]
+    else:
+        X_eval, y_eval = X.iloc[eval_on], y[eval_on]
 
-# ===============================
-# Encode Categorical Features
-# ===============================
-feature_encoders = {}
+    resample = _data["resample"]
+    if resample:
+        start = time.perf_counter()
+        X_plan = _data["X_train"] if train_idx is None else _data["X_train"].iloc[train_idx]
+        plan = plan_resampling(X_plan, y_fit, resample["method"], k=resample.get("k", K_NEIGHBORS),
+                               random_state=RANDOM_STATE)
+        X_fit, y_fit = plan.apply(X_fit, y_fit)
+        resample_time = time.perf_counter() - start
 
-categorical_cols = df.select_dtypes(include=["object"]).columns.tolist()
-categorical_cols.remove("Disease")
+    model = models[name]().set_params(**_data["params"].get(name, {}))
+    start = time.perf_counter()
+    model.fit(X_fit, y_fit)
+    fit_time = time.perf_counter() - start
 
-for col in categorical_cols:
-    le = LabelEncoder()
-    df[col] = le.fit_transform(df[col])
-    feature_encoders[col] = le
+    start = time.perf_counter()
+    y_pred = model.predict(X_eval)
+    predict_time = time.perf_counter() - start
 
-# Encode target
-target_encoder = LabelEncoder()
-df["Disease"] = target_encoder.fit_transform(df["Disease"])
+    result = {
+        "Model": name,
+        "Stage": stage,
+        "Train_Rows": len(y_fit),
+        "Accuracy": accuracy_score(y_eval, y_pred),
+        "F1_Score": f1_score(y_eval, y_pred, average="weighted"),
+        "Class_F1": f1_score(y_eval, y_pred, average=None, labels=np.arange(_data["n_classes"]),
+                             zero_division=0),
+        "Fit_Time_s": fit_time,
+        "Predict_Time_s": predict_time,
+        "model": model if keep_model else None,
+    }
+    if resample:
+        result["Resample_Time_s"] = resample_time
+    return result
 
-# ===============================
-# Train-Test Split
-# ===============================
-X = df.drop(columns=["Disease"])
-y = df["Disease"]
 
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, stratify=y
-)
+def run_jobs(jobs, n_jobs, data, params=None, resample=None):
+    """
+    Run jobs on a process pool (or inline for n_jobs=1); results keep job order.
+    params: {model name: hyperparameters} overriding the factory defaults.
+    resample: {"method": over|under|smote, "k": SMOTE neighbours} to rebalance fitting rows.
+    """
+    if n_jobs <= 1:
+        _init_worker(data, params, resample)
+        return [_fit_and_score(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                             initargs=(data, params, resample)) as executor:
+        return list(executor.map(_fit_and_score, jobs))
 
-# ===============================
-# Define Models
-# ===============================
-models = {
-    "Logistic Regression": LogisticRegression(max_iter=1000),
-    "Naive Bayes": GaussianNB(),
-    "Support Vector Machine": SVC(kernel="rbf", probability=True),
-    "Random Forest": RandomForestClassifier(random_state=42),
-    "Gradient Boosting": GradientBoostingClassifier(random_state=42),
-}
 
 # ===============================
-# Model Training & Evaluation
+# Bake-off Strategies
 # ===============================
-results = []
+def cv_jobs(names, y_train, folds):
+    """One job per (candidate, fold) of a stratified k-fold over the training split."""
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=RANDOM_STATE)
+    splits = list(splitter.split(np.zeros(len(y_train)), y_train))
+    return [(name, f"cv{k}", train_idx, test_idx, False)
+            for name in names for k, (train_idx, test_idx) in enumerate(splits)]
 
-print("\n=== Model Comparison Results ===\n")
 
-for name, model in models.items():
-    model.fit(X_train, y_train)
-    y_pred = model.predict(X_test)
+def successive_halving(names, y_train, n_jobs, data, min_rows, eta, params=None, resample=None):
+    """
+    Fit every candidate on a small random subsample, keep the best 1/eta
+    by F1, grow the subsample eta-fold and repeat until full size.
 
-    acc = accuracy_score(y_test, y_pred)
-    f1 = f1_score(y_test, y_pred, average="weighted")
+    Rounds are scored on a stratified validation slice of the training
+    split, and subsamples are drawn from the rest of it.
 
-    results.append({
-        "Model": name,
-        "Accuracy": round(acc, 4),
-        "F1_Score": round(f1, 4)
-    })
+    Returns (surviving candidate names, per-round results of pruned ones).
+    """
+    n_validation = min(int(len(y_train) * HALVING_VALIDATION_FRACTION), HALVING_VALIDATION_MAX_ROWS)
+    fit_rows, validation = train_test_split(np.arange(len(y_train)), test_size=n_validation,
+                                            random_state=RANDOM_STATE, stratify=y_train)
+    validation = np.sort(validation)
+    rng = np.random.default_rng(RANDOM_STATE)
+    order = rng.permutation(fit_rows)
+    survivors, history = list(names), []
 
-    print(f"{name}")
-    print(f"  Accuracy : {acc:.4f}")
-    print(f"  F1-score : {f1:.4f}\n")
+    rows = min_rows
+    while rows < len(order) and len(survivors) > 1:
+        subsample = np.sort(order[:rows])
+        results = run_jobs([(name, f"halving@{rows}", subsample, validation, False) for name in survivors],
+                           n_jobs, data, params, resample)
+        results.sort(key=lambda r: r["F1_Score"], reverse=True)
+        keep = max(1, math.ceil(len(survivors) / eta))
+        print(f"  {rows:>9} rows: promoted {[r['Model'] for r in results[:keep]]}")
 
-# ===============================
-# Results Table
-# ===============================
-results_df = pd.DataFrame(results)
-results_df = results_df.sort_values(by="F1_Score", ascending=False)
+        for r in results[keep:]:
+            history.append(r)
+        survivors = [r["Model"] for r in results[:keep]]
+        rows *= eta
+    return survivors, history
 
-print("\n=== Final Comparison Table ===")
-print(results_df)
 
-# Save comparison table for paper
-results_df.to_csv("models/model_comparison_results.csv", index=False)
+def dataset_key(path, seed=RANDOM_STATE):
+    """Identifies a dataset (file or directory of parts) and split seed, e.g. in tuned_params.json."""
+    if os.path.isdir(path):
+        parts = [[name, file_sha256(os.path.join(path, name))]
+                 for name in sorted(os.listdir(path)) if name.endswith(".parquet")]
+        digest = hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+    else:
+        digest = file_sha256(path)
+    return f"{digest}:{seed}"
 
-# ===============================
-# Save Best Model
-# ===============================
-best_model_name = results_df.iloc[0]["Model"]
-best_model = models[best_model_name]
 
-joblib.dump(best_model, f"models/{best_model_name}_model.pkl")
-joblib.dump(feature_encoders, "models/feature_encoders.pkl")
-joblib.dump(target_encoder, "models/target_encoder.pkl")
+def summarize(results, cv_results, class_names=None):
+    """Comparison table: one row per candidate, sorted by F1, with per-class F1 columns."""
+    rows = []
+    for r in results:
+        row = {k: v for k, v in r.items() if k not in ("model", "Class_F1")}
+        names = class_names if class_names is not None else range(len(r["Class_F1"]))
+        row.update({f"F1_{name}": f1 for name, f1 in zip(names, r["Class_F1"])})
+        rows.append(row)
+    table = pd.DataFrame(rows)
+    if cv_results:
+        cv = pd.DataFrame(cv_results).groupby("Model").agg(
+            CV_F1_Mean=("F1_Score", "mean"),
+            CV_F1_Std=("F1_Score", "std"),
+            CV_Fit_Time_s=("Fit_Time_s", "mean"),
+        )
+        table = table.merge(cv, left_on="Model", right_index=True, how="left")
+    baseline = table[(table["Model"] == SPEEDUP_BASELINE) & (table["Stage"] == "full")]
+    if len(baseline):
+        # fit-time speedup relative to the exact gradient boosting baseline; pruned
+        # (halving) rows were fit on fewer rows, so they get NaN rather than a false speedup
+        full = table["Stage"] == "full"
+        table[f"Speedup_vs_{SPEEDUP_BASELINE.replace(' ', '_')}"] = (
+            baseline["Fit_Time_s"].iloc[0] / table["Fit_Time_s"].where(full)
+        )
+    sort_by = "CV_F1_Mean" if cv_results else "F1_Score"
+    table = table.sort_values(by=[sort_by, "F1_Score"], ascending=False, na_position="last")
+    return table.round(4).reset_index(drop=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train and compare the candidate models.")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="worker processes (one job per candidate and fold)")
+    parser.add_argument("--cv", type=int, default=0, metavar="K",
+                        help="also run stratified K-fold CV on the training split and rank by CV F1")
+    parser.add_argument("--halving", action="store_true",
+                        help="successive halving: prune candidates on subsamples before full-size training")
+    parser.add_argument("--halving-min-rows", type=int, default=2000)
+    parser.add_argument("--halving-eta", type=int, default=3)
+    parser.add_argument("--models", default=",".join(models),
+                        help="comma-separated candidate names")
+    parser.add_argument("--production-model", default=None,
+                        help="save this candidate instead of the best-ranked one")
+    parser.add_argument("--tuned-params", default=None, metavar="PATH",
+                        help="hyperparameters from tuning.py (models/tuned_params.json)")
+    parser.add_argument("--resample", default=None, choices=RESAMPLE_METHODS,
+                        help="rebalance the classes of the fitting rows (see src/resampling.py)")
+    parser.add_argument("--smote-neighbors", type=int, default=K_NEIGHBORS)
+    parser.add_argument("--save-ensemble", action="store_true",
+                        help=f"also save every fully trained candidate to {ENSEMBLE_DIR}/ (see src/ensemble.py)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    candidates = [name.strip() for name in args.models.split(",") if name.strip()]
+    unknown = set(candidates) - set(models)
+    if args.production_model:
+        unknown |= {args.production_model} - set(models)
+    if unknown:
+        raise SystemExit(f"Unknown models: {sorted(unknown)}; choose from {list(models)}")
+    if args.save_ensemble and len(candidates) < 2:
+        raise SystemExit("--save-ensemble needs at least 2 candidate models")
+
+    tuned = {}
+    if args.tuned_params:
+        with open(args.tuned_params) as f:
+            entries = {name: entry for name, entry in json.load(f).items() if name in candidates}
+        keys = {}
+        for name, entry in entries.items():
+            # params tuned on another dataset don't carry over: train those models with defaults
+            seed = int(entry.get("dataset", ":0").rpartition(":")[2])
+            if seed not in keys:
+                keys[seed] = dataset_key(args.data, seed)
+            if entry.get("dataset") != keys[seed]:
+                print(f"⚠️ {name}: tuned on a different dataset than {args.data}; using default parameters")
+                continue
+            tuned[name] = entry["params"]
+            print(f"Tuned {name}: {entry['params']}")
+
+    # ===============================
+    # Load Dataset
+    # ===============================
+    df = read_dataset(args.data)
+
+    # ===============================
+    # Fit Preprocessing (imputation + encoding)
+    # ===============================
+    preprocessor = Preprocessor()
+
+    X = preprocessor.fit_transform(df)
+    y = preprocessor.encode_target(df[TARGET_COLUMN])
+    X_raw = preprocessor.transform(df, impute=False) if NATIVE_MISSING & set(candidates) else None
+    # reference distribution for the serving-time drift monitor
+    reference = DriftProfile().update(df)
+    del df
+
+    # ===============================
+    # Train-Test Split
+    # ===============================
+    train_idx, test_idx = train_test_split(
+        np.arange(len(y)), test_size=0.2, random_state=RANDOM_STATE, stratify=y
+    )
+    data = (X.iloc[train_idx], y[train_idx], X.iloc[test_idx], y[test_idx])
+    if X_raw is not None:
+        data += (X_raw.iloc[train_idx], X_raw.iloc[test_idx])
+    y_train = data[1]
+    del X, X_raw
+
+    # ===============================
+    # Model Training & Evaluation
+    # ===============================
+    resample = {"method": args.resample, "k": args.smote_neighbors} if args.resample else None
+    start = time.perf_counter()
+    pruned = []
+    if args.halving:
+        print("\n=== Successive Halving ===\n")
+        candidates, pruned = successive_halving(candidates, y_train, args.jobs, data,
+                                                args.halving_min_rows, args.halving_eta, tuned, resample)
+
+    jobs = [(name, "full", None, "test", True) for name in candidates]
+    if args.cv:
+        jobs += cv_jobs(candidates, y_train, args.cv)
+    job_results = run_jobs(jobs, args.jobs, data, tuned, resample)
+
+    results = [r for r in job_results if r["Stage"] == "full"]
+    cv_results = [r for r in job_results if r["Stage"].startswith("cv")]
+    fitted = {r["Model"]: r["model"] for r in results}
+
+    print("\n=== Model Comparison Results ===\n")
+    for r in results:
+        print(f"{r['Model']}")
+        print(f"  Accuracy : {r['Accuracy']:.4f}")
+        print(f"  F1-score : {r['F1_Score']:.4f}")
+        print(f"  Fit time : {r['Fit_Time_s']:.2f}s  Predict time : {r['Predict_Time_s']:.3f}s")
+        if "Resample_Time_s" in r:
+            print(f"  Resampled: {r['Train_Rows']} rows ({args.resample}) in {r['Resample_Time_s']:.2f}s")
+        print(f"  F1 per class: {dict(zip(preprocessor.classes_, np.round(r['Class_F1'], 4)))}\n")
+
+    # ===============================
+    # Results Table
+    # ===============================
+    results_df = summarize(results + pruned, cv_results, preprocessor.classes_)
+
+    print("\n=== Final Comparison Table ===")
+    print(results_df)
+    print(f"\nTotal training wall time: {time.perf_counter() - start:.1f}s")
+
+    # Save comparison table for paper
+    results_df.to_csv(RESULTS_PATH, index=False)
+
+    # ===============================
+    # Save Best Model
+    # ===============================
+    full_rows = results_df[results_df["Stage"] == "full"]
+    if args.production_model:
+        if args.production_model not in fitted:
+            raise SystemExit(f"{args.production_model} was pruned or not trained; nothing to save")
+        full_rows = full_rows[full_rows["Model"] == args.production_model]
+    best_row = full_rows.iloc[0]
+    best_model_name = best_row["Model"]
+    best_model = fitted[best_model_name]
+
+    pipeline = save_pipeline(best_model, preprocessor, best_model_name, PIPELINE_PATH,
+                             impute=best_model_name not in NATIVE_MISSING)
+
+    extra = {"hyperparameters": tuned.get(best_model_name, {})}
+    if resample:
+        extra["resampling"] = resample
+    reference.save(os.path.join(MODEL_DIR, REFERENCE_NAME))
+    extra["reference_profile"] = REFERENCE_NAME
+    if args.save_ensemble and len(fitted) < 2:
+        # e.g. --halving pruned all but one candidate: a one-member "ensemble" is just that model
+        print(f"⚠️ Only {len(fitted)} model trained on the full data; ensemble not saved")
+    elif args.save_ensemble:
+        save_members(fitted, preprocessor, results, ENSEMBLE_DIR, NATIVE_MISSING)
+        extra["ensemble"] = os.path.relpath(ENSEMBLE_DIR, MODEL_DIR)
+        print(f" {len(fitted)} ensemble members saved to {ENSEMBLE_DIR}/")
+    # Flat numpy export for the sklearn-free predictor (tree ensembles only)
+    if supports(best_model):
+        export_pipeline(pipeline, FLAT_MODEL_DIR)
+        extra["flat_model"] = os.path.relpath(FLAT_MODEL_DIR, MODEL_DIR)
+        print(f" Flat tree export saved to {FLAT_MODEL_DIR}/")
+
+    write_manifest(
+        MODEL_DIR,
+        best_model_name,
+        artifact=os.path.basename(PIPELINE_PATH),
+        metrics={k: float(v) for k, v in best_row.drop(["Model", "Stage"]).dropna().items()},
+        **extra,
+    )
 
-print(f"\n Best Model Selected: {best_model_name}")
-print(" Model and encoders saved successfully!")
+    print(f"\n Best Model Selected: {best_model_name}")
+    print(f" Model and preprocessing pipeline saved to {PIPELINE_PATH}!")
@@ -0,0 +1,409 @@
+# src/pipeline.py
+"""
+Incremental runner for the generate -> train -> visualize workflow.
+
+Every stage declares its input files, parameters and outputs; its code is
+the script plus every src/ module it imports, directly or transitively
+(found by parsing the imports, so a new dependency needs no bookkeeping).
+A stage's fingerprint is the hash of all of these; a stage is skipped when
+its outputs on disk were produced for the current fingerprint, restored
+from the artifact cache when an earlier run produced them, and only run
+otherwise. The cache keeps stage outputs per fingerprint and evicts the
+least recently used entries above a size limit.
+
+    python src/pipeline.py                       # run whatever is stale
+    python src/pipeline.py visualize --dpi 150   # re-render plots only
+    python src/pipeline.py --status
+
+Only the standard library is imported here, so an up-to-date run costs a
+few stat() calls and hashes of the (small) code files.
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from importlib import metadata
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = "src"
+CACHE_DIR = ".cache/pipeline"
+CACHE_SIZE_MB = 2048
+
+# Mirrors dataset_io / preprocessing / model_training defaults; importing those
+# modules would pull in pandas and sklearn just to decide that nothing changed
+DATA_PATH = "data/patient_symptoms_dataset.parquet"
+PIPELINE_PATH = "models/model_pipeline.pkl"
+ENSEMBLE_DIR = "models/ensemble"
+REFERENCE_PATH = "models/reference_profile.json"
+
+
+# ===============================
+# Stages
+# ===============================
+def local_imports(script, src_dir=SRC_DIR):
+    """`script` plus every module in src_dir it imports, transitively, sorted."""
+    seen, todo = set(), [script]
+    while todo:
+        path = todo.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        with open(path) as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module = os.path.join(src_dir, name.split(".")[0] + ".py")
+                if os.path.exists(module):
+                    todo.append(module)
+    return sorted(seen)
+
+
+class Stage:
+    """One step of the workflow: a script run with fixed arguments."""
+
+    def __init__(self, name, script, args=(), params=None, inputs=(), code=(), outputs=(), packages=()):
+        self.name = name
+        self.script = script
+        self.args = list(args)
+        self.params = params or {}
+        self.inputs = list(inputs)
+        # extra code files on top of the script's local imports (e.g. data files it reads)
+        self.extra_code = list(code)
+        self.outputs = list(outputs)
+        self.packages = list(packages)
+
+    @property
+    def code(self):
+        return local_imports(self.script) + self.extra_code
+
+    def command(self):
+        return [sys.executable, self.script, *self.args]
+
+
+def build_stages(args):
+    generate = Stage(
+        "generate", "src/data_generation.py",
+        args=["--rows", args.rows, "--seed", args.seed, "--chunk-size", args.chunk_size,
+              "--jobs", args.jobs, "--output", DATA_PATH],
+        # jobs only changes speed, not output, so it is not a parameter
+        params={"rows": args.rows, "seed": args.seed, "chunk_size": args.chunk_size},
+        outputs=[DATA_PATH],
+        packages=["numpy", "pandas", "pyarrow"],
+    )
+
+    train_args = ["--data", DATA_PATH, "--jobs", args.jobs, "--models", args.models]
+    if args.cv:
+        train_args += ["--cv", args.cv]
+    if args.halving:
+        train_args += ["--halving"]
+    if args.production_model:
+        train_args += ["--production-model", args.production_model]
+    if args.save_ensemble:
+        train_args += ["--save-ensemble"]
+    train = Stage(
+        "train", "src/model_training.py",
+        args=train_args,
+        params={"models": args.models, "cv": args.cv, "halving": args.halving,
+                "production_model": args.production_model, "save_ensemble": args.save_ensemble},
+        inputs=[DATA_PATH],
+        # the ensemble directory is declared even when not saved, so a stale one is cleared on restore
+        outputs=[PIPELINE_PATH, "models/manifest.json", "models/model_comparison_results.csv",
+                 "models/flat_model", REFERENCE_PATH, ENSEMBLE_DIR],
+        packages=["scikit-learn", "numpy", "pandas"],
+    )
+
+    visualize = Stage(
+        "visualize", "src/visualization.py",
+        args=["--data", DATA_PATH, "--output-dir", "visuals", "--dpi", args.dpi],
+        params={"dpi": args.dpi},
+        inputs=[DATA_PATH, PIPELINE_PATH, "models/manifest.json"],
+        outputs=["visuals/confusion_matrix.png", "visuals/feature_importance.png",
+                 "visuals/feature_distributions.png", "visuals/evaluation_metrics.csv"],
+        packages=["scikit-learn", "matplotlib", "seaborn"],
+    )
+    for stage in (generate, train, visualize):
+        stage.args = [str(a) for a in stage.args]
+    return [generate, train, visualize]
+
+
+# ===============================
+# Fingerprints
+# ===============================
+def _files(path):
+    """Regular files under `path` (itself if it is a file), sorted."""
+    if os.path.isdir(path):
+        return sorted(os.path.join(d, f) for d, _, names in os.walk(path) for f in names)
+    return [path] if os.path.exists(path) else []
+
+
+def signature(path):
+    """Cheap change detector: (relative path, mtime_ns, size) of every file."""
+    return [[os.path.relpath(f, path) if f != path else "", os.stat(f).st_mtime_ns, os.stat(f).st_size]
+            for f in _files(path)]
+
+
+class FileHasher:
+    """sha256 of files, memoized on (mtime_ns, size) across runs."""
+
+    def __init__(self, memo=None):
+        self.memo = memo or {}
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        key = [stat.st_mtime_ns, stat.st_size]
+        cached = self.memo.get(path)
+        if cached and cached[:2] == key:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.memo[path] = key + [digest.hexdigest()]
+        return digest.hexdigest()
+
+    def hash(self, path):
+        files = _files(path)
+        if not files:
+            raise FileNotFoundError(path)
+        if files == [path]:
+            return self.file_hash(path)
+        return hashlib.sha256(json.dumps([[f, self.file_hash(f)] for f in files]).encode()).hexdigest()
+
+
+def _version(package):
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def fingerprint(stage, hasher):
+    payload = {
+        "stage": stage.name,
+        "params": stage.params,
+        "inputs": {path: hasher.hash(path) for path in stage.inputs},
+        "code": {path: hasher.hash(path) for path in stage.code},
+        "packages": {name: _version(name) for name in stage.packages},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+# ===============================
+# Artifact Cache
+# ===============================
+class ArtifactCache:
+    """
+    Stage outputs stored per fingerprint under `<root>/objects/<fingerprint>/`.
+
+    Each entry has an entry.json with its size and last-used time; once the
+    total size exceeds `max_bytes` the least recently used entries go first.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_SIZE_MB << 20):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _dir(self, key):
+        return os.path.join(self.root, "objects", key)
+
+    def _entry(self, key):
+        try:
+            with open(os.path.join(self._dir(key), "entry.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_entry(self, key, entry):
+        with open(os.path.join(self._dir(key), "entry.json"), "w") as f:
+            json.dump(entry, f, indent=2)
+
+    def put(self, key, stage_name, outputs):
+        """Copy the stage's existing outputs into the cache."""
+        tmp_dir = self._dir(key) + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        stored, size = [], 0
+        for path in outputs:
+            if not os.path.exists(path):
+                continue
+            target = os.path.join(tmp_dir, "files", path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.isdir(path):
+                shutil.copytree(path, target)
+            else:
+                shutil.copy2(path, target)
+            stored.append(path)
+            size += sum(os.path.getsize(f) for f in _files(path))
+        shutil.rmtree(self._dir(key), ignore_errors=True)
+        os.replace(tmp_dir, self._dir(key))
+        self._write_entry(key, {"stage": stage_name, "outputs": stored, "size_bytes": size,
+                                "last_used": time.time()})
+        self.evict()
+
+    def restore(self, key, outputs):
+        """Copy a cached entry's outputs back into place; False on a miss."""
+        entry = self._entry(key)
+        if entry is None:
+            return False
+        for path in outputs:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path) and path not in entry["outputs"]:
+                os.remove(path)
+        for path in entry["outputs"]:
+            source = os.path.join(self._dir(key), "files", path)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            if os.path.isdir(source):
+                shutil.copytree(source, path)
+            else:
+                shutil.copy2(source, path)
+        entry["last_used"] = time.time()
+        self._write_entry(key, entry)
+        return True
+
+    def touch(self, key):
+        entry = self._entry(key)
+        if entry is not None:
+            entry["last_used"] = time.time()
+            self._write_entry(key, entry)
+
+    def entries(self):
+        objects = os.path.join(self.root, "objects")
+        if not os.path.isdir(objects):
+            return []
+        found = []
+        for key in os.listdir(objects):
+            entry = self._entry(key)
+            if entry is not None:
+                found.append((key, entry))
+        return found
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        entries = sorted(self.entries(), key=lambda item: item[1]["last_used"])
+        total = sum(entry["size_bytes"] for _, entry in entries)
+        evicted = []
+        while entries and total > self.max_bytes:
+            key, entry = entries.pop(0)
+            shutil.rmtree(self._dir(key), ignore_errors=True)
+            total -= entry["size_bytes"]
+            evicted.append(key)
+        return evicted
+
+
+# ===============================
+# Runner
+# ===============================
+def _load_state(cache):
+    try:
+        with open(os.path.join(cache.root, "state.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"stages": {}, "hashes": {}}
+
+
+def _save_state(cache, state):
+    os.makedirs(cache.root, exist_ok=True)
+    tmp_path = os.path.join(cache.root, "state.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, os.path.join(cache.root, "state.json"))
+
+
+def _outputs_signature(stage):
+    return {path: signature(path) for path in stage.outputs}
+
+
+def run_pipeline(stages, cache, force=(), dry_run=False):
+    """Bring `stages` up to date in order. Returns [(stage name, action, seconds)]."""
+    state = _load_state(cache)
+    hasher = FileHasher(state["hashes"])
+    report = []
+    for stage in stages:
+        start = time.perf_counter()
+        try:
+            key = fingerprint(stage, hasher)
+        except FileNotFoundError as exc:
+            if not dry_run:
+                raise SystemExit(f"❌ {stage.name}: missing input or code file {exc}")
+            report.append((stage.name, "blocked (missing input)", 0.0))
+            continue
+
+        record = state["stages"].get(stage.name, {})
+        if (stage.name not in force and record.get("fingerprint") == key
+                and record.get("outputs") == _outputs_signature(stage)):
+            action = "up to date"
+            if not dry_run:
+                cache.touch(key)
+        elif dry_run:
+            action = "cached" if stage.name not in force and cache._entry(key) else "stale"
+        elif stage.name not in force and cache.restore(key, stage.outputs):
+            action = "restored from cache"
+        else:
+            print(f"🚀 {stage.name}: {' '.join(stage.command()[1:])}")
+            subprocess.run(stage.command(), check=True)
+            cache.put(key, stage.name, stage.outputs)
+            action = "ran"
+
+        if not dry_run:
+            state["stages"][stage.name] = {"fingerprint": key, "outputs": _outputs_signature(stage)}
+            _save_state(cache, state)
+        report.append((stage.name, action, time.perf_counter() - start))
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the generate/train/visualize workflow incrementally.")
+    parser.add_argument("stages", nargs="*", default=None,
+                        help="stages to bring up to date (default: all; earlier stages are checked too)")
+    parser.add_argument("--force", action="append", default=[], metavar="STAGE",
+                        help="re-run this stage even if cached (repeatable)")
+    parser.add_argument("--status", action="store_true", help="report what would run, change nothing")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--cache-size-mb", type=int, default=CACHE_SIZE_MB)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=1_000_000)
+    parser.add_argument("--models", default="Logistic Regression,Naive Bayes,Support Vector Machine,"
+                                            "Random Forest,Gradient Boosting,Hist Gradient Boosting")
+    parser.add_argument("--cv", type=int, default=0)
+    parser.add_argument("--halving", action="store_true")
+    parser.add_argument("--production-model", default=None)
+    parser.add_argument("--save-ensemble", action="store_true")
+    parser.add_argument("--dpi", type=int, default=300)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    args = parse_args()
+    os.chdir(ROOT_DIR)
+
+    stages = build_stages(args)
+    names = [stage.name for stage in stages]
+    unknown = (set(args.stages or []) | set(args.force)) - set(names)
+    if unknown:
+        raise SystemExit(f"Unknown stages: {sorted(unknown)}; choose from {names}")
+    if args.stages:
+        # a stage depends on every stage before it
+        stages = stages[:max(names.index(name) for name in args.stages) + 1]
+
+    cache = ArtifactCache(args.cache_dir, args.cache_size_mb << 20)
+    report = run_pipeline(stages, cache, force=set(args.force), dry_run=args.status)
+
+    for name, action, seconds in report:
+        print(f"{'✅' if action != 'stale' else '⏳'} {name:<10} {action:<22} {seconds:7.2f}s")
+    print(f"Pipeline finished in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,251 @@
+# src/prediction_cache.py
+"""
+Bounded cache of class probabilities in front of the model.
+
+Keys are the normalized encoded feature vector (float32 bytes, exactly what
+the trees compare) under the model artifact's sha256. A lookup whose model
+key differs from the previous one drops the in-memory entries, so swapping
+the artifact invalidates the cache automatically.
+
+Entries are evicted least-recently-used above `max_entries` and, with a
+TTL, once they are older than `ttl` seconds. An optional SQLite file store
+(`store=path`) is shared by every process pointing at the same file and is
+consulted on in-memory misses.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+MAX_ENTRIES = 100_000
+# Shared-store maintenance (expiry + size bound) runs every N writes
+PRUNE_EVERY = 1000
+
+
+def normalize(X):
+    """Encoded features as canonical float32 rows (-0.0 -> 0.0, one NaN pattern)."""
+    X = np.asarray(X, dtype=np.float32) + np.float32(0.0)
+    X = np.where(np.isnan(X), np.float32(np.nan), X)
+    return np.ascontiguousarray(X)
+
+
+def row_keys(X):
+    return [row.tobytes() for row in normalize(X)]
+
+
+def model_key(pipeline):
+    """Cache namespace of a pipeline (or flat predictor): its artifact hash."""
+    if isinstance(pipeline, dict):
+        return pipeline.get("sha256") or f"{pipeline['model_name']}@{pipeline.get('created')}"
+    return getattr(pipeline, "sha256", None) or str(id(pipeline))
+
+
+class SQLiteStore:
+    """File-backed key/value store shared across processes (WAL mode)."""
+
+    def __init__(self, path, max_entries=MAX_ENTRIES, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connection(self):
+        # sqlite connections must not cross fork(): reconnect in each process
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                         isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                " model TEXT, key BLOB, value BLOB, created REAL, last_used REAL,"
+                " PRIMARY KEY (model, key)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS by_last_used ON predictions (last_used)")
+            self._pid = os.getpid()
+        return self._conn
+
+    def get_many(self, model, keys):
+        """{key: (value bytes, created)} for the keys present and not expired."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT key, value, created FROM predictions WHERE model = ? "
+                    f"AND key IN ({','.join('?' * len(part))})", [model, *part]
+                ).fetchall()
+                for key, value, created in rows:
+                    if self.ttl is None or now - created <= self.ttl:
+                        found[bytes(key)] = (value, created)
+            if found:
+                conn.executemany("UPDATE predictions SET last_used = ? WHERE model = ? AND key = ?",
+                                 [(now, model, key) for key in found])
+        return found
+
+    def put_many(self, model, items):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)",
+                             [(model, key, value, now, now) for key, value in items])
+            self._writes += len(items)
+            if self._writes >= PRUNE_EVERY:
+                self._writes = 0
+                return self._prune(conn, model)
+        return 0
+
+    def _prune(self, conn, model):
+        """Drop other models' entries, expired entries and the LRU overflow."""
+        removed = conn.execute("DELETE FROM predictions WHERE model != ?", [model]).rowcount
+        if self.ttl is not None:
+            removed += conn.execute("DELETE FROM predictions WHERE created < ?",
+                                    [time.time() - self.ttl]).rowcount
+        excess = conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0] - self.max_entries
+        if excess > 0:
+            removed += conn.execute(
+                "DELETE FROM predictions WHERE key IN "
+                "(SELECT key FROM predictions ORDER BY last_used LIMIT ?)", [excess]
+            ).rowcount
+        return removed
+
+    def count(self):
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+
+class PredictionCache:
+    """
+    LRU (optionally TTL-bounded) cache of model outputs per encoded vector.
+
+    lookup() dedupes the batch, answers what it can from memory, then from
+    the shared store, and calls the model once for the remaining vectors.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=None, store=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = SQLiteStore(store, max_entries, ttl) if isinstance(store, str) else store
+        self.model = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ["lookups", "rows", "hits", "store_hits", "misses", "evictions", "expirations",
+             "invalidations", "lookup_seconds", "model_seconds"], 0)
+
+    def _switch_model(self, model):
+        if self.model is not None and model != self.model:
+            self._entries.clear()
+            self._counters["invalidations"] += 1
+        self.model = model
+
+    def lookup(self, model, X, compute):
+        """
+        Model outputs for encoded rows X, computing only uncached vectors.
+
+        compute(rows) receives the subset of X (same type, positional) and must
+        return one output row per input row.
+        """
+        start = time.perf_counter()
+        keys = row_keys(X)
+        unique = list(dict.fromkeys(keys))
+        results = {}
+        now = time.time()
+
+        with self._lock:
+            self._switch_model(model)
+            for key in unique:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                value, created = entry
+                if self.ttl is not None and now - created > self.ttl:
+                    del self._entries[key]
+                    self._counters["expirations"] += 1
+                    continue
+                self._entries.move_to_end(key)
+                results[key] = value
+
+        missing = [key for key in unique if key not in results]
+        if missing and self.store is not None:
+            for key, (value, created) in self.store.get_many(model, missing).items():
+                results[key] = np.frombuffer(value, dtype=np.float64)
+                self._remember(key, results[key], created)
+            self._counters["store_hits"] += len(results) - (len(unique) - len(missing))
+            missing = [key for key in missing if key not in results]
+
+        model_seconds = 0.0
+        if missing:
+            first = {}
+            for i, key in enumerate(keys):
+                first.setdefault(key, i)
+            positions = [first[key] for key in missing]
+            rows = X.iloc[positions] if hasattr(X, "iloc") else np.asarray(X)[positions]
+            model_start = time.perf_counter()
+            computed = np.asarray(compute(rows), dtype=np.float64)
+            model_seconds = time.perf_counter() - model_start
+            for key, value in zip(missing, computed):
+                results[key] = value
+                self._remember(key, value, now)
+            if self.store is not None:
+                self.store.put_many(model, [(key, results[key].tobytes()) for key in missing])
+
+        with self._lock:
+            c = self._counters
+            c["lookups"] += 1
+            c["rows"] += len(keys)
+            c["misses"] += len(missing)
+            c["hits"] += len(keys) - len(missing)
+            c["model_seconds"] += model_seconds
+            c["lookup_seconds"] += time.perf_counter() - start - model_seconds
+        return np.stack([results[key] for key in keys]) if keys else np.empty((0, 0))
+
+    def _remember(self, key, value, created):
+        with self._lock:
+            self._entries[key] = (value, created)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters for sizing: hit rate, evictions and per-row latencies."""
+        with self._lock:
+            c = dict(self._counters)
+            size = len(self._entries)
+        rows, misses = c["rows"], c["misses"]
+        return {
+            "entries": size,
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl,
+            **{k: v for k, v in c.items() if not k.endswith("_seconds")},
+            "hit_rate": round(c["hits"] / rows, 4) if rows else 0.0,
+            "cache_us_per_row": round(c["lookup_seconds"] / rows * 1e6, 2) if rows else 0.0,
+            "model_us_per_miss": round(c["model_seconds"] / misses * 1e6, 2) if misses else 0.0,
+        }
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_cache(max_entries=MAX_ENTRIES, ttl=None, store=None):
+    """Process-wide cache (e.g. shared by every Streamlit rerun)."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = PredictionCache(max_entries, ttl, store)
+        return _default
@@ -0,0 +1,389 @@
+# src/prediction_server.py
+"""
+Standalone HTTP prediction service with request micro-batching.
+
+The current pipeline is loaded from models/ once at startup. Concurrent requests are
+queued and coalesced into micro-batches (bounded by size and wait time), so
+the model gets one vectorized predict_proba call per batch.
+
+    python src/prediction_server.py --port 8000 --max-batch-size 64 --max-wait-ms 5
+    python src/prediction_server.py --ensemble --fast-model auto --fast-threshold 0.95
+
+Endpoints:
+    GET  /health          liveness + batching, prediction-cache and table stats
+    GET  /metrics         stage latencies and prediction counts, Prometheus text (with --metrics)
+    GET  /drift           live-vs-training drift report (with --drift); ?reset=1 starts a new window
+    POST /predict         one patient: {"Age": 45, "Gender": "Male", ...}
+    POST /predict/batch   {"patients": [{...}, {...}]}
+
+Numeric features use dataset units (WBC_Count in cells/µL).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import instrumentation
+from drift import REFERENCE_NAME, DriftMonitor
+from ensemble import ENSEMBLE_DIR, FAST_THRESHOLD, load_ensemble
+from inference import MODEL_PREDICTION_COLUMN, OVERRIDE_COLUMN, PREDICTION_COLUMN, PROBA_PREFIX, score_frame
+from model_registry import MODEL_DIR, current_artifact_path, load_artifact
+from prediction_cache import PredictionCache
+from preprocessing import CATEGORICAL_COLUMNS, FEATURE_COLUMNS
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent scoring requests into batches.
+
+    A batch is flushed as soon as it holds `max_batch_size` patients or the
+    oldest request has waited `max_wait_ms`. Scoring runs on a worker thread
+    so the event loop keeps accepting requests meanwhile.
+    """
+
+    def __init__(self, pipeline, max_batch_size=64, max_wait_ms=5.0, cache=None, monitor=None):
+        self.pipeline = pipeline
+        self.cache = cache
+        self.monitor = monitor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batches = 0
+        self.patients = 0
+
+    async def submit(self, records):
+        """Score a list of patient dicts; resolves once their batch is done."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((records, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            size = len(pending[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                size += len(item[0])
+
+            records = [record for item, _ in pending for record in item]
+            try:
+                results = await loop.run_in_executor(self.executor, self._score, records)
+            except Exception as exc:
+                if len(pending) == 1:
+                    if not pending[0][1].done():
+                        pending[0][1].set_exception(exc)
+                    continue
+                # one request's records broke the batch: score requests separately
+                # so the failure stays with the request that caused it
+                for item, future in pending:
+                    try:
+                        result = await loop.run_in_executor(self.executor, self._score, item)
+                    except Exception as item_exc:
+                        if not future.done():
+                            future.set_exception(item_exc)
+                        continue
+                    self.batches += 1
+                    self.patients += len(item)
+                    if not future.done():
+                        future.set_result(result)
+                continue
+
+            self.batches += 1
+            self.patients += len(records)
+            offset = 0
+            for item, future in pending:
+                if not future.done():
+                    future.set_result(results[offset:offset + len(item)])
+                offset += len(item)
+
+    def _score(self, records):
+        metrics, model = instrumentation.METRICS, self.pipeline["model_name"]
+        with metrics.timer(instrumentation.REQUEST_STAGE, model):
+            warnings = None
+            if self.monitor is not None:
+                with metrics.timer("drift", model):
+                    warnings = self.monitor.observe(records)
+            with metrics.timer("frame", model):
+                df = pd.DataFrame.from_records(records, columns=FEATURE_COLUMNS)
+            scored = score_frame(self.pipeline, df, cache=self.cache)
+            results = self._results(scored)
+        if warnings is not None:
+            for result, row in zip(results, warnings):
+                if row:
+                    result["input_warnings"] = row
+        return results
+
+    @staticmethod
+    def _results(scored):
+        proba_cols = [c for c in scored.columns if c.startswith(PROBA_PREFIX)]
+        classes = [c[len(PROBA_PREFIX):] for c in proba_cols]
+        proba = scored[proba_cols].to_numpy(dtype=float).round(6).tolist()
+        return [
+            {
+                "prediction": prediction,
+                "model_prediction": model_prediction,
+                "healthy_override": override,
+                "probabilities": dict(zip(classes, row)),
+            }
+            for prediction, model_prediction, override, row in zip(
+                scored[PREDICTION_COLUMN].tolist(),
+                scored[MODEL_PREDICTION_COLUMN].tolist(),
+                scored[OVERRIDE_COLUMN].tolist(),
+                proba,
+            )
+        ]
+
+    def stats(self):
+        stats = {
+            "batches": self.batches,
+            "patients": self.patients,
+            "mean_batch_size": self.patients / self.batches if self.batches else 0.0,
+        }
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        model = self.pipeline["model"]
+        if hasattr(model, "stats"):
+            stats[getattr(model, "kind", "tabulated")] = model.stats()
+        return stats
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _coerce(col, value):
+    """A feature value in the type the model expects; None / NaN mean missing."""
+    if value is None:
+        return None
+    if col in CATEGORICAL_COLUMNS:
+        if not isinstance(value, str):
+            raise HTTPError(400, f"{col} must be a string or null, got {value!r}")
+        return value
+    if isinstance(value, bool):
+        raise HTTPError(400, f"{col} must be a number or null, got {value!r}")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"{col} must be a number or null, got {value!r}")
+    if math.isnan(number):
+        return None
+    if math.isinf(number):
+        raise HTTPError(400, f"{col} must be finite, got {value!r}")
+    return number
+
+
+def validate_patient(record):
+    """Check one patient's features and coerce their types (400 on bad input)."""
+    if not isinstance(record, dict):
+        raise HTTPError(400, "each patient must be a JSON object")
+    missing = [col for col in FEATURE_COLUMNS if col not in record]
+    if missing:
+        raise HTTPError(400, f"missing features: {missing}")
+    return {col: _coerce(col, record[col]) for col in FEATURE_COLUMNS}
+
+
+def content_length(headers):
+    """The request's body length from its Content-Length header (400 if invalid)."""
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "invalid Content-Length")
+    if length < 0:
+        raise HTTPError(400, "invalid Content-Length")
+    return length
+
+
+class PredictionServer:
+    def __init__(self, pipeline, max_batch_size=64, max_wait_ms=5.0, cache=None, monitor=None):
+        self.pipeline = pipeline
+        self.batcher = MicroBatcher(pipeline, max_batch_size, max_wait_ms, cache, monitor)
+        self.started = time.time()
+
+    async def route(self, method, path, body, query=""):
+        if path == "/health":
+            return {"status": "ok", "model": self.pipeline["model_name"],
+                    "uptime_s": round(time.time() - self.started, 1), **self.batcher.stats()}
+        if path == "/metrics":
+            if not instrumentation.METRICS.enabled:
+                raise HTTPError(404, "metrics are disabled; start the server with --metrics")
+            return instrumentation.METRICS.prometheus()
+        if path == "/drift":
+            monitor = self.batcher.monitor
+            if monitor is None:
+                raise HTTPError(404, "drift monitoring is disabled; start the server with --drift")
+            report = monitor.report()
+            if "reset=1" in query.split("&"):
+                monitor.reset()
+            return report
+        if path not in ("/predict", "/predict/batch"):
+            raise HTTPError(404, f"unknown path {path}")
+        if method != "POST":
+            raise HTTPError(405, "use POST")
+        try:
+            payload = json.loads(body or b"null")
+        except ValueError:
+            raise HTTPError(400, "body is not valid JSON")
+
+        if path == "/predict":
+            return (await self.batcher.submit([validate_patient(payload)]))[0]
+
+        patients = payload.get("patients") if isinstance(payload, dict) else payload
+        if not isinstance(patients, list):
+            raise HTTPError(400, 'expected {"patients": [...]}')
+        records = [validate_patient(p) for p in patients]
+        return {"predictions": await self.batcher.submit(records) if records else []}
+
+    async def handle(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection (keep-alive aware)."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                length = None
+                try:
+                    length = content_length(headers)
+                    if length > MAX_BODY_BYTES:
+                        raise HTTPError(413, "request body too large")
+                    body = await reader.readexactly(length) if length else b""
+                    route, _, query = path.partition("?")
+                    status, result = 200, await self.route(method, route, body, query)
+                except HTTPError as exc:
+                    status, result = exc.status, {"error": str(exc)}
+                except Exception as exc:
+                    status, result = 500, {"error": repr(exc)}
+
+                if isinstance(result, str):
+                    payload, content_type = result.encode(), "text/plain; version=0.0.4"
+                else:
+                    payload, content_type = json.dumps(result).encode(), "application/json"
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+                # the unread body of a rejected request would be parsed as the next request
+                if not keep_alive or status == 413 or length is None:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        batch_task = asyncio.create_task(self.batcher.run())
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"✅ Serving {self.pipeline['model_name']} on http://{host}:{port} "
+              f"(max batch {self.batcher.max_batch_size}, max wait {self.batcher.max_wait * 1000:g} ms)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batch_task.cancel()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HTTP prediction service with micro-batching.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model", default=None,
+                        help="pipeline artifact (default: current model from models/manifest.json)")
+    parser.add_argument("--max-batch-size", type=int, default=64, help="patients per micro-batch")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="how long the first request of a batch may wait for company")
+    parser.add_argument("--cache-size", type=int, default=0,
+                        help="prediction cache entries (0 disables the cache)")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="expire cached predictions after N seconds")
+    parser.add_argument("--cache-store", default=None,
+                        help="SQLite file shared by every server process using the same path")
+    parser.add_argument("--tabulated", default=None, metavar="DIR",
+                        help="answer on-grid patients from a precomputed table (see src/tabulated_model.py)")
+    parser.add_argument("--ensemble", nargs="?", const=ENSEMBLE_DIR, default=None, metavar="DIR",
+                        help="serve a soft-voting ensemble of the members saved by "
+                             "model_training.py --save-ensemble (default dir: %(const)s)")
+    parser.add_argument("--ensemble-weights", default="equal",
+                        help='"equal", "f1" (test F1 from training) or "Name=w,..." (unlisted members dropped)')
+    parser.add_argument("--ensemble-threads", type=int, default=None,
+                        help="threads scoring members concurrently (default: one per member)")
+    parser.add_argument("--fast-model", default=None,
+                        help='ensemble member answering alone when confident ("auto": the fastest one)')
+    parser.add_argument("--fast-threshold", type=float, default=FAST_THRESHOLD,
+                        help="top probability at which the fast model's answer is final")
+    parser.add_argument("--drift", nargs="?", const=os.path.join(MODEL_DIR, REFERENCE_NAME), default=None,
+                        metavar="PROFILE", help="monitor inputs against the training reference profile "
+                                                "(default: the one saved by training); report at GET /drift")
+    parser.add_argument("--metrics", action="store_true",
+                        help="time prediction stages and count outcomes (served at GET /metrics)")
+    parser.add_argument("--metrics-dump", default=None, metavar="PATH",
+                        help="also write the metrics as JSON to PATH periodically (implies --metrics)")
+    parser.add_argument("--metrics-dump-interval", type=float, default=60.0, help="seconds between dumps")
+    parser.add_argument("--profile-slow-ms", type=float, default=None,
+                        help="sample stacks of batches slower than this (implies --metrics)")
+    parser.add_argument("--profile-output", default=instrumentation.PROFILE_PATH,
+                        help="collapsed-stack file for slow batches (flamegraph.pl / speedscope)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.ensemble and args.tabulated:
+        raise SystemExit("--tabulated serves a single tree model; it can't be combined with --ensemble")
+    if args.ensemble:
+        pipeline = load_ensemble(args.ensemble, args.ensemble_weights, args.fast_model, args.fast_threshold,
+                                 args.ensemble_threads)
+    else:
+        pipeline = load_artifact(args.model or current_artifact_path())
+    if args.tabulated:
+        from tabulated_model import tabulated_pipeline
+
+        pipeline = tabulated_pipeline(pipeline, args.tabulated)
+    if args.metrics or args.metrics_dump or args.profile_slow_ms is not None:
+        instrumentation.enable(args.metrics_dump, args.metrics_dump_interval,
+                               args.profile_slow_ms, args.profile_output)
+    cache = PredictionCache(args.cache_size, args.cache_ttl, args.cache_store) if args.cache_size else None
+    monitor = None
+    if args.drift:
+        monitor = DriftMonitor.load(args.drift)
+    server = PredictionServer(pipeline, args.max_batch_size, args.max_wait_ms, cache, monitor)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,180 @@
+# src/preprocessing.py
+"""
+Fitted preprocessing shared by training, evaluation and serving.
+
+A Preprocessor remembers the training-time imputation statistics and the
+category -> code tables, and encodes whole columns at once. It is saved
+together with the model as a single versioned pipeline artifact, so every
+consumer encodes exactly like training did.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from schema import FEATURE_DTYPE, category_codes
+
+PIPELINE_PATH = "models/model_pipeline.pkl"
+PIPELINE_VERSION = 1
+
+TARGET_COLUMN = "Disease"
+ID_COLUMN = "Patient_ID"
+
+CATEGORICAL_COLUMNS = ["Gender", "Cough", "Headache", "Fatigue", "Blood_Pressure"]
+NUMERIC_COLUMNS = ["Age", "Body_Temperature", "Heart_Rate", "WBC_Count", "Sugar_Level"]
+
+# Column order the models are trained on
+FEATURE_COLUMNS = [
+    "Age",
+    "Gender",
+    "Body_Temperature",
+    "Cough",
+    "Headache",
+    "Fatigue",
+    "Blood_Pressure",
+    "Heart_Rate",
+    "WBC_Count",
+    "Sugar_Level",
+]
+
+
+class Preprocessor:
+    """
+    Median/mode imputation plus categorical encoding, fitted once on training data.
+
+    Categories are sorted like sklearn's LabelEncoder, so codes match the
+    encoders used before. Values never seen in training get `unknown_value`:
+    "mode" (the code of the training mode) or an explicit integer code.
+    """
+
+    def __init__(self, unknown_value="mode"):
+        self.unknown_value = unknown_value
+
+    def fit(self, df):
+        self.medians_ = {col: float(df[col].median()) for col in NUMERIC_COLUMNS}
+        self.modes_ = {col: str(df[col].mode().iloc[0]) for col in CATEGORICAL_COLUMNS}
+        self.categories_ = {col: self._levels(df[col]) for col in CATEGORICAL_COLUMNS}
+        self.classes_ = np.array(self._levels(df[TARGET_COLUMN]))
+        return self
+
+    @staticmethod
+    def _levels(series):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            present = series.cat.remove_unused_categories().cat.categories
+        else:
+            present = series.dropna().unique()
+        return sorted(str(v) for v in present)
+
+    def fallback_code(self, col):
+        if self.unknown_value == "mode":
+            return self.categories_[col].index(self.modes_[col])
+        return int(self.unknown_value)
+
+    def encode_column(self, col, values, impute=True):
+        """Encode one categorical column to int8 codes in a single vectorized pass."""
+        values = pd.Series(values, copy=False)
+        codes = category_codes(values, self.categories_[col])
+
+        missing = values.isna().to_numpy()
+        unknown = (codes < 0) & ~missing
+        codes[unknown] = self.fallback_code(col)
+        if impute:
+            codes[missing] = self.categories_[col].index(self.modes_[col])
+        return codes
+
+    def transform(self, df, impute=True):
+        """
+        Return the model feature frame for `df`.
+
+        With impute=False, missing numerics stay NaN and missing categoricals
+        get code -1, for estimators that handle missing values natively.
+        """
+        out = {}
+        for col in FEATURE_COLUMNS:
+            if col in CATEGORICAL_COLUMNS:
+                out[col] = self.encode_column(col, df[col], impute=impute)
+            else:
+                values = df[col]
+                if values.dtype == object:
+                    values = pd.to_numeric(values)
+                # no copy when the column is already float32
+                values = values.to_numpy(dtype=FEATURE_DTYPE, na_value=np.nan)
+                if impute:
+                    missing = np.isnan(values)
+                    if missing.any():
+                        values = np.where(missing, FEATURE_DTYPE(self.medians_[col]), values)
+                out[col] = values
+        # one block per column: no consolidation copy
+        return pd.DataFrame(out, index=df.index, copy=False)
+
+    def fit_transform(self, df, impute=True):
+        return self.fit(df).transform(df, impute=impute)
+
+    def get_state(self):
+        """Plain-data (JSON-serializable) form of the fitted tables."""
+        return {
+            "unknown_value": self.unknown_value,
+            "medians": self.medians_,
+            "modes": self.modes_,
+            "categories": self.categories_,
+            "classes": list(self.classes_),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        preprocessor = cls(state["unknown_value"])
+        preprocessor.medians_ = dict(state["medians"])
+        preprocessor.modes_ = dict(state["modes"])
+        preprocessor.categories_ = {col: list(levels) for col, levels in state["categories"].items()}
+        preprocessor.classes_ = np.array(state["classes"])
+        return preprocessor
+
+    def encode_target(self, y):
+        y = pd.Series(y, copy=False)
+        if not isinstance(y.dtype, pd.CategoricalDtype):
+            y = y.astype(str)
+        codes = category_codes(y, list(self.classes_), np.int64)
+        if (codes < 0).any():
+            raise ValueError("Unknown target labels: %s" % sorted(set(y.to_numpy()[codes < 0].astype(str))))
+        return codes
+
+    def decode_target(self, codes):
+        return self.classes_[np.asarray(codes)]
+
+
+def save_pipeline(model, preprocessor, model_name, path=PIPELINE_PATH, impute=True):
+    """
+    Save model + preprocessor as one versioned artifact.
+
+    impute=False marks models trained on un-imputed features (native
+    missing-value support); model_inputs() then skips imputation too.
+    Returns the saved pipeline dict.
+    """
+    pipeline = {
+        "version": PIPELINE_VERSION,
+        "model_name": model_name,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "feature_columns": FEATURE_COLUMNS,
+        "impute": impute,
+        "preprocessor": preprocessor,
+        "model": model,
+    }
+    import joblib
+
+    joblib.dump(pipeline, path)
+    return pipeline
+
+
+def load_pipeline(path=PIPELINE_PATH, mmap_mode=None):
+    """Load a pipeline artifact saved by save_pipeline."""
+    import joblib
+
+    pipeline = joblib.load(path, mmap_mode=mmap_mode)
+    if not isinstance(pipeline, dict) or pipeline.get("version") != PIPELINE_VERSION:
+        raise ValueError(f"{path} is not a version {PIPELINE_VERSION} pipeline artifact")
+    return pipeline
+
+
+def model_inputs(pipeline, df):
+    """Encode a raw patient frame exactly the way the pipeline's model was trained."""
+    return pipeline["preprocessor"].transform(df, impute=pipeline.get("impute", True))
@@ -0,0 +1,307 @@
+# src/resampling.py
+"""
+Class rebalancing of training rows.
+
+Resampling happens after encoding and only on the rows a model is fitted
+on; test and CV evaluation rows are never resampled. A plan is drawn first:
+which original rows to keep (repeated when oversampling) and, for SMOTE,
+(seed row, neighbour row, gap) triples describing synthetic rows. The plan
+is a few index arrays, so the same plan can be applied to the imputed and
+raw encodings, and it is materialized chunk by chunk rather than through
+intermediate copies of the whole set.
+
+    over   random oversampling: every class up to the largest one
+    under  random undersampling: every class down to the smallest one
+    smote  SMOTE: smaller classes are topped up with rows interpolated
+           between a row and one of its k nearest same-class neighbours;
+           categorical codes come from the nearer endpoint (as in SMOTE-NC)
+
+Neighbours come from a CellIndex: k-means cells over the standardized
+class rows, each searched exactly, so SMOTE costs O(rows x cell size)
+instead of O(rows^2). Classes that fit in one cell get exact neighbours.
+
+Streaming training applies the same per-class rates, computed on the
+whole cohort, to each chunk (see incremental_training.py).
+
+    python src/model_training.py --resample smote
+    python src/resampling.py bench --rows 1000000 --recall
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from preprocessing import CATEGORICAL_COLUMNS
+
+METHODS = ("over", "under", "smote")
+K_NEIGHBORS = 5
+
+# Approximate neighbour search: target rows per k-means cell, Lloyd
+# iterations on a sample of SAMPLE_PER_CELL rows per cell, and the rows
+# processed per distance block (bounds temporary memory)
+CELL_SIZE = 512
+KMEANS_ITERATIONS = 8
+SAMPLE_PER_CELL = 16
+BLOCK_ROWS = 4096
+
+
+# ===============================
+# Approximate nearest neighbours
+# ===============================
+def _nearest_centroid(points, centroids):
+    """Index of the nearest centroid per point, in blocks of BLOCK_ROWS points."""
+    out = np.empty(len(points), dtype=np.int64)
+    norms = np.square(centroids).sum(axis=1)
+    for start in range(0, len(points), BLOCK_ROWS):
+        block = points[start:start + BLOCK_ROWS]
+        # |x - c|^2 without the per-point |x|^2 term, which doesn't change the argmin
+        out[start:start + BLOCK_ROWS] = np.argmin(norms - 2 * block @ centroids.T, axis=1)
+    return out
+
+
+class CellIndex:
+    """
+    Approximate k-nearest-neighbour index (inverted file): points are
+    partitioned into k-means cells of about `cell_size` rows and a query
+    is answered exactly within its own cell.
+    """
+
+    def __init__(self, points, cell_size=CELL_SIZE, random_state=0):
+        self.points = np.ascontiguousarray(points, dtype=np.float32)
+        n = len(self.points)
+        n_cells = max(1, n // cell_size)
+        if n_cells == 1:
+            cells = np.zeros(n, dtype=np.int64)
+        else:
+            rng = np.random.default_rng(random_state)
+            sample = self.points[rng.choice(n, min(n, n_cells * SAMPLE_PER_CELL), replace=False)]
+            centroids = sample[rng.choice(len(sample), n_cells, replace=False)].copy()
+            for _ in range(KMEANS_ITERATIONS):
+                assign = _nearest_centroid(sample, centroids)
+                counts = np.bincount(assign, minlength=n_cells)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assign, sample)
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+            cells = _nearest_centroid(self.points, centroids)
+        self.cells = cells
+        self.order = np.argsort(cells, kind="stable")
+        self.bounds = np.searchsorted(cells[self.order], np.arange(n_cells + 1))
+
+    def kneighbors(self, queries, k=K_NEIGHBORS):
+        """
+        (len(queries), k) indices of approximate nearest neighbours of the
+        indexed points `queries`, excluding the point itself. Cells with
+        fewer than k + 1 points repeat their farthest neighbour; a point
+        alone in its cell is its own neighbour.
+        """
+        queries = np.asarray(queries)
+        out = np.empty((len(queries), k), dtype=np.int64)
+        by_cell = np.argsort(self.cells[queries], kind="stable")
+        query_cells = self.cells[queries][by_cell]
+        for cell in np.unique(query_cells):
+            members = self.order[self.bounds[cell]:self.bounds[cell + 1]]
+            if len(members) == 1:
+                out[by_cell[query_cells == cell]] = members[0]
+                continue
+            kk = min(k, len(members) - 1)
+            candidates = self.points[members]
+            norms = np.square(candidates).sum(axis=1)
+            positions = by_cell[np.searchsorted(query_cells, cell):np.searchsorted(query_cells, cell, "right")]
+            for start in range(0, len(positions), BLOCK_ROWS):
+                block = positions[start:start + BLOCK_ROWS]
+                q = queries[block]
+                distances = norms - 2 * self.points[q] @ candidates.T
+                distances[members == q[:, None]] = np.inf
+                nearest = np.argpartition(distances, kk - 1, axis=1)[:, :kk]
+                if kk < k:
+                    nearest = np.pad(nearest, ((0, 0), (0, k - kk)), mode="edge")
+                out[block] = members[nearest]
+        return out
+
+
+def _standardize(X):
+    """Encoded features as float32 with unit variance per column (NaN -> column mean)."""
+    points = X.to_numpy(dtype=np.float32, na_value=np.nan)
+    mean = np.nanmean(points, axis=0)
+    std = np.nanstd(points, axis=0)
+    points = (points - mean) / np.where(std > 0, std, 1)
+    return np.nan_to_num(points, nan=0.0)
+
+
+# ===============================
+# Plans
+# ===============================
+def class_rates(counts, method):
+    """Per-class multiplier that balances `counts` (1 for absent classes)."""
+    counts = np.asarray(counts, dtype=float)
+    present = counts > 0
+    target = counts[present].min() if method == "under" else counts[present].max()
+    rates = np.ones_like(counts)
+    rates[present] = target / counts[present]
+    return rates
+
+
+def _stochastic_round(rng, x):
+    whole = int(np.floor(x + 1e-9))
+    return whole + int(rng.random() < x - whole)
+
+
+class ResamplePlan:
+    """Rows to keep (indices, repeats allowed) plus synthetic (seed, neighbour, gap) rows."""
+
+    def __init__(self, keep, seeds, neighbors, gaps, synthetic_y):
+        self.keep = keep
+        self.seeds = seeds
+        self.neighbors = neighbors
+        self.gaps = gaps
+        self.synthetic_y = synthetic_y
+
+    @property
+    def rows(self):
+        return len(self.keep) + len(self.seeds)
+
+    def chunks(self, X, y, chunk_rows=BLOCK_ROWS * 64):
+        """Yield the resampled (X, y) in chunks of at most `chunk_rows` rows: kept rows, then synthetic ones."""
+        y = np.asarray(y)
+        for start in range(0, len(self.keep), chunk_rows):
+            rows = self.keep[start:start + chunk_rows]
+            yield X.iloc[rows].reset_index(drop=True), y[rows]
+        for start in range(0, len(self.seeds), chunk_rows):
+            end = start + chunk_rows
+            yield synthesize(X, self.seeds[start:end], self.neighbors[start:end], self.gaps[start:end]), \
+                self.synthetic_y[start:end]
+
+    def apply(self, X, y):
+        """The whole resampled (X, y), for estimators that fit in one call."""
+        parts = list(self.chunks(X, y))
+        if not parts:
+            return X.iloc[:0], np.asarray(y)[:0]
+        return pd.concat([p[0] for p in parts], ignore_index=True), np.concatenate([p[1] for p in parts])
+
+
+def synthesize(X, seeds, neighbors, gaps):
+    """SMOTE rows: numerics interpolated by `gaps`, categorical codes from the nearer endpoint."""
+    out = {}
+    for col in X.columns:
+        values = X[col].to_numpy()
+        a, b = values[seeds], values[neighbors]
+        if col in CATEGORICAL_COLUMNS:
+            out[col] = np.where(gaps < 0.5, a, b)
+        else:
+            out[col] = (a + gaps.astype(a.dtype) * (b - a)).astype(a.dtype, copy=False)
+    return pd.DataFrame(out, copy=False)
+
+
+def plan_resampling(X, y, method, rates=None, k=K_NEIGHBORS, cell_size=CELL_SIZE, random_state=0):
+    """
+    Draw a ResamplePlan for encoded features `X` and integer labels `y`.
+
+    `rates` (per class code) defaults to balancing the classes of `y`;
+    passing whole-cohort rates lets chunks of a stream be resampled alike.
+    Fractional targets are rounded stochastically.
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown resampling method {method!r}; choose from {METHODS}")
+    y = np.asarray(y)
+    rng = np.random.default_rng(random_state)
+    counts = np.bincount(y)
+    if rates is None:
+        rates = class_rates(counts, method)
+
+    keep, seeds, neighbors, gaps, synthetic_y = [], [], [], [], []
+    for c in np.flatnonzero(counts):
+        rows = np.flatnonzero(y == c)
+        target = _stochastic_round(rng, len(rows) * rates[c])
+        if method == "under":
+            keep.append(np.sort(rng.choice(rows, min(target, len(rows)), replace=False)))
+            continue
+        keep.append(rows)
+        extra = target - len(rows)
+        if extra <= 0:
+            continue
+        if method == "over" or len(rows) < 2:
+            keep.append(rng.choice(rows, extra))
+            continue
+        index = CellIndex(_standardize(X.iloc[rows]), cell_size, random_state=rng.integers(2 ** 32))
+        local = rng.integers(len(rows), size=extra)
+        # minority rows seed many synthetic rows: search each distinct seed once
+        distinct, inverse = np.unique(local, return_inverse=True)
+        nearest = index.kneighbors(distinct, k)
+        pick = nearest[inverse, rng.integers(nearest.shape[1], size=extra)]
+        seeds.append(rows[local])
+        neighbors.append(rows[pick])
+        gaps.append(rng.random(extra, dtype=np.float32))
+        synthetic_y.append(np.full(extra, c, dtype=y.dtype))
+
+    empty = np.empty(0, dtype=np.int64)
+    return ResamplePlan(
+        np.concatenate(keep) if keep else empty,
+        np.concatenate(seeds) if seeds else empty,
+        np.concatenate(neighbors) if neighbors else empty,
+        np.concatenate(gaps) if gaps else np.empty(0, dtype=np.float32),
+        np.concatenate(synthetic_y) if synthetic_y else np.empty(0, dtype=y.dtype),
+    )
+
+
+def resample(X, y, method, **kwargs):
+    """Resampled (X, y) in one call; see plan_resampling for the options."""
+    return plan_resampling(X, y, method, **kwargs).apply(X, y)
+
+
+# ===============================
+# Benchmark
+# ===============================
+def neighbor_recall(points, queries, k=K_NEIGHBORS, cell_size=CELL_SIZE):
+    """
+    Share of CellIndex neighbours within the exact k-nearest-neighbour
+    radius (a distance test, since discrete features make many ties).
+    """
+    from sklearn.neighbors import NearestNeighbors
+
+    approx = CellIndex(points, cell_size).kneighbors(queries, k)
+    radius = NearestNeighbors(n_neighbors=k + 1).fit(points).kneighbors(points[queries])[0][:, -1]
+    distances = np.sqrt(np.square(points[approx] - points[queries][:, None]).sum(axis=2))
+    return float(np.mean(distances <= radius[:, None] * (1 + 1e-6)))
+
+
+def benchmark(rows, methods=METHODS, seed=42):
+    from data_generation import generate_chunk
+    from preprocessing import TARGET_COLUMN, Preprocessor
+
+    df = generate_chunk(rows, seed)
+    preprocessor = Preprocessor()
+    X = preprocessor.fit_transform(df)
+    y = preprocessor.encode_target(df[TARGET_COLUMN])
+    timings = {}
+    for method in methods:
+        start = time.perf_counter()
+        plan = plan_resampling(X, y, method)
+        planned = time.perf_counter() - start
+        X_res, _ = plan.apply(X, y)
+        timings[method] = (planned, time.perf_counter() - start, len(X_res))
+    return X, y, timings
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Resampling for imbalanced training.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="time each method on a generated cohort")
+    bench.add_argument("--rows", type=int, default=1_000_000)
+    bench.add_argument("--methods", default=",".join(METHODS))
+    bench.add_argument("--recall", action="store_true",
+                       help="also measure neighbour recall against exact search (largest class)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    X, y, timings = benchmark(args.rows, [m.strip() for m in args.methods.split(",")])
+    for method, (planned, total, out_rows) in timings.items():
+        print(f"✅ {method}: {args.rows:,} -> {out_rows:,} rows in {total:.2f}s (plan {planned:.2f}s)")
+    if args.recall:
+        rows = np.flatnonzero(y == np.bincount(y).argmax())
+        points = _standardize(X.iloc[rows])
+        queries = np.random.default_rng(0).choice(len(rows), min(2000, len(rows)), replace=False)
+        print(f"   neighbour recall@{K_NEIGHBORS} on {len(rows):,} rows: {neighbor_recall(points, queries):.3f}")
@@ -0,0 +1,207 @@
+# src/rules.py
+"""
+Declarative clinical rules, compiled to vectorized masks.
+
+A rule is a label plus conditions (feature, comparator, threshold) that must
+all hold; a RuleSet lists rules in priority order and the first matching
+rule wins. Rules run over a whole DataFrame (or a dict of arrays) at once:
+each distinct condition is one numpy comparison, categorical conditions
+compare category codes, and thresholds are cast to the column's dtype so
+float32 columns compare exactly (float32(37.2) > 37.2 in float64).
+Missing values never satisfy a condition.
+
+    python src/rules.py agreement --data data/patient_symptoms_dataset.parquet
+    python src/rules.py bench --rows 10000000
+"""
+import argparse
+import operator
+import time
+
+import numpy as np
+import pandas as pd
+
+COMPARATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+# Synthetic cohort labels (data_generation.py), highest priority first.
+# WBC_Count is in dataset units (cells/µL).
+LABEL_RULES = [
+    ("Pneumonia", [("Body_Temperature", ">", 38), ("Cough", "==", "Severe")]),
+    ("Diabetes", [("Sugar_Level", ">", 150)]),
+    ("Hypertension", [("Blood_Pressure", "==", "High"), ("Heart_Rate", ">", 100)]),
+    ("Anemia", [("Fatigue", "==", "High"), ("WBC_Count", "<", 5000)]),
+    ("Migraine", [("Headache", "==", "Severe"), ("Fatigue", "==", "None")]),
+    ("Healthy", [("Body_Temperature", ">=", 36), ("Body_Temperature", "<=", 37.5),
+                 ("Cough", "==", "None"), ("Fatigue", "==", "None")]),
+]
+LABEL_DEFAULT = "Flu"
+
+# The serving-time "Healthy" override: every vital in its normal range and no
+# symptoms. Deliberately stricter than the Healthy label (temperature <= 37.2).
+HEALTHY_RULES = [
+    ("Healthy", [
+        ("Cough", "==", "None"),
+        ("Headache", "==", "None"),
+        ("Fatigue", "==", "None"),
+        ("Blood_Pressure", "==", "Normal"),
+        ("Body_Temperature", ">=", 36), ("Body_Temperature", "<=", 37.2),
+        ("Heart_Rate", ">=", 60), ("Heart_Rate", "<=", 90),
+        ("WBC_Count", ">=", 4000), ("WBC_Count", "<=", 11000),
+        ("Sugar_Level", ">=", 80), ("Sugar_Level", "<=", 140),
+    ]),
+]
+
+
+class RuleSet:
+    """Ordered rules compiled to one mask per distinct condition."""
+
+    def __init__(self, rules, default=None):
+        for label, conditions in rules:
+            for feature, comparator, _ in conditions:
+                if comparator not in COMPARATORS:
+                    raise ValueError(f"Unknown comparator {comparator!r} in rule {label!r} ({feature})")
+        self.rules = [(label, [tuple(c) for c in conditions]) for label, conditions in rules]
+        self.default = default
+        self.labels = [label for label, _ in self.rules] + ([default] if default is not None else [])
+        self.features = sorted({c[0] for _, conditions in self.rules for c in conditions})
+
+    @staticmethod
+    def _condition(values, comparator, threshold):
+        if isinstance(threshold, str):
+            if isinstance(values, pd.Categorical):
+                # compare codes instead of strings; an absent level matches nothing
+                code = values.categories.get_indexer([threshold])[0]
+                result = COMPARATORS[comparator](values.codes, code) if code >= 0 else \
+                    np.full(len(values), comparator == "!=")
+                return result & (values.codes >= 0)
+            return COMPARATORS[comparator](values, threshold) & pd.notna(values)
+        if values.dtype == object:
+            # e.g. a one-row frame built from JSON with a null: None -> NaN
+            values = pd.to_numeric(pd.Series(values, copy=False)).to_numpy(dtype=np.float64, na_value=np.nan)
+        # float thresholds in the column's own precision; NaN compares False
+        if values.dtype.kind == "f":
+            threshold = values.dtype.type(threshold)
+        return COMPARATORS[comparator](values, threshold)
+
+    @staticmethod
+    def _column(data, feature):
+        values = data[feature]
+        if isinstance(values, pd.Series):
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                return values.array
+            if values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+                return values.to_numpy()
+            if pd.api.types.is_extension_array_dtype(values.dtype):
+                # nullable integers / floats -> float with NaN for missing
+                return values.to_numpy(dtype=np.float64, na_value=np.nan)
+            return values.to_numpy()
+        if isinstance(values, pd.Categorical):
+            return values
+        values = np.asarray(values)
+        return values if values.dtype.kind in "biuf" else values.astype(object)
+
+    def masks(self, data):
+        """(n_rules, n_rows) bool: which rows satisfy every condition of each rule."""
+        columns, conditions = {}, {}
+        out = []
+        for _, rule in self.rules:
+            mask = None
+            for condition in rule:
+                if condition not in conditions:
+                    feature = condition[0]
+                    if feature not in columns:
+                        columns[feature] = self._column(data, feature)
+                    conditions[condition] = self._condition(columns[feature], *condition[1:])
+                mask = conditions[condition] if mask is None else mask & conditions[condition]
+            out.append(mask)
+        return np.vstack(out)
+
+    def first_match(self, data):
+        """Index of the first matching rule per row; len(rules) where none match."""
+        return np.select(list(self.masks(data)), range(len(self.rules)), default=len(self.rules))
+
+    def apply(self, data):
+        """Label per row (the default label, or None, where no rule matches)."""
+        return np.array(self.labels + [None], dtype=object)[self.first_match(data)]
+
+    def mask(self, data):
+        """Rows matching any rule."""
+        return self.masks(data).any(axis=0)
+
+
+LABELS = RuleSet(LABEL_RULES, LABEL_DEFAULT)
+HEALTHY = RuleSet(HEALTHY_RULES)
+
+
+def agreement(ruleset, data, predictions):
+    """
+    Rule-vs-model agreement: per rule label, how many rows it labels and how
+    often the model predicts the same class.
+    """
+    rule_labels = ruleset.apply(data).astype(str)
+    predictions = np.asarray(predictions).astype(str)
+    agree = rule_labels == predictions
+    labels = pd.Series(rule_labels)
+    per_label = pd.DataFrame({
+        "Rows": labels.value_counts(),
+        "Agreement": pd.Series(agree).groupby(rule_labels).mean(),
+        "Model_Rows": pd.Series(predictions).value_counts(),
+    }).reindex(ruleset.labels).fillna(0)
+    per_label["Rows"] = per_label["Rows"].astype(int)
+    per_label["Model_Rows"] = per_label["Model_Rows"].astype(int)
+    return float(agree.mean()), per_label
+
+
+def benchmark(rows, seed=42):
+    """Seconds to label and to evaluate the healthy override over `rows` generated patients."""
+    from data_generation import generate_chunk
+
+    df = generate_chunk(rows, seed)
+    timings = {}
+    for name, ruleset in (("labels", LABELS), ("healthy", HEALTHY)):
+        start = time.perf_counter()
+        ruleset.first_match(df)
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluate the clinical rule sets.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    agree = sub.add_parser("agreement", help="rule labels vs the current model's predictions")
+    agree.add_argument("--data", default=None)
+    agree.add_argument("--model", default=None,
+                       help="pipeline artifact (default: current model from models/manifest.json)")
+
+    bench = sub.add_parser("bench", help="time rule evaluation on a generated cohort")
+    bench.add_argument("--rows", type=int, default=10_000_000)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "bench":
+        for name, seconds in benchmark(args.rows).items():
+            print(f"✅ {name}: {args.rows:,} rows in {seconds:.2f}s ({args.rows / seconds / 1e6:.1f}M rows/s)")
+    else:
+        from dataset_io import DATA_PATH, read_dataset
+        from inference import MODEL_PREDICTION_COLUMN, score_frame
+        from model_registry import current_artifact_path, load_artifact
+
+        pipeline = load_artifact(args.model or current_artifact_path())
+        df = read_dataset(args.data or DATA_PATH)
+        scored = score_frame(pipeline, df, proba_classes=[], apply_override=False)
+        overall, per_label = agreement(LABELS, df, scored[MODEL_PREDICTION_COLUMN])
+        print(per_label.round(4).to_string())
+        print(f"\nLabel rules vs model: {overall:.4f} agreement")
+        healthy = HEALTHY.mask(df)
+        model_healthy = scored[MODEL_PREDICTION_COLUMN].to_numpy() == "Healthy"
+        print(f"Healthy override fires on {healthy.mean():.4f} of rows; "
+              f"the model also predicts Healthy on {model_healthy[healthy].mean() if healthy.any() else 0:.4f} of them")
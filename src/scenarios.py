@@ -0,0 +1,313 @@
+# src/scenarios.py
+"""
+Scenario generator for stress and class-imbalance testing.
+
+A scenario is a covariate-shift preset (feature marginals that differ from
+data_generation.FEATURE_DISTRIBUTIONS) plus a target prevalence per disease.
+Labels always come from rules.LABELS, so a class is hit by stratified
+sampling rather than by relabelling: each disease draws proposals from the
+marginals truncated to the region its rule can fire in (inverse-CDF for the
+normal vitals, restricted ranges/levels for the rest), keeps the rows the
+rules actually label with it, and tops up until its quota is met. Because
+features are independent, accepted rows follow exactly the preset's
+distribution conditioned on the label. Flu, the catch-all class, is drawn
+from the untruncated marginals.
+
+The cohort is cut into shards of --shard-size rows; shard i draws from
+SeedSequence(seed, spawn_key=(i,)) and is written straight to
+<output>/part-<i>.parquet by a process-pool worker. Output depends only on
+(rows, shard size, seed, preset, prevalence), never on --jobs. With the
+baseline preset and natural prevalence, shards match data_generation blocks
+of the same size. dataset_io readers accept the output directory directly.
+
+    python src/scenarios.py --list
+    python src/scenarios.py --rows 10000000 --prevalence balanced --jobs 8 --output data/stress_balanced
+    python src/scenarios.py --rows 1000000 --preset fever_outbreak --output data/fever_outbreak
+    python src/scenarios.py --rows 1000000 --prevalence "Healthy=0.5,Flu=0.3" --output data/mostly_healthy
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr, ndtri
+
+from data_generation import (BLOOD_PRESSURE_LEVELS, DISEASES, FATIGUE_LEVELS, FEATURE_DISTRIBUTIONS, SEED,
+                             SYMPTOM_LEVELS, _chunk_rng, draw_feature, patient_frame)
+from dataset_io import ROW_GROUP_SIZE, write_dataset
+from rules import COMPARATORS, LABELS
+from utils import bounded_parallel_map
+
+DEFAULT_SHARD_SIZE = 1_000_000
+MANIFEST_NAME = "scenario.json"
+
+# Covariate-shift presets: description and the marginals they replace
+PRESETS = {
+    "baseline": ("training-data marginals", {}),
+    "older_population": ("patients aged 60-95, more of them with high blood pressure", {
+        "Age": ("int", 60, 96),
+        "Blood_Pressure": ("choice", BLOOD_PRESSURE_LEVELS, [0.45, 0.42, 0.13]),
+    }),
+    "fever_outbreak": ("temperatures around 38.2 °C with more severe coughs and fatigue", {
+        "Body_Temperature": ("normal", 38.2, 0.9, 1),
+        "Cough": ("choice", SYMPTOM_LEVELS, [0.25, 0.35, 0.4]),
+        "Fatigue": ("choice", FATIGUE_LEVELS, [0.15, 0.4, 0.45]),
+    }),
+    "metabolic": ("higher and wider blood sugar", {
+        "Sugar_Level": ("normal", 135, 40, 1),
+    }),
+}
+
+# Proposal batches never shrink below this many rows
+MIN_PROPOSALS = 1024
+# Give up on a class after this many proposals without a single accepted row
+MAX_EMPTY_PROPOSALS = 10_000_000
+
+
+def preset_distributions(preset):
+    if preset not in PRESETS:
+        raise ValueError(f"unknown preset {preset!r}; choose from {sorted(PRESETS)}")
+    return {**FEATURE_DISTRIBUTIONS, **PRESETS[preset][1]}
+
+
+def parse_prevalence(spec):
+    """
+    Target share per disease: None for "natural" (whatever the rules yield),
+    equal shares for "balanced", or "Flu=0.3,Healthy=0.2" with the remaining
+    share split evenly over the diseases not listed.
+    """
+    if spec in (None, "", "natural"):
+        return None
+    if spec == "balanced":
+        return {disease: 1.0 / len(DISEASES) for disease in DISEASES}
+    given = {}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in DISEASES:
+            raise ValueError(f"unknown disease {name!r} in prevalence; choose from {DISEASES}")
+        given[name] = float(value)
+    total = sum(given.values())
+    if min(given.values()) < 0 or total > 1 + 1e-9:
+        raise ValueError(f"prevalences must be non-negative and sum to at most 1 (got {total:g})")
+    rest = [d for d in DISEASES if d not in given]
+    if not rest and abs(total - 1) > 1e-6:
+        raise ValueError(f"prevalences must sum to 1 when every disease is listed (got {total:g})")
+    return {d: given.get(d, (1 - total) / len(rest) if rest else 0.0) for d in DISEASES}
+
+
+def apportion(total, shares):
+    """Split `total` rows by `shares` (largest remainder): integer counts summing to `total`."""
+    shares = np.asarray(shares, dtype=float)
+    exact = total * shares / shares.sum()
+    counts = np.floor(exact).astype(np.int64)
+    remainder = int(total - counts.sum())
+    counts[np.argsort(-(exact - counts), kind="stable")[:remainder]] += 1
+    return counts
+
+
+# ----------------------------
+# Stratified proposals
+# ----------------------------
+def _truncate(distribution, conditions):
+    """
+    Restrict one marginal to the values that can satisfy `conditions`
+    [(comparator, threshold)]; None if no value can. Normal vitals are
+    truncated before rounding, widened by one rounding step so every draw
+    that rounds into the region is still proposed.
+    """
+    kind = distribution[0]
+    if kind == "choice":
+        levels = np.array(distribution[1], dtype=object)
+        p = np.asarray(distribution[2], dtype=float)
+        for comparator, threshold in conditions:
+            p = np.where(COMPARATORS[comparator](levels, threshold), p, 0.0)
+        return ("choice", distribution[1], p / p.sum()) if p.sum() > 0 else None
+    if kind == "int":
+        low, high = distribution[1], distribution[2]
+        for comparator, threshold in conditions:
+            if comparator in (">", ">=", "=="):
+                low = max(low, int(np.floor(threshold)) + 1 if comparator == ">" else int(np.ceil(threshold)))
+            if comparator in ("<", "<=", "=="):
+                high = min(high, int(np.ceil(threshold)) if comparator == "<" else int(np.floor(threshold)) + 1)
+        return ("int", low, high) if low < high else None
+    _, mean, sd, decimals = distribution
+    step = 1.0 if decimals is None else 10.0 ** -decimals
+    low, high = -np.inf, np.inf
+    for comparator, threshold in conditions:
+        if comparator in (">", ">=", "=="):
+            low = max(low, threshold - step)
+        if comparator in ("<", "<=", "=="):
+            high = min(high, threshold + step)
+    return ("truncnormal", mean, sd, decimals, low, high) if low < high else None
+
+
+def _draw(rng, distribution, size):
+    if distribution[0] != "truncnormal":
+        return draw_feature(rng, distribution, size)
+    _, mean, sd, decimals, low, high = distribution
+    a, b = (low - mean) / sd, (high - mean) / sd
+    # invert from the nearer tail so far-out regions keep their precision
+    if a > 0:
+        values = mean - sd * ndtri(rng.uniform(ndtr(-b), ndtr(-a), size))
+    else:
+        values = mean + sd * ndtri(rng.uniform(ndtr(a), ndtr(b), size))
+    values = np.clip(values, low, high)
+    return values.astype(int) if decimals is None else np.round(values, decimals)
+
+
+def class_proposals(distributions):
+    """Per disease code: the marginals truncated to where its label rule can fire."""
+    proposals = []
+    for label, conditions in LABELS.rules:
+        by_feature = {}
+        for feature, comparator, threshold in conditions:
+            by_feature.setdefault(feature, []).append((comparator, threshold))
+        proposal = dict(distributions)
+        for feature, feature_conditions in by_feature.items():
+            proposal[feature] = _truncate(distributions[feature], feature_conditions)
+            if proposal[feature] is None:
+                proposal = None
+                break
+        proposals.append(proposal)
+    proposals.append(dict(distributions))  # the default label: plain marginals
+    return proposals
+
+
+def _draw_class(rng, proposal, code, quota):
+    """`quota` rows labelled `code`, as {column: raw array} (category codes for levels)."""
+    blocks, have, rate, empty = [], 0, 1.0, 0
+    while have < quota:
+        need = quota - have
+        size = max(int(need / rate * 1.1), MIN_PROPOSALS)
+        features = {col: _draw(rng, distribution, size) for col, distribution in proposal.items()}
+        accepted = np.flatnonzero(LABELS.first_match(features) == code)[:need]
+        if not len(accepted):
+            empty += size
+            if empty >= MAX_EMPTY_PROPOSALS:
+                raise ValueError(f"{DISEASES[code]} (almost) never occurs under this preset")
+            continue
+        rate = len(accepted) / size if len(accepted) < need else rate
+        blocks.append({col: (values.codes if isinstance(values, pd.Categorical) else values)[accepted]
+                       for col, values in features.items()})
+        have += len(accepted)
+    return blocks
+
+
+def _stratified(rng, distributions, quotas):
+    proposals = class_proposals(distributions)
+    blocks, codes = [], []
+    for code, quota in enumerate(quotas):
+        if not quota:
+            continue
+        if proposals[code] is None:
+            raise ValueError(f"{DISEASES[code]} cannot occur under this preset")
+        for block in _draw_class(rng, proposals[code], code, int(quota)):
+            blocks.append(block)
+            codes.append(np.full(len(next(iter(block.values()))), code, dtype=np.int64))
+    order = rng.permutation(int(sum(quotas)))
+    features = {}
+    for col, distribution in distributions.items():
+        values = np.concatenate([block[col] for block in blocks])[order]
+        features[col] = pd.Categorical.from_codes(values, categories=distribution[1]) \
+            if distribution[0] == "choice" else values
+    return features, np.concatenate(codes)[order]
+
+
+# ----------------------------
+# Shards
+# ----------------------------
+def generate_shard(size, seed=SEED, shard_index=0, start_id=1, distributions=FEATURE_DISTRIBUTIONS, quotas=None):
+    """One shard of `size` patients; `quotas` is the row count per disease code (None: natural prevalence)."""
+    rng = _chunk_rng(seed, shard_index)
+    if quotas is None:
+        features = {col: draw_feature(rng, distribution, size) for col, distribution in distributions.items()}
+        codes = LABELS.first_match(features)
+    else:
+        features, codes = _stratified(rng, distributions, quotas)
+    return patient_frame(features, codes, rng, start_id)
+
+
+def _write_shard(spec):
+    path, size, seed, shard_index, start_id, distributions, quotas = spec
+    start = time.perf_counter()
+    df = generate_shard(size, seed, shard_index, start_id, distributions, quotas)
+    write_dataset(df, path, row_group_size=min(size, ROW_GROUP_SIZE))
+    counts = np.bincount(df["Disease"].cat.codes.to_numpy(), minlength=len(DISEASES))
+    return {"path": os.path.basename(path), "rows": size, "counts": counts.tolist(),
+            "seconds": round(time.perf_counter() - start, 3)}
+
+
+def generate_scenario(output, rows, preset="baseline", prevalence=None, seed=SEED,
+                      shard_size=DEFAULT_SHARD_SIZE, n_jobs=1):
+    """
+    Write a scenario cohort to `output`/part-NNNNN.parquet and its manifest.
+
+    `prevalence` is a spec for parse_prevalence (or an already parsed dict).
+    Old part files in `output` are removed first so readers never mix runs.
+    """
+    distributions = preset_distributions(preset)
+    shares = parse_prevalence(prevalence) if not isinstance(prevalence, dict) else prevalence
+    os.makedirs(output, exist_ok=True)
+    for stale in glob.glob(os.path.join(output, "part-*.parquet")):
+        os.remove(stale)
+
+    specs = []
+    for shard_index, start in enumerate(range(0, rows, shard_size)):
+        size = min(shard_size, rows - start)
+        quotas = None if shares is None else apportion(size, [shares[d] for d in DISEASES]).tolist()
+        specs.append((os.path.join(output, f"part-{shard_index:05d}.parquet"), size, seed, shard_index,
+                      start + 1, distributions, quotas))
+
+    start = time.perf_counter()
+    shards = list(bounded_parallel_map(_write_shard, specs, n_jobs))
+    seconds = time.perf_counter() - start
+    counts = np.sum([shard["counts"] for shard in shards], axis=0)
+    manifest = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "preset": preset,
+        "prevalence": shares or "natural",
+        "seed": seed,
+        "rows": rows,
+        "shard_size": shard_size,
+        "distributions": {col: list(d) for col, d in distributions.items()},
+        "class_counts": dict(zip(DISEASES, counts.tolist())),
+        "seconds": round(seconds, 3),
+        "shards": shards,
+    }
+    with open(os.path.join(output, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate sharded scenario cohorts for stress and imbalance tests.")
+    parser.add_argument("--rows", type=int, default=DEFAULT_SHARD_SIZE, help="number of patients")
+    parser.add_argument("--preset", default="baseline", choices=sorted(PRESETS), help="covariate-shift preset")
+    parser.add_argument("--prevalence", default="natural",
+                        help='"natural", "balanced", or per-disease shares such as "Flu=0.3,Healthy=0.2"')
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE,
+                        help="rows per shard (part file); output depends on this, not on --jobs")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--output", default="data/scenario", help="directory for the part files")
+    parser.add_argument("--list", action="store_true", help="list presets and exit")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.list:
+        for name, (description, _) in PRESETS.items():
+            print(f"{name:18} {description}")
+        raise SystemExit(0)
+
+    manifest = generate_scenario(args.output, args.rows, args.preset, args.prevalence, args.seed,
+                                 args.shard_size, args.jobs)
+    print(f"✅ {args.rows:,} patients ({args.preset}, {args.prevalence} prevalence) in "
+          f"{len(manifest['shards'])} shards written to '{args.output}' in {manifest['seconds']:.1f}s")
+    for disease, count in manifest["class_counts"].items():
+        print(f"   {disease:13} {count:>12,}  {count / args.rows:.4f}")
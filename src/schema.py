@@ -0,0 +1,167 @@
+# src/schema.py
+"""
+Column schema: the compact dtype of every dataset and feature column.
+
+Raw frames keep categoricals as pandas Categorical (1-byte codes plus one
+copy of each level) and numerics as nullable int16 / float32. Encoded
+model features are int8 category codes and float32 numerics. dataset_io
+enforces the raw schema on load and write; the Preprocessor produces the
+encoded one.
+
+    python src/schema.py bench --rows 5000000 --baseline HEAD~1
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# Known levels of every categorical column, in storage order
+CATEGORIES = {
+    "Gender": ["Female", "Male", "Other"],
+    "Cough": ["None", "Mild", "Severe"],
+    "Headache": ["None", "Mild", "Severe"],
+    "Fatigue": ["None", "Moderate", "High"],
+    "Blood_Pressure": ["Normal", "High", "Low"],
+    "Disease": ["Anemia", "Diabetes", "Flu", "Healthy", "Hypertension", "Migraine", "Pneumonia"],
+}
+
+# Compact numeric dtypes; nullable integers keep missing values without a float upcast
+NUMERIC_DTYPES = {
+    "Patient_ID": "int64",
+    "Age": "Int16",
+    "Heart_Rate": "Int16",
+    "Body_Temperature": "float32",
+    "WBC_Count": "float32",
+    "Sugar_Level": "float32",
+}
+
+# Encoded model features
+CODE_DTYPE = np.int8
+FEATURE_DTYPE = np.float32
+
+
+def enforce(df):
+    """
+    Cast the known columns of `df` to their schema dtypes, in place.
+
+    Columns are replaced one at a time, so at most one column is duplicated
+    during the cast. Returns `df`.
+    """
+    for col, categories in CATEGORIES.items():
+        if col not in df.columns:
+            continue
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            if list(df[col].cat.categories[:len(categories)]) != categories:
+                extra = [c for c in df[col].cat.categories if c not in categories]
+                df[col] = df[col].cat.set_categories(categories + extra)
+        else:
+            values = df[col].astype("object").where(df[col].notna(), None)
+            extra = sorted(set(values.dropna().unique()) - set(categories))
+            df[col] = pd.Categorical(values, categories=categories + extra)
+    for col, dtype in NUMERIC_DTYPES.items():
+        if col in df.columns and df[col].dtype != dtype:
+            if dtype.startswith("Int"):
+                # round before the cast so imputed/float columns don't fail the safe-cast check
+                df[col] = pd.to_numeric(df[col]).round().astype(dtype)
+            else:
+                df[col] = df[col].astype(dtype)
+    return df
+
+
+def category_codes(values, categories, dtype=CODE_DTYPE):
+    """
+    Codes of `values` in `categories` (-1 for missing/unknown) without
+    materializing strings: Categorical inputs are recoded by their level table.
+    """
+    values = pd.Series(values, copy=False)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        levels = pd.Index([str(c) for c in values.cat.categories])
+        table = np.append(pd.Index(categories).get_indexer(levels), -1).astype(dtype)
+        # code -1 (missing) picks the trailing -1
+        return table[values.cat.codes.to_numpy()]
+    return pd.Categorical(values, categories=categories).codes.astype(dtype)
+
+
+def memory_mb(df):
+    """Deep in-memory size of a frame in MB."""
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+# ===============================
+# Peak-RSS benchmark of a training run
+# ===============================
+def _peak_rss_run(cmd, cwd, env=None):
+    """Run `cmd` and return (seconds, peak RSS in MB, returncode) of that process alone."""
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode:
+        sys.stderr.write(proc.stderr.read().decode()[-2000:])
+    proc.stderr.close()
+    return time.perf_counter() - start, usage.ru_maxrss / 1024, proc.returncode
+
+
+def _source_tree(rev, repo, dest):
+    """Export src/ of git revision `rev` into `dest`."""
+    archive = subprocess.run(["git", "-C", repo, "archive", rev, "src"], check=True, capture_output=True).stdout
+    subprocess.run(["tar", "-x", "-C", dest], input=archive, check=True)
+    return os.path.join(dest, "src")
+
+
+def benchmark(data, models, baseline=None):
+    """Peak RSS / wall time of model_training.py on `data`, for this tree and optionally a git revision."""
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    data = os.path.abspath(data)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        trees = {"current": os.path.join(repo, "src")}
+        if baseline:
+            trees[baseline] = _source_tree(baseline, repo, tmp)
+        for label, src in trees.items():
+            # training writes models/ relative to the working directory
+            workdir = tempfile.mkdtemp(dir=tmp)
+            os.makedirs(os.path.join(workdir, "models"))
+            cmd = [sys.executable, os.path.join(src, "model_training.py"), "--data", data, "--models", models]
+            seconds, peak, code = _peak_rss_run(cmd, workdir)
+            results[label] = {"peak_rss_mb": round(peak, 1), "seconds": round(seconds, 2), "ok": code == 0}
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Peak-RSS benchmark of training with the compact schema.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="peak RSS of model_training.py on a generated cohort")
+    bench.add_argument("--rows", type=int, default=5_000_000)
+    bench.add_argument("--data", default=None, help="existing dataset (default: generate --rows patients)")
+    bench.add_argument("--models", default="Naive Bayes", help="candidates to train")
+    bench.add_argument("--baseline", default=None, help="git revision to compare against, e.g. HEAD~1")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    from dataset_io import read_dataset, write_dataset
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = args.data
+        if data is None:
+            from data_generation import iter_patient_chunks
+
+            data = os.path.join(tmp, "cohort.parquet")
+            write_dataset(iter_patient_chunks(args.rows), data)
+        df = read_dataset(data)
+        # size of the same rows as object strings / float64, measured on a sample
+        sample = df.head(100_000)
+        legacy = sample.astype({col: object for col in CATEGORIES if col in df})
+        legacy = legacy.astype({col: "float64" for col in NUMERIC_DTYPES if col in df})
+        print(f"✅ {len(df):,} rows: {memory_mb(df):,.1f} MB in memory "
+              f"(~{memory_mb(legacy) * len(df) / len(sample):,.1f} MB as object strings / float64)")
+        del df
+        print(json.dumps(benchmark(data, args.models, args.baseline), indent=2))
@@ -0,0 +1,109 @@
+# src/sketches.py
+"""
+Streaming quantile sketch for statistics over datasets larger than memory.
+
+KLLSketch keeps a few thousand weighted samples regardless of how many
+values it has seen (Karnin, Lang & Liberty, "Optimal Quantile
+Approximation in Streams"). Values arrive in numpy batches; whenever a
+level outgrows its capacity it is sorted and every other item (random
+offset) is promoted to the next level with twice the weight. Rank error is
+about 1.7 / k with high probability. Sketches of different chunks merge.
+
+    sketch = KLLSketch()
+    for chunk in iter_dataset(path, columns=["Sugar_Level"]):
+        sketch.update(chunk["Sugar_Level"].to_numpy(dtype=float, na_value=np.nan))
+    sketch.quantile(0.5)
+"""
+import numpy as np
+
+DEFAULT_K = 400
+# capacity shrinks geometrically towards the lower (lighter) levels
+DECAY = 2 / 3
+
+
+class KLLSketch:
+    def __init__(self, k=DEFAULT_K, seed=42):
+        self.k = k
+        self.rng = np.random.default_rng(seed)
+        self.levels = [np.empty(0)]
+        self.n = 0
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * DECAY ** depth)))
+
+    def update(self, values):
+        """Add a batch of values; NaNs are ignored."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # an odd item out stays behind at this level
+                keep = items[:len(items) % 2]
+                pairs = items[len(items) % 2:]
+                promoted = pairs[self.rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def merge(self, other):
+        """Fold another sketch (same k) into this one."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def _weighted(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        return values[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """Approximate q-quantile(s) of everything seen (NaN when empty)."""
+        if self.n == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        values, ranks = self._weighted()
+        index = np.searchsorted(ranks, np.asarray(q) * ranks[-1], side="left")
+        result = values[np.minimum(index, len(values) - 1)]
+        return result if np.ndim(q) else float(result)
+
+    def rank(self, value):
+        """Approximate fraction of seen values <= value (array in, array out)."""
+        if self.n == 0:
+            return np.zeros(np.shape(value)) if np.ndim(value) else 0.0
+        values, ranks = self._weighted()
+        position = np.searchsorted(values, value, side="right")
+        result = np.where(position > 0, ranks[np.maximum(position - 1, 0)], 0.0) / ranks[-1]
+        return result if np.ndim(value) else float(result)
+
+    def size(self):
+        """Number of stored samples."""
+        return sum(len(items) for items in self.levels)
+
+    def get_state(self):
+        """JSON-serializable state (the random generator restarts from `seed` on load)."""
+        return {"k": self.k, "n": self.n, "levels": [items.tolist() for items in self.levels]}
+
+    @classmethod
+    def from_state(cls, state, seed=42):
+        sketch = cls(state["k"], seed)
+        sketch.n = state["n"]
+        sketch.levels = [np.asarray(items, dtype=np.float64) for items in state["levels"]]
+        return sketch
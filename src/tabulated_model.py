@@ -0,0 +1,373 @@
+# src/tabulated_model.py
+"""
+Tabulated serving: the model's class probabilities precomputed over the
+quantized input grid the form allows.
+
+A tree ensemble only compares each feature against its split thresholds, so
+grid values between two consecutive thresholds always get the same output.
+Every feature's grid (e.g. 0.1 °C temperature steps, integer heart rate,
+category codes) is therefore collapsed into those threshold intervals. The
+table holds one probability vector per combination of intervals: an
+uncompressed, memory-mapped n-d .npy array (uint8 by default). Serving
+becomes an index lookup; rows off the grid (other precisions, out of range,
+missing values) fall back to the real model.
+
+Being uncompressed, the table takes cells x classes x dtype bytes on disk
+and in the page cache, which grows much faster than the model: a forest
+fit on 20k rows can split the grid into over 100M cells. build refuses
+tables above MAX_TABLE_BYTES (256 MB; --max-bytes to change it). Models
+that exceed it should be served directly.
+
+    python src/tabulated_model.py build --output models/tabulated
+    python src/tabulated_model.py validate --output models/tabulated
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from preprocessing import CATEGORICAL_COLUMNS, FEATURE_COLUMNS, model_inputs
+
+TABLE_DIR = "models/tabulated"
+TABLE_NAME = "table.npy"
+META_NAME = "meta.json"
+MAX_TABLE_BYTES = 256_000_000
+
+# (low, high, step) of each numeric input, in dataset units. WBC_Count is in
+# cells/µL: the form's 0.1 x10^9/L steps are 100 cells/µL.
+GRID = {
+    "Age": (1, 100, 1),
+    "Body_Temperature": (34.0, 42.0, 0.1),
+    "Heart_Rate": (40, 180, 1),
+    "WBC_Count": (2000, 20000, 100),
+    "Sugar_Level": (50, 300, 1),
+}
+
+DTYPES = {"uint8": 255, "uint16": 65535, "float32": None}
+
+
+# ===============================
+# Grid construction
+# ===============================
+def grid_values(low, high, step):
+    """The representable inputs low, low+step, ..., high as float32 (like the encoded features)."""
+    decimals = max(0, -int(np.floor(np.log10(step)))) if step < 1 else 0
+    count = int(round((high - low) / step)) + 1
+    return np.round(low + step * np.arange(count), decimals).astype(np.float32)
+
+
+def _trees(model):
+    name = type(model).__name__
+    if name == "GradientBoostingClassifier":
+        return [est.tree_ for est in model.estimators_.ravel()]
+    if name == "RandomForestClassifier":
+        return [est.tree_ for est in model.estimators_]
+    raise ValueError(f"Cannot tabulate {name}; supported: GradientBoostingClassifier, RandomForestClassifier")
+
+
+def feature_cells(model, grids):
+    """
+    Per feature: (lookup from grid index to cell, one representative value per cell).
+
+    Grid values that fall between the same pair of split thresholds share a cell.
+    """
+    thresholds = [[] for _ in FEATURE_COLUMNS]
+    for tree in _trees(model):
+        for f, thr in zip(tree.feature, tree.threshold):
+            if f >= 0:
+                thresholds[f].append(thr)
+    cells = []
+    for f, values in enumerate(grids):
+        # the trees compare float32 inputs against float64 thresholds: x <= thr goes left
+        side = np.searchsorted(np.unique(thresholds[f]), values.astype(np.float64), side="left")
+        lookup = np.unique(side, return_inverse=True)[1].astype(np.int32)
+        first = np.unique(lookup, return_index=True)[1]
+        cells.append((lookup, values[first]))
+    return cells
+
+
+def _tree_terms(model, reps):
+    """
+    The ensemble's raw output as a few per-class arrays over small sub-grids:
+    [(class index, array shaped to broadcast against the full table)].
+
+    Each tree is evaluated on the representative grid of the features it
+    uses; trees whose features are a subset of another term's are folded
+    into it, so building the table takes a handful of full-size additions
+    per class instead of one per tree.
+    """
+    if type(model).__name__ == "GradientBoostingClassifier":
+        n_outputs = model.estimators_.shape[1]
+        estimators = [(t % n_outputs, est) for t, est in enumerate(model.estimators_.ravel())]
+        scale = model.learning_rate
+    else:
+        estimators = [(None, est) for est in model.estimators_]
+        scale = 1.0 / len(model.estimators_)
+
+    groups = {}
+    for output, est in estimators:
+        tree = est.tree_
+        used = tuple(sorted({int(f) for f in tree.feature if f >= 0}))
+        shape = [len(reps[f]) if f in used else 1 for f in range(len(reps))]
+        X = np.zeros((int(np.prod(shape)), len(reps)), dtype=np.float32)
+        for col, values in zip(used, np.meshgrid(*[reps[f] for f in used], indexing="ij")):
+            X[:, col] = values.ravel()
+        leaves = tree.apply(X)
+        if output is None:
+            value = tree.value[leaves, 0, :]
+            value = value / value.sum(axis=1, keepdims=True)
+            outputs = [(k, value[:, k]) for k in range(value.shape[1])]
+        else:
+            outputs = [(output, tree.value[leaves, 0, 0])]
+        for k, column in outputs:
+            term = (column * scale).reshape(shape)
+            if (k, used) in groups:
+                groups[k, used] += term
+            else:
+                groups[k, used] = term
+
+    # fold each feature set into the largest superset of it
+    terms = {}
+    for (k, used), term in sorted(groups.items(), key=lambda item: -len(item[0][1])):
+        target = next((key for key in terms if key[0] == k and set(used) <= set(key[1])), None)
+        if target is None:
+            terms[k, used] = term
+        else:
+            terms[target] = terms[target] + term
+    return [(k, term) for (k, _), term in terms.items()]
+
+
+def _link(raw, model):
+    """Raw block -> probabilities (softmax / sigmoid for gradient boosting)."""
+    if type(model).__name__ != "GradientBoostingClassifier":
+        return raw
+    if raw.shape[-1] == 1:
+        positive = 1.0 / (1.0 + np.exp(-raw[..., 0]))
+        return np.stack([1.0 - positive, positive], axis=-1)
+    shifted = np.exp(raw - raw.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+
+def _quantize(proba, dtype):
+    scale = DTYPES[dtype]
+    if scale is None:
+        return proba.astype(np.float32)
+    return np.rint(proba * scale).astype(dtype)
+
+
+def build_table(pipeline, path=TABLE_DIR, dtype="uint8", max_bytes=MAX_TABLE_BYTES):
+    """Precompute the probability table for `pipeline` into `path`. Returns the meta dict."""
+    model, preprocessor = pipeline["model"], pipeline["preprocessor"]
+    grids = [
+        np.arange(len(preprocessor.categories_[col]), dtype=np.float32) if col in CATEGORICAL_COLUMNS
+        else grid_values(*GRID[col])
+        for col in FEATURE_COLUMNS
+    ]
+    cells = feature_cells(model, grids)
+    shape = [len(reps) for _, reps in cells]
+    n_cells = int(np.prod(shape, dtype=np.float64))
+    n_classes = len(model.classes_)
+    n_bytes = n_cells * n_classes * np.dtype(dtype).itemsize
+    if n_bytes > max_bytes:
+        raise ValueError(f"{pipeline['model_name']} splits the grid into {n_cells:,} cells: a "
+                         f"{n_bytes / 1e6:,.0f} MB {dtype} table (limit {max_bytes / 1e6:,.0f} MB); "
+                         "it is too fine-grained to tabulate")
+
+    reps = [r for _, r in cells]
+    os.makedirs(path, exist_ok=True)
+    table = np.lib.format.open_memmap(os.path.join(path, TABLE_NAME), mode="w+",
+                                      dtype=np.dtype(dtype), shape=tuple(shape) + (n_classes,))
+    terms = _tree_terms(model, reps)
+    is_gb = type(model).__name__ == "GradientBoostingClassifier"
+    n_outputs = model.estimators_.shape[1] if is_gb else n_classes
+    base = (np.asarray(model._raw_predict_init(np.zeros((1, len(FEATURE_COLUMNS))))[0])
+            if is_gb else np.zeros(n_outputs))
+
+    # one slab of the first feature at a time bounds memory; class-major for contiguous adds
+    for i in range(shape[0]):
+        raw = np.empty((n_outputs,) + tuple(shape[1:]))
+        raw[:] = base.reshape((n_outputs,) + (1,) * (len(shape) - 1))
+        for output, term in terms:
+            raw[output] += term[i if len(term) > 1 else 0]
+        table[i] = _quantize(_link(np.moveaxis(raw, 0, -1), model), dtype)
+    table.flush()
+
+    meta = {
+        "model_name": pipeline["model_name"],
+        "model_sha256": pipeline.get("sha256"),
+        "dtype": dtype,
+        "shape": shape,
+        "classes": [int(c) for c in model.classes_],
+        "feature_columns": FEATURE_COLUMNS,
+        "grid": {col: list(GRID[col]) for col in FEATURE_COLUMNS if col in GRID},
+        "lookups": [lookup.tolist() for lookup, _ in cells],
+    }
+    with open(os.path.join(path, META_NAME), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+# ===============================
+# Serving
+# ===============================
+class TabulatedModel:
+    """
+    Drop-in for the pipeline's model: predict_proba on encoded features via
+    table lookup, falling back to the real model for rows off the grid.
+    """
+
+    def __init__(self, path, fallback):
+        with open(os.path.join(path, META_NAME)) as f:
+            self.meta = json.load(f)
+        self.table = np.asarray(np.load(os.path.join(path, TABLE_NAME), mmap_mode="r"))
+        self.fallback = fallback
+        self.classes_ = np.asarray(self.meta["classes"])
+        self.scale = DTYPES[self.meta["dtype"]]
+        self.lookups = [np.asarray(lookup, dtype=np.intp) for lookup in self.meta["lookups"]]
+        self.grids = [
+            grid_values(*self.meta["grid"][col]) if col in self.meta["grid"]
+            else np.arange(len(self.lookups[f]), dtype=np.float32)
+            for f, col in enumerate(self.meta["feature_columns"])
+        ]
+        self.table_rows = 0
+        self.fallback_rows = 0
+
+    def _cells(self, X):
+        """Table index per feature, and which rows lie on the grid."""
+        index, on_grid = [], np.ones(len(X), dtype=bool)
+        for f, col in enumerate(self.meta["feature_columns"]):
+            x = X[:, f]
+            grid = self.grids[f]
+            if col in self.meta["grid"]:
+                low, _, step = self.meta["grid"][col]
+                pos = np.rint((x - low) / step)
+            else:
+                pos = x
+            pos = np.where(np.isfinite(pos), pos, -1).astype(np.intp)
+            valid = (pos >= 0) & (pos < len(grid))
+            pos = np.where(valid, pos, 0)
+            on_grid &= valid & (grid[pos] == x)
+            index.append(self.lookups[f][pos])
+        return tuple(index), on_grid
+
+    def predict_proba(self, X):
+        values = np.asarray(X, dtype=np.float32)
+        index, on_grid = self._cells(values)
+        proba = self.table[index].astype(np.float64)
+        if self.scale is not None:
+            proba /= proba.sum(axis=1, keepdims=True)
+        if not on_grid.all():
+            off = ~on_grid
+            rows = X[off] if not hasattr(X, "iloc") else X.iloc[np.flatnonzero(off)]
+            proba[off] = self.fallback.predict_proba(rows)
+        self.table_rows += int(on_grid.sum())
+        self.fallback_rows += int((~on_grid).sum())
+        return proba
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def stats(self):
+        total = self.table_rows + self.fallback_rows
+        return {"table_rows": self.table_rows, "fallback_rows": self.fallback_rows,
+                "table_fraction": round(self.table_rows / total, 4) if total else 0.0}
+
+
+def tabulated_pipeline(pipeline, path=TABLE_DIR):
+    """A copy of `pipeline` whose model answers from the table built at `path`."""
+    model = TabulatedModel(path, pipeline["model"])
+    expected = model.meta.get("model_sha256")
+    if expected and pipeline.get("sha256") and expected != pipeline["sha256"]:
+        raise ValueError(f"{path} was built for a different model artifact; rebuild it")
+    # quantized answers differ from the exact model's, so they get their own cache keys
+    key = json.dumps([pipeline.get("sha256"), model.meta["dtype"], model.meta["grid"]], sort_keys=True)
+    return {**pipeline, "model": model, "sha256": hashlib.sha256(key.encode()).hexdigest()}
+
+
+# ===============================
+# Validation
+# ===============================
+def random_grid_patients(preprocessor, n, seed=42):
+    """Random on-grid patients spanning the form's ranges (raw, unencoded)."""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    data = {}
+    for col in FEATURE_COLUMNS:
+        if col in CATEGORICAL_COLUMNS:
+            data[col] = rng.choice(list(preprocessor.categories_[col]), n)
+        else:
+            grid = grid_values(*GRID[col])
+            data[col] = grid[rng.integers(0, len(grid), n)]
+    return pd.DataFrame(data)
+
+
+def validate(pipeline, tabulated, n=100_000, seed=42):
+    """Max probability deviation / label agreement on random grid patients, and latency."""
+    df = random_grid_patients(pipeline["preprocessor"], n, seed)
+    X = model_inputs(pipeline, df)
+
+    start = time.perf_counter()
+    expected = pipeline["model"].predict_proba(X)
+    model_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    got = tabulated["model"].predict_proba(X)
+    table_seconds = time.perf_counter() - start
+
+    single = X.iloc[:1]
+    timings = {}
+    for label, model in (("model", pipeline["model"]), ("table", tabulated["model"])):
+        start = time.perf_counter()
+        for _ in range(200):
+            model.predict_proba(single)
+        timings[label] = (time.perf_counter() - start) / 200
+
+    deviation = np.abs(got - expected)
+    return {
+        "rows": n,
+        "max_abs_proba_deviation": float(deviation.max()),
+        "mean_abs_proba_deviation": float(deviation.mean()),
+        "label_agreement": float((got.argmax(axis=1) == expected.argmax(axis=1)).mean()),
+        "batch_rows_per_s": {"model": round(n / model_seconds), "table": round(n / table_seconds)},
+        "single_row_ms": {"model": round(timings["model"] * 1000, 3), "table": round(timings["table"] * 1000, 3)},
+        "table_stats": tabulated["model"].stats(),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Precompute and validate the tabulated serving table.")
+    parser.add_argument("command", choices=["build", "validate"])
+    parser.add_argument("--model", default=None,
+                        help="pipeline artifact (default: current model from models/manifest.json)")
+    parser.add_argument("--output", default=TABLE_DIR)
+    parser.add_argument("--dtype", choices=list(DTYPES), default="uint8", help="probability storage type")
+    parser.add_argument("--max-bytes", type=int, default=MAX_TABLE_BYTES,
+                        help="refuse to write a larger table (cells x classes x dtype size)")
+    parser.add_argument("--samples", type=int, default=100_000, help="validation patients")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from model_registry import current_artifact_path, load_artifact
+
+    args = parse_args()
+    pipeline = load_artifact(args.model or current_artifact_path())
+
+    if args.command == "build":
+        start = time.perf_counter()
+        try:
+            meta = build_table(pipeline, args.output, args.dtype, args.max_bytes)
+        except ValueError as exc:
+            raise SystemExit(f"❌ {exc}")
+        size = os.path.getsize(os.path.join(args.output, TABLE_NAME))
+        print(f"✅ Tabulated {meta['model_name']}: cells per feature "
+              f"{dict(zip(FEATURE_COLUMNS, meta['shape']))}")
+        print(f"   {size / 1e6:,.1f} MB ({args.dtype}) in {time.perf_counter() - start:.1f}s -> '{args.output}'")
+
+    report = validate(pipeline, tabulated_pipeline(pipeline, args.output), args.samples)
+    with open(os.path.join(args.output, "validation.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
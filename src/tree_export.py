@@ -0,0 +1,141 @@
+# src/tree_export.py
+"""
+Flatten a trained sklearn tree ensemble into contiguous numpy arrays.
+
+Supported: GradientBoostingClassifier and RandomForestClassifier. The
+output directory holds one uncompressed .npy file per node array (so it can
+be memory-mapped) and a meta.json header; flat_predictor.FlatTreePredictor
+evaluates it without importing sklearn.
+
+    python src/tree_export.py models/flat_model --check data/patient_symptoms_dataset.parquet
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from flat_predictor import ARRAY_NAMES, META_NAME, FlatTreePredictor
+from preprocessing import FEATURE_COLUMNS
+
+FLAT_MODEL_DIR = "models/flat_model"
+
+SUPPORTED = {
+    "GradientBoostingClassifier": "gradient_boosting",
+    "RandomForestClassifier": "random_forest",
+}
+
+
+def supports(model):
+    return type(model).__name__ in SUPPORTED
+
+
+def _trees(model, kind):
+    if kind == "gradient_boosting":
+        # stage-major order: stage 0 class 0..K-1, stage 1 class 0..K-1, ...
+        return [est.tree_ for est in model.estimators_.ravel()]
+    return [est.tree_ for est in model.estimators_]
+
+
+def _leaf_values(tree, kind):
+    if kind == "gradient_boosting":
+        return tree.value[:, 0, 0:1].astype(np.float64)
+    # same normalisation as DecisionTreeClassifier.predict_proba
+    value = tree.value[:, 0, :].astype(np.float64)
+    normalizer = value.sum(axis=1)[:, np.newaxis]
+    normalizer[normalizer == 0.0] = 1.0
+    return value / normalizer
+
+
+def flatten(model):
+    """Return (arrays, header) describing every tree of `model`."""
+    kind = SUPPORTED.get(type(model).__name__)
+    if kind is None:
+        raise ValueError(f"Cannot flatten {type(model).__name__}; supported: {sorted(SUPPORTED)}")
+
+    parts = {name: [] for name in ARRAY_NAMES if name != "roots"}
+    roots, offset, max_depth = [], 0, 0
+    for tree in _trees(model, kind):
+        n_nodes = tree.node_count
+        own = np.arange(offset, offset + n_nodes, dtype=np.int64)
+        is_leaf = tree.children_left < 0
+
+        left = np.where(is_leaf, own, tree.children_left + offset)
+        right = np.where(is_leaf, own, tree.children_right + offset)
+        parts["feature"].append(np.where(is_leaf, 0, tree.feature).astype(np.int64))
+        parts["threshold"].append(tree.threshold.astype(np.float64))
+        parts["children"].append(np.column_stack([left, right]).ravel().astype(np.int64))
+        missing_left = getattr(tree, "missing_go_to_left", np.zeros(n_nodes, dtype=np.uint8))
+        parts["missing_left"].append(np.asarray(missing_left).astype(bool))
+        parts["value"].append(_leaf_values(tree, kind))
+
+        roots.append(offset)
+        offset += n_nodes
+        max_depth = max(max_depth, tree.max_depth)
+
+    arrays = {name: np.ascontiguousarray(np.concatenate(chunks)) for name, chunks in parts.items()}
+    arrays["roots"] = np.asarray(roots, dtype=np.int64)
+
+    header = {"kind": kind, "max_depth": int(max_depth), "n_trees": len(roots), "n_nodes": int(offset)}
+    if kind == "gradient_boosting":
+        zeros = np.zeros((1, model.n_features_in_))
+        header["learning_rate"] = float(model.learning_rate)
+        header["base_score"] = model._raw_predict_init(zeros)[0].tolist()
+    return arrays, header
+
+
+def export_pipeline(pipeline, path=FLAT_MODEL_DIR):
+    """Export a pipeline's model (plus preprocessing tables) to `path`."""
+    model, preprocessor = pipeline["model"], pipeline["preprocessor"]
+    arrays, header = flatten(model)
+    header.update({
+        "model_name": pipeline["model_name"],
+        "feature_columns": FEATURE_COLUMNS,
+        "classes": list(preprocessor.decode_target(model.classes_)),
+        "impute": pipeline.get("impute", True),
+        "preprocessor": preprocessor.get_state(),
+    })
+
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + ".npy"), array)
+    with open(os.path.join(path, META_NAME), "w") as f:
+        json.dump(header, f, indent=2)
+    return header
+
+
+def check_export(pipeline, predictor, df):
+    """Compare the flat predictor with the sklearn model on `df`."""
+    from preprocessing import model_inputs
+
+    X = model_inputs(pipeline, df)
+    expected = pipeline["preprocessor"].decode_target(pipeline["model"].predict(X))
+    proba_diff = np.abs(pipeline["model"].predict_proba(X) - predictor.predict_proba(X.to_numpy())).max()
+    return {
+        "rows": len(df),
+        "prediction_mismatches": int((predictor.predict(X.to_numpy()) != expected).sum()),
+        "max_proba_abs_diff": float(proba_diff),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the current model as flat numpy arrays.")
+    parser.add_argument("output", nargs="?", default=FLAT_MODEL_DIR)
+    parser.add_argument("--model", default=None,
+                        help="pipeline artifact (default: current model from models/manifest.json)")
+    parser.add_argument("--check", metavar="DATASET", default=None,
+                        help="verify predictions against the sklearn model on this dataset")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from dataset_io import read_dataset
+    from model_registry import current_artifact_path, load_artifact
+
+    args = parse_args()
+    pipeline = load_artifact(args.model or current_artifact_path())
+    header = export_pipeline(pipeline, args.output)
+    print(f"✅ Exported {header['model_name']} ({header['n_trees']} trees, {header['n_nodes']} nodes) "
+          f"to '{args.output}'")
+    if args.check:
+        print(check_export(pipeline, FlatTreePredictor.load(args.output), read_dataset(args.check)))
@@ -0,0 +1,313 @@
+# src/tuning.py
+"""
+Hyperparameter search for the candidate models.
+
+Configurations are sampled from per-model search spaces and raced with
+Hyperband: each bracket starts many configurations on a small subsample of
+the training split and promotes the best 1/eta to eta-times more rows,
+until the survivors train on all of it. All trials of a round run on one
+process pool. Every finished trial is written to a SQLite trial store keyed
+by (dataset, model, configuration, rows), so an interrupted search resumes
+where it stopped and a configuration is never trained twice on the same
+rows.
+
+The best configuration per model is written to models/tuned_params.json;
+`model_training.py --tuned-params models/tuned_params.json` trains with it
+and records it in the manifest.
+
+    python src/tuning.py --configs 200 --jobs 8
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from dataset_io import DATA_PATH, read_dataset
+from model_training import NATIVE_MISSING, RANDOM_STATE, dataset_key, models
+from preprocessing import TARGET_COLUMN, Preprocessor
+
+STORE_PATH = "models/tuning_trials.sqlite"
+TUNED_PARAMS_PATH = "models/tuned_params.json"
+VALIDATION_FRACTION = 0.2
+
+# (kind, ...) per parameter: ("log", low, high), ("uniform", low, high), ("int", low, high), ("choice", values)
+SEARCH_SPACES = {
+    "Logistic Regression": {
+        "C": ("log", 1e-3, 1e2),
+    },
+    "Naive Bayes": {
+        "var_smoothing": ("log", 1e-12, 1e-6),
+    },
+    "Support Vector Machine": {
+        "C": ("log", 0.1, 100.0),
+        "gamma": ("log", 1e-3, 1.0),
+    },
+    "Random Forest": {
+        "n_estimators": ("choice", [50, 100, 200, 400]),
+        "max_depth": ("choice", [None, 4, 8, 16, 32]),
+        "min_samples_leaf": ("choice", [1, 2, 4, 8]),
+        "max_features": ("choice", ["sqrt", "log2", 0.5, None]),
+    },
+    "Gradient Boosting": {
+        "n_estimators": ("int", 50, 300),
+        "learning_rate": ("log", 0.01, 0.3),
+        "max_depth": ("int", 2, 5),
+        "subsample": ("uniform", 0.6, 1.0),
+    },
+    "Hist Gradient Boosting": {
+        "learning_rate": ("log", 0.02, 0.3),
+        "max_leaf_nodes": ("int", 15, 127),
+        "min_samples_leaf": ("int", 5, 100),
+        "l2_regularization": ("log", 1e-4, 10.0),
+    },
+}
+
+
+# ===============================
+# Search space
+# ===============================
+def sample_config(space, rng):
+    """One configuration; continuous values keep 3 significant digits so repeats are recognizable."""
+    config = {}
+    for param, (kind, *spec) in space.items():
+        if kind == "choice":
+            value = spec[0][rng.integers(len(spec[0]))]
+        elif kind == "int":
+            value = int(rng.integers(spec[0], spec[1] + 1))
+        elif kind == "log":
+            value = float(f"{math.exp(rng.uniform(math.log(spec[0]), math.log(spec[1]))):.3g}")
+        elif kind == "uniform":
+            value = float(f"{rng.uniform(spec[0], spec[1]):.3g}")
+        else:
+            raise ValueError(f"Unknown search space kind {kind!r} for {param}")
+        config[param] = value
+    return config
+
+
+def config_key(config):
+    return json.dumps(config, sort_keys=True)
+
+
+def hyperband_brackets(max_rows, min_rows, eta, n_configs):
+    """
+    [(configurations, promotions)] per bracket, from the most aggressive
+    (many configurations starting on ~min_rows) to plain full-size training.
+    A bracket with s promotions starts on max_rows / eta**s rows.
+    """
+    s_max = max(0, int(math.floor(math.log(max_rows / min_rows, eta) + 1e-9)))
+    weights = [eta ** s / (s + 1) for s in range(s_max, -1, -1)]
+    return [(max(1, round(n_configs * w / sum(weights))), s) for s, w in zip(range(s_max, -1, -1), weights)]
+
+
+def rung_rows(max_rows, eta, s):
+    return int(round(max_rows / eta ** s))
+
+
+# ===============================
+# Trial store
+# ===============================
+class TrialStore:
+    """Finished trials on disk, keyed by dataset, model, configuration and rows."""
+
+    def __init__(self, path=STORE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS trials ("
+            " key TEXT PRIMARY KEY, dataset TEXT, model TEXT, config TEXT, rows INTEGER,"
+            " score REAL, fit_seconds REAL, error TEXT, created REAL)"
+        )
+
+    @staticmethod
+    def key(dataset, model, config, rows):
+        return hashlib.sha256(json.dumps([dataset, model, config_key(config), rows]).encode()).hexdigest()
+
+    def get(self, key):
+        row = self.conn.execute("SELECT score, fit_seconds, error FROM trials WHERE key = ?", [key]).fetchone()
+        return None if row is None else {"score": row[0], "fit_seconds": row[1], "error": row[2]}
+
+    def put(self, key, dataset, model, config, rows, result):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [key, dataset, model, config_key(config), rows, result["score"], result["fit_seconds"],
+             result["error"], time.time()],
+        )
+
+    def trials(self, dataset):
+        return pd.read_sql_query("SELECT model, config, rows, score, fit_seconds, error FROM trials "
+                                 "WHERE dataset = ?", self.conn, params=[dataset])
+
+
+# ===============================
+# Worker Jobs
+# ===============================
+_data = {}
+
+
+def _init_worker(X_train, y_train, X_val, y_val, X_train_raw=None, X_val_raw=None):
+    _data.update(X_train=X_train, y_train=y_train, X_val=X_val, y_val=y_val,
+                 X_train_raw=X_train_raw, X_val_raw=X_val_raw)
+
+
+def _run_trial(job):
+    """Fit one configuration on the first `rows` training rows; weighted F1 on the validation split."""
+    from sklearn.metrics import f1_score
+
+    name, config, rows = job
+    suffix = "_raw" if name in NATIVE_MISSING else ""
+    start = time.perf_counter()
+    try:
+        model = models[name]().set_params(**config)
+        model.fit(_data["X_train" + suffix].iloc[:rows], _data["y_train"][:rows])
+        fit_seconds = time.perf_counter() - start
+        score = f1_score(_data["y_val"], model.predict(_data["X_val" + suffix]), average="weighted")
+        return {"score": float(score), "fit_seconds": fit_seconds, "error": None}
+    except Exception as exc:  # an invalid combination loses the race instead of stopping the search
+        return {"score": float("-inf"), "fit_seconds": time.perf_counter() - start, "error": repr(exc)}
+
+
+# ===============================
+# Hyperband
+# ===============================
+def search(names, data, dataset_key, store, n_configs=100, eta=3, min_rows=200, n_jobs=1, seed=RANDOM_STATE):
+    """
+    Race `n_configs` configurations per model; returns {model: best trial at the largest rows}.
+    """
+    max_rows = len(data[1])
+    rng = np.random.default_rng(seed)
+    # bracket state: model, live configurations, promotions left, rows of the current rung
+    brackets = []
+    for name in names:
+        seen = set()
+        for count, s in hyperband_brackets(max_rows, min_rows, eta, n_configs):
+            configs = []
+            for _ in range(count):
+                config = sample_config(SEARCH_SPACES[name], rng)
+                if config_key(config) not in seen:
+                    seen.add(config_key(config))
+                    configs.append(config)
+            brackets.append({"model": name, "configs": configs, "s": s, "rows": rung_rows(max_rows, eta, s)})
+
+    stats = {"trials": 0, "cached": 0, "trained": 0}
+    best = {}
+    executor = ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=data) \
+        if n_jobs > 1 else None
+    if executor is None:
+        _init_worker(*data)
+    try:
+        while brackets:
+            # one round: the current rung of every live bracket
+            jobs, keys, results = [], [], {}
+            for bracket in brackets:
+                for config in bracket["configs"]:
+                    key = store.key(dataset_key, bracket["model"], config, bracket["rows"])
+                    cached = store.get(key)
+                    stats["trials"] += 1
+                    if cached is not None:
+                        results[key] = cached
+                        stats["cached"] += 1
+                    elif key not in keys:
+                        jobs.append((bracket["model"], config, bracket["rows"]))
+                        keys.append(key)
+            run = executor.map(_run_trial, jobs) if executor else map(_run_trial, jobs)
+            for key, job, result in zip(keys, jobs, run):
+                store.put(key, dataset_key, *job, result)
+                results[key] = result
+                stats["trained"] += 1
+
+            survivors = []
+            for bracket in brackets:
+                scored = sorted(
+                    ((results[store.key(dataset_key, bracket["model"], c, bracket["rows"])]["score"], i, c)
+                     for i, c in enumerate(bracket["configs"])),
+                    key=lambda item: (-item[0], item[1]),
+                )
+                top_score, _, top_config = scored[0]
+                current = best.get(bracket["model"])
+                if current is None or (bracket["rows"], top_score) > (current["rows"], current["score"]):
+                    best[bracket["model"]] = {"params": top_config, "score": top_score, "rows": bracket["rows"]}
+                if bracket["s"] == 0:
+                    continue
+                keep = max(1, len(scored) // eta)
+                survivors.append({"model": bracket["model"], "configs": [c for _, _, c in scored[:keep]],
+                                  "s": bracket["s"] - 1, "rows": rung_rows(max_rows, eta, bracket["s"] - 1)})
+            brackets = survivors
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return best, stats
+
+
+def prepare(path, seed=RANDOM_STATE):
+    """Training split of model_training.py, split again into search-train / validation."""
+    from sklearn.model_selection import train_test_split
+
+    df = read_dataset(path)
+    preprocessor = Preprocessor()
+    X = preprocessor.fit_transform(df)
+    X_raw = preprocessor.transform(df, impute=False)
+    y = preprocessor.encode_target(df[TARGET_COLUMN])
+    del df
+
+    # same outer split as model_training.py: the test rows stay unseen
+    train_idx, _ = train_test_split(np.arange(len(y)), test_size=0.2, random_state=RANDOM_STATE, stratify=y)
+    fit_idx, val_idx = train_test_split(train_idx, test_size=VALIDATION_FRACTION, random_state=seed,
+                                        stratify=y[train_idx])
+    return (X.iloc[fit_idx], y[fit_idx], X.iloc[val_idx], y[val_idx], X_raw.iloc[fit_idx], X_raw.iloc[val_idx])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Hyperband search over the candidate models' hyperparameters.")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--models", default=",".join(SEARCH_SPACES), help="comma-separated candidate names")
+    parser.add_argument("--configs", type=int, default=100, help="configurations sampled per model")
+    parser.add_argument("--eta", type=int, default=3, help="keep 1/eta per rung, grow rows eta-fold")
+    parser.add_argument("--min-rows", type=int, default=200, help="training rows of the smallest rung")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--seed", type=int, default=RANDOM_STATE)
+    parser.add_argument("--store", default=STORE_PATH, help="SQLite trial store (resumes interrupted searches)")
+    parser.add_argument("--output", default=TUNED_PARAMS_PATH)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    candidates = [name.strip() for name in args.models.split(",") if name.strip()]
+    unknown = set(candidates) - set(SEARCH_SPACES)
+    if unknown:
+        raise SystemExit(f"Unknown models: {sorted(unknown)}; choose from {list(SEARCH_SPACES)}")
+
+    start = time.perf_counter()
+    data = prepare(args.data, args.seed)
+    key = dataset_key(args.data, args.seed)
+    store = TrialStore(args.store)
+    print(f"Hyperband over {len(candidates)} models x {args.configs} configurations "
+          f"({len(data[1])} search rows, eta={args.eta}): brackets "
+          f"{hyperband_brackets(len(data[1]), args.min_rows, args.eta, args.configs)}")
+
+    best, stats = search(candidates, data, key, store, args.configs, args.eta, args.min_rows,
+                         args.jobs, args.seed)
+
+    table = pd.DataFrame([{"Model": name, "Validation_F1": r["score"], "Rows": r["rows"],
+                           "Params": config_key(r["params"])} for name, r in best.items()])
+    print("\n=== Best configuration per model ===")
+    print(table.sort_values("Validation_F1", ascending=False).round(4).to_string(index=False))
+    print(f"\n✅ {stats['trials']} trials ({stats['trained']} trained, {stats['cached']} from the trial store) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    tuned = {}
+    if os.path.exists(args.output):
+        with open(args.output) as f:
+            tuned = json.load(f)
+    tuned.update({name: {**r, "dataset": key} for name, r in best.items()})
+    with open(args.output, "w") as f:
+        json.dump(tuned, f, indent=2)
+    print(f"✅ Tuned parameters saved to {args.output}")
@@ -1,7 +1,12 @@
 # src/utils.py
+import importlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import LabelEncoder
+
+from schema import CODE_DTYPE, category_codes
 
 # symptom level mapping for ordinal symptoms if represented as strings
 SYMPTOM_ORDINAL = {
@@ -13,56 +18,95 @@ SYMPTOM_ORDINAL = {
 }
 
 def fill_missing_values(df):
-    """Fill numeric columns with median, categorical with mode."""
-    df = df.copy()
+    """Fill numeric columns with median, categorical with mode (in place; returns df)."""
     for col in df.columns:
+        if not df[col].isnull().any():
+            continue
         if df[col].dtype.kind in "biufc":  # numeric
-            if df[col].isnull().any():
-                df[col].fillna(df[col].median(), inplace=True)
+            df[col] = df[col].fillna(df[col].median())
         else:
-            if df[col].isnull().any():
-                df[col].fillna(df[col].mode().iloc[0], inplace=True)
+            df[col] = df[col].fillna(df[col].mode().iloc[0])
     return df
 
 def map_symptom_ordinal(df, cols):
-    """Map symptom string levels to ordinal ints (inplace on copy)."""
-    df = df.copy()
+    """Map symptom string levels to int8 ordinals (in place; returns df)."""
     for c in cols:
         if c in df.columns:
-            df[c] = df[c].astype(str).map(SYMPTOM_ORDINAL).fillna(0).astype(int)
+            # look up each level once, then gather by category code (unknown/missing -> 0)
+            values = df[c].astype("category")
+            table = np.array([SYMPTOM_ORDINAL.get(str(level), 0) for level in values.cat.categories] + [0],
+                             dtype=np.int8)
+            df[c] = table[values.cat.codes.to_numpy()]
     return df
 
+def _string_levels(values):
+    """
+    Column as a Categorical of string levels, like astype(str) (None -> "None",
+    NaN -> "nan") but converting each level once instead of every row.
+    """
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        return values.astype(str).astype("category")
+    if values.isna().any():
+        values = values.cat.add_categories(["nan"]).fillna("nan")
+    return values.cat.rename_categories([str(c) for c in values.cat.categories])
+
 def encode_categoricals(df, exclude_cols=None):
     """
-    Label-encode non-numeric columns. Returns (df_encoded, encoders_dict).
+    Label-encode non-numeric columns in place. Returns (df, encoders_dict).
     exclude_cols: list of columns to skip (already numeric or target).
     """
-    df = df.copy()
+    from sklearn.preprocessing import LabelEncoder
+
     encoders = {}
     exclude_cols = exclude_cols or []
     for col in df.columns:
         if col in exclude_cols:
             continue
         if df[col].dtype == 'object' or df[col].dtype.name == 'category':
-            le = LabelEncoder()
-            df[col] = le.fit_transform(df[col].astype(str))
+            values = _string_levels(df[col])
+            # fit on the distinct levels only
+            le = LabelEncoder().fit(values.cat.remove_unused_categories().cat.categories)
+            df[col] = category_codes(values, list(le.classes_))
             encoders[col] = le
     return df, encoders
 
 def apply_encoders(df, encoders):
-    """Apply saved LabelEncoders mapping to a dataframe (for prediction)."""
-    df = df.copy()
+    """Apply saved LabelEncoders mapping to a dataframe in place (for prediction)."""
     for col, le in encoders.items():
         if col in df.columns:
-            # transform safely (map unknowns to most frequent class)
-            vals = df[col].astype(str).tolist()
-            transformed = []
-            classes = set(le.classes_)
-            for v in vals:
-                if v in classes:
-                    transformed.append(le.transform([v])[0])
-                else:
-                    # fallback to mode (class 0)
-                    transformed.append(0)
-            df[col] = transformed
+            # whole-column lookup; unknowns map to class 0 (fallback to mode)
+            codes = category_codes(_string_levels(df[col]), list(le.classes_))
+            df[col] = np.where(codes < 0, 0, codes).astype(CODE_DTYPE)
     return df
+
+
+def bounded_parallel_map(fn, items, n_jobs=1, window=None):
+    """Ordered, lazy map of `fn` over `items` on a process pool.
+
+    At most `window` tasks (default 2 * n_jobs) are in flight, so results are
+    consumed as they are produced instead of piling up in memory.
+    With n_jobs=1 everything runs inline in the calling process.
+    """
+    if n_jobs is None or n_jobs <= 1:
+        for item in items:
+            yield fn(item)
+        return
+
+    window = window or 2 * n_jobs
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def optional_import(module, extra=None):
+    """Import an optional dependency on first use, with an install hint if missing."""
+    try:
+        return importlib.import_module(module)
+    except ImportError as exc:
+        package = extra or module.split(".")[0]
+        raise ImportError(f"{module} is required for this feature: pip install {package}") from exc
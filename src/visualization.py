@@ -1,108 +1,291 @@
-import joblib
+# src/visualization.py
+"""
+Evaluation plots for the current model.
+
+The dataset is streamed in chunks: the confusion matrix, per-class metrics
+and vital-sign histograms are accumulated chunk by chunk, and KDE curves
+and permutation importance use a bounded reservoir sample. Figures only
+see these fixed-size summaries and are rendered in parallel worker
+processes, so plotting time does not grow with the dataset.
+
+    python src/visualization.py --data data/patient_symptoms_dataset.parquet --jobs 3
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.metrics import confusion_matrix
 
-# ----------------------------
-# Load trained model & encoders
-# ----------------------------
-model = joblib.load("models/Random Forest_model.pkl")
-feature_encoders = joblib.load("models/feature_encoders.pkl")
-target_encoder = joblib.load("models/target_encoder.pkl")
+from dataset_io import DATA_PATH, ROW_GROUP_SIZE, column_ranges, iter_dataset
+from model_registry import load_current
+from preprocessing import TARGET_COLUMN, model_inputs
 
-# ----------------------------
-# Load dataset
-# ----------------------------
-df = pd.read_csv("data/patient_symptoms_dataset.csv")
+VITALS = ["Body_Temperature", "Heart_Rate", "WBC_Count", "Sugar_Level"]
+HIST_BINS = 50
+KDE_POINTS = 200
+SAMPLE_SIZE = 20_000
+PERMUTATION_ROWS = 5000
 
-X = df.drop(columns=["Disease", "Patient_ID"])
-y = df["Disease"]
 
 # ----------------------------
-# Handle missing values (same as training)
+# Streaming accumulators
 # ----------------------------
-for col in X.columns:
-    if X[col].dtype == "object":
-        X[col] = X[col].fillna(X[col].mode()[0])
-    else:
-        X[col] = X[col].fillna(X[col].median())
+class Reservoir:
+    """Uniform fixed-size row sample of a stream (rows with the k smallest random keys)."""
 
-# ----------------------------
-# Encode categorical features
-# ----------------------------
-for col, le in feature_encoders.items():
-    X[col] = le.transform(X[col])
+    def __init__(self, size, seed=42):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.keys = np.empty(0)
+        self.rows = None
 
+    def add(self, df):
+        keys = self.rng.random(len(df))
+        if len(self.keys) >= self.size:
+            # only rows beating the current k-th key can enter
+            keep = keys < self.keys.max()
+            df, keys = df[keep], keys[keep]
+        rows = df if self.rows is None else pd.concat([self.rows, df], ignore_index=True)
+        keys = np.concatenate([self.keys, keys])
+        if len(keys) > self.size:
+            top = np.argpartition(keys, self.size - 1)[:self.size]
+            rows, keys = rows.iloc[top], keys[top]
+        self.rows, self.keys = rows.reset_index(drop=True), keys
 
-y_encoded = target_encoder.transform(y)
 
-# ----------------------------
-# 1️⃣ Confusion Matrix
-# ----------------------------
-y_pred = model.predict(X)
-
-cm = confusion_matrix(y_encoded, y_pred)
-
-plt.figure(figsize=(8, 6))
-sns.heatmap(
-    cm,
-    annot=True,
-    fmt="d",
-    cmap="Blues",
-    xticklabels=target_encoder.classes_,
-    yticklabels=target_encoder.classes_
-)
-plt.xlabel("Predicted Label")
-plt.ylabel("True Label")
-plt.title("Confusion Matrix for Disease Prediction Model")
-plt.tight_layout()
-plt.savefig("visuals/confusion_matrix.png", dpi=300)
-plt.close()
-
-print("✅ Confusion matrix saved.")
+def resolution(values, max_decimals=3):
+    """Rounding step of the data (1, 0.1, ...), or None for continuous values."""
+    values = values[~np.isnan(values)][:10_000]
+    for decimals in range(max_decimals + 1):
+        scaled = values * 10 ** decimals
+        if np.allclose(scaled, np.round(scaled)):
+            return 10.0 ** -decimals
+    return None
 
-# ----------------------------
-# 2️⃣ Feature Importance Plot
-# ----------------------------
-importances = model.feature_importances_
-feature_names = X.columns
 
-fi_df = pd.DataFrame({
-    "Feature": feature_names,
-    "Importance": importances
-}).sort_values(by="Importance", ascending=False)
+class Histogram:
+    """
+    Fixed-edge histogram; values outside the edges land in the outer bins.
+
+    For rounded data the bin width is a multiple of the rounding step and the
+    edges sit halfway between representable values, so bins don't alias.
+    """
+
+    def __init__(self, low, high, bins=HIST_BINS, step=None):
+        if high <= low:
+            high = low + 1.0
+        if step:
+            width = max(1, np.ceil((high - low) / bins / step)) * step
+            bins = int(np.floor((high - low) / width)) + 1
+            self.edges = low - step / 2 + width * np.arange(bins + 1)
+        else:
+            self.edges = np.linspace(low, high, bins + 1)
+        self.counts = np.zeros(bins, dtype=np.int64)
+
+    def add(self, values):
+        values = values[~np.isnan(values)]
+        idx = np.clip(np.searchsorted(self.edges, values, side="right") - 1, 0, len(self.counts) - 1)
+        self.counts += np.bincount(idx, minlength=len(self.counts))
+
+
+def evaluate(pipeline, path, chunk_size=ROW_GROUP_SIZE, sample_size=SAMPLE_SIZE):
+    """One pass over the dataset: confusion matrix, vital histograms and a row sample."""
+    model, preprocessor = pipeline["model"], pipeline["preprocessor"]
+    n_classes = len(preprocessor.classes_)
+    cm = np.zeros((n_classes, n_classes), dtype=np.int64)
+    ranges = column_ranges(path, VITALS)
+    histograms = {}
+    reservoir = Reservoir(sample_size)
+
+    for chunk in iter_dataset(path, batch_size=chunk_size):
+        y_true = preprocessor.encode_target(chunk[TARGET_COLUMN])
+        y_pred = model.predict(model_inputs(pipeline, chunk))
+        cm += np.bincount(y_true * n_classes + y_pred, minlength=n_classes * n_classes).reshape(cm.shape)
+
+        for col in VITALS:
+            values = chunk[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            if col not in histograms:
+                # CSV has no column statistics: the first chunk sets the edges
+                low, high = ranges[col] if ranges else (np.nanmin(values), np.nanmax(values))
+                histograms[col] = Histogram(float(low), float(high), step=resolution(values))
+            histograms[col].add(values)
+        reservoir.add(chunk)
+    return cm, histograms, reservoir.rows
+
 
-plt.figure(figsize=(8, 6))
-sns.barplot(x="Importance", y="Feature", data=fi_df)
-plt.title("Feature Importance for Disease Prediction")
-plt.tight_layout()
-plt.savefig("visuals/feature_importance.png", dpi=300)
-plt.close()
+def class_metrics(cm, classes):
+    """Per-class precision / recall / F1 / support from a confusion matrix."""
+    tp = np.diag(cm).astype(float)
+    support = cm.sum(axis=1)
+    predicted = cm.sum(axis=0)
+    precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+    recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+    denom = precision + recall
+    f1 = np.divide(2 * precision * recall, denom, out=np.zeros_like(tp), where=denom > 0)
+    return pd.DataFrame({
+        "Class": classes,
+        "Precision": precision,
+        "Recall": recall,
+        "F1_Score": f1,
+        "Support": support,
+    })
+
+
+def kde_curve(values, histogram):
+    """Gaussian KDE of a sample, scaled to the histogram's counts."""
+    from scipy.stats import gaussian_kde
+
+    values = values[~np.isnan(values)]
+    if len(values) < 2 or np.ptp(values) == 0:
+        return None
+    grid = np.linspace(histogram.edges[0], histogram.edges[-1], KDE_POINTS)
+    scale = histogram.counts.sum() * (histogram.edges[1] - histogram.edges[0])
+    return grid, gaussian_kde(values)(grid) * scale
 
-print("✅ Feature importance plot saved.")
 
 # ----------------------------
-# 3️⃣ Feature Distribution Plots
+# Figures (run in worker processes)
 # ----------------------------
-numerical_features = [
-    "Body_Temperature",
-    "Heart_Rate",
-    "WBC_Count",
-    "Sugar_Level"
-]
+def _pyplot():
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def render_confusion_matrix(cm, classes, path, dpi):
+    import seaborn as sns
+
+    plt = _pyplot()
+    plt.figure(figsize=(8, 6))
+    sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", xticklabels=classes, yticklabels=classes)
+    plt.xlabel("Predicted Label")
+    plt.ylabel("True Label")
+    plt.title("Confusion Matrix for Disease Prediction Model")
+    plt.tight_layout()
+    plt.savefig(path, dpi=dpi)
+    plt.close()
+    return path
+
+
+def render_feature_importance(fi_df, path, dpi):
+    import seaborn as sns
+
+    plt = _pyplot()
+    plt.figure(figsize=(8, 6))
+    sns.barplot(x="Importance", y="Feature", data=fi_df)
+    plt.title("Feature Importance for Disease Prediction")
+    plt.tight_layout()
+    plt.savefig(path, dpi=dpi)
+    plt.close()
+    return path
+
 
-plt.figure(figsize=(10, 8))
+def render_distributions(distributions, path, dpi):
+    plt = _pyplot()
+    plt.figure(figsize=(10, 8))
+    for i, (col, (edges, counts, kde)) in enumerate(distributions.items(), 1):
+        plt.subplot(2, 2, i)
+        plt.stairs(counts, edges, fill=True, alpha=0.6, color="#1f77b4", edgecolor="#1f77b4")
+        if kde is not None:
+            plt.plot(*kde, color="#1f77b4")
+        plt.xlabel(col)
+        plt.ylabel("Count")
+        plt.title(f"Distribution of {col}")
+    plt.tight_layout()
+    plt.savefig(path, dpi=dpi)
+    plt.close()
+    return path
 
-for i, col in enumerate(numerical_features, 1):
-    plt.subplot(2, 2, i)
-    sns.histplot(df[col], kde=True)
-    plt.title(f"Distribution of {col}")
 
-plt.tight_layout()
-plt.savefig("visuals/feature_distributions.png", dpi=300)
-plt.close()
+def _render(task):
+    fn, args = task
+    return fn(*args)
 
-print("✅ Feature distribution plots saved.")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Render evaluation plots for the current model.")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--output-dir", default="visuals")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--chunk-size", type=int, default=ROW_GROUP_SIZE, help="rows scored per chunk")
+    parser.add_argument("--sample-size", type=int, default=SAMPLE_SIZE,
+                        help="reservoir sample for KDE curves and permutation importance")
+    parser.add_argument("--jobs", type=int, default=3, help="worker processes rendering the figures")
+    return parser.parse_args()
 
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    # ----------------------------
+    # Load trained pipeline (model + preprocessing)
+    # ----------------------------
+    pipeline = load_current()
+    model = pipeline["model"]
+    preprocessor = pipeline["preprocessor"]
+    classes = list(preprocessor.classes_)
+
+    # ----------------------------
+    # Streaming evaluation
+    # ----------------------------
+    start = time.perf_counter()
+    cm, histograms, sample = evaluate(pipeline, args.data, args.chunk_size, args.sample_size)
+    metrics = class_metrics(cm, classes)
+    metrics.to_csv(os.path.join(args.output_dir, "evaluation_metrics.csv"), index=False)
+
+    print(metrics.round(4).to_string(index=False))
+    print(f"\nAccuracy: {np.trace(cm) / cm.sum():.4f}  "
+          f"Weighted F1: {np.average(metrics['F1_Score'], weights=metrics['Support']):.4f}")
+    print(f"✅ Evaluated {cm.sum()} rows in {time.perf_counter() - start:.2f}s")
+
+    # ----------------------------
+    # Feature importance
+    # ----------------------------
+    X_sample = model_inputs(pipeline, sample)
+    if hasattr(model, "feature_importances_"):
+        importances = model.feature_importances_
+    else:
+        # models without impurity importances (e.g. Hist Gradient Boosting): permutation importance on a sample
+        from sklearn.inspection import permutation_importance
+
+        rows = slice(0, PERMUTATION_ROWS)
+        importances = permutation_importance(
+            model, X_sample.iloc[rows], preprocessor.encode_target(sample[TARGET_COLUMN])[rows],
+            n_repeats=5, random_state=42,
+        ).importances_mean
+    fi_df = pd.DataFrame({
+        "Feature": X_sample.columns,
+        "Importance": importances
+    }).sort_values(by="Importance", ascending=False)
+
+    # ----------------------------
+    # Distributions: binned counts + KDE of the sample
+    # ----------------------------
+    distributions = {
+        col: (hist.edges, hist.counts, kde_curve(sample[col].to_numpy(dtype=np.float64, na_value=np.nan), hist))
+        for col, hist in histograms.items()
+    }
+
+    # ----------------------------
+    # Render the three figures in parallel
+    # ----------------------------
+    start = time.perf_counter()
+    out = lambda name: os.path.join(args.output_dir, name)
+    tasks = [
+        (render_confusion_matrix, (cm, classes, out("confusion_matrix.png"), args.dpi)),
+        (render_feature_importance, (fi_df, out("feature_importance.png"), args.dpi)),
+        (render_distributions, (distributions, out("feature_distributions.png"), args.dpi)),
+    ]
+    if args.jobs <= 1:
+        saved = [_render(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(tasks))) as executor:
+            saved = list(executor.map(_render, tasks))
+    for path in saved:
+        print(f"✅ Saved {path}")
+    print(f"✅ Figures rendered in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,37 @@
+# tests/test_prediction_server.py
+"""HTTP handling of malformed requests in src/prediction_server.py."""
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from prediction_server import PredictionServer  # noqa: E402
+
+
+async def _exchange(raw):
+    """Send raw request bytes to a fresh server; return (status, body) of the response."""
+    server = PredictionServer({"model_name": "test"})
+    listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    async with listener:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(raw)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout=5)
+        writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+
+def test_malformed_content_length_is_a_400():
+    status, body = asyncio.run(_exchange(b"POST /predict HTTP/1.1\r\nContent-Length: abc\r\n\r\n{}"))
+    assert status == 400
+    assert body == {"error": "invalid Content-Length"}
+
+
+def test_negative_content_length_is_a_400():
+    status, body = asyncio.run(_exchange(b"POST /predict HTTP/1.1\r\nContent-Length: -1\r\n\r\n"))
+    assert status == 400
+    assert body == {"error": "invalid Content-Length"}
@@ -0,0 +1,18 @@
+# tests/test_serving_imports.py
+"""The serving path must not import plotting libraries (see src/import_profile.py)."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from import_profile import SERVING_FORBIDDEN, SERVING_MODULES, check_serving  # noqa: E402
+
+
+def test_serving_modules_cover_app_scoring_imports():
+    for module in ["drift", "inference", "instrumentation", "model_registry", "prediction_cache",
+                   "rules", "ensemble", "flat_predictor"]:
+        assert module in SERVING_MODULES
+
+
+def test_serving_path_has_no_plotting_imports():
+    assert check_serving() == {}, f"serving modules import {SERVING_FORBIDDEN}"